@@ -0,0 +1,527 @@
+"""
+Long-lived in-process store of per-user answer vectors.
+
+The cache is warmed once from the database and then kept current, so enemy
+matching no longer rebuilds every user's answers from the answers table on
+each request.
+
+Vectors live in a dense slot-allocated int8 matrix (see AnswerMatrix), with
+an EnemyIndex over its rows so lookups can skip most candidates. Memory
+is bounded by answer_cache_max_users: when full, the least recently active
+user is evicted and is no longer a candidate until they are loaded again
+(which happens on their next answer or match request). Every change bumps
+`version`, so readers holding a snapshot can detect that it went stale.
+If anything goes wrong while patching, the cache is invalidated and the next
+reader performs a full resync from the database.
+
+Answers may be written by any process. Each answer write stamps the user
+with the next value of a global sequence (the "answers" row of
+cache_versions, bumped in the same transaction; bump_answers_version), so
+users.answers_version both versions a user's answers and orders every
+change. Before each read the cache compares the sequence with the value it
+has caught up to, one primary-key SELECT, and reloads just the users stamped
+since (catch_up); a deactivated question shows up the same way through the
+question catalog's version. The sequence row is bumped by every answer
+write, so those writes serialize on it until they commit; they are short
+transactions, and the single SQLite writer serializes them anyway.
+
+When the memory-mapped answer store is configured (see answer_store), the
+cache warms from it instead of the answers table, and the write hooks patch
+the store as well.
+
+Users loaded from the database also carry their answers_version stamp, read
+in the same query as their answers, so the stamp always describes exactly
+the vector held (see pair_scores). The store has no stamps: users warmed from
+it get theirs the first time stamps() asks.
+"""
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from app.answer_matrix import AnswerMatrix, pick_best, round_scores
+from app.answer_store import answer_store
+from app.enemy_index import EnemyIndex
+from app.projection_sketch import ProjectionSketch, approximate_best_enemy
+from app.config import settings
+from app.models import Answer, CacheVersion, Question, User
+from app.question_catalog import CATALOG, bump_version
+from typing import Dict, Optional, Tuple
+
+ANSWERS = "answers"
+
+# Beyond this many answer writes since the last catch-up, a full resync is cheaper
+CATCH_UP_LIMIT = 10_000
+
+users = User.__table__
+
+
+def bump_answers_version(db: Session, user_id: int):
+    """Stamp a user's answers with the next answer sequence value; call before committing the answers themselves"""
+    bump_version(db, ANSWERS)
+    # updated_at is set to itself so the answers don't count as a profile update
+    db.execute(
+        update(users)
+        .where(users.c.id == user_id)
+        .values(
+            answers_version=select(CacheVersion.version).where(CacheVersion.name == ANSWERS).scalar_subquery(),
+            updated_at=users.c.updated_at,
+        )
+    )
+
+
+def sequence_query() -> Select:
+    """Current answer sequence and question catalog versions"""
+    return select(CacheVersion.name, CacheVersion.version).where(CacheVersion.name.in_([ANSWERS, CATALOG]))
+
+
+def _active_answers() -> Select:
+    return (
+        select(Answer.user_id, Answer.question_id, Answer.answer_value, User.answers_version)
+        .join(User, User.id == Answer.user_id)
+        .join(Question, Question.id == Answer.question_id)
+        .where(Question.is_active == True)
+    )
+
+
+def user_answers_query(user_id: int) -> Select:
+    """One user's answers to active questions, with their answers_version"""
+    return _active_answers().where(Answer.user_id == user_id)
+
+
+def changed_answers_query(since: int) -> Select:
+    """Answers to active questions of every user stamped after `since`"""
+    # Changed users off ix_users_answers_version, then their answers by uq_user_question
+    changed = select(User.id).where(User.answers_version > since)
+    return _active_answers().where(Answer.user_id.in_(changed))
+
+
+def inactive_questions_query() -> Select:
+    return select(Question.id).where(Question.is_active == False)
+
+
+class AnswerCache:
+    """Slot-allocated users x questions answer vectors with LRU eviction"""
+
+    def __init__(self, max_users: int = 200_000, resync_interval: float = 0, index_bucket_size: int = 0):
+        self.max_users = max_users
+        self.resync_interval = resync_interval
+        self.index_bucket_size = index_bucket_size
+        self.version = 0
+        self.epoch = 0  # Bumped whenever every score may have moved (resyncs, deactivated questions)
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._values = np.zeros((0, 0), dtype=np.int8)
+        self._mask = np.zeros((0, 0), dtype=bool)
+        self._slot_user_ids = np.zeros(0, dtype=np.int64)
+        self._rows: "OrderedDict[int, int]" = OrderedDict()  # user_id -> row, least recently active first
+        self._stamps: Dict[int, int] = {}  # user_id -> answers_version of the vector held, when known
+        self._free_rows = []
+        self._size = 0
+        self._columns: Dict[int, int] = {}  # question_id -> column
+        self._question_ids = np.zeros(0, dtype=np.int64)
+        self._inactive_questions = set()
+        self._snapshot: Optional[Tuple[int, AnswerMatrix]] = None
+        self._index: Optional[EnemyIndex] = None
+        self._sketch: Optional[ProjectionSketch] = None
+        self._warm = False
+        self._synced_at = 0.0
+        self._sequence = (0, 0)  # (answers, catalog) versions the cache has caught up to
+
+    # Loading
+
+    def resync(self, db: Session):
+        """Throw everything away and reload from the answer store, or else the database"""
+        # Read before the data, so a write landing in between is caught up on afterwards
+        sequence = self._read_sequence(db)
+        if answer_store is not None and self._resync_from_store(db, sequence):
+            return
+        recent_users = (
+            db.query(Answer.user_id)
+            .group_by(Answer.user_id)
+            .order_by(func.max(func.coalesce(Answer.updated_at, Answer.answered_at)).desc())
+            .limit(self.max_users)
+            .subquery()
+        )
+        rows = (
+            db.query(Answer.user_id, Answer.question_id, Answer.answer_value, User.answers_version)
+            .join(recent_users, recent_users.c.user_id == Answer.user_id)
+            .join(User, User.id == Answer.user_id)
+            .join(Question, Question.id == Answer.question_id)
+            .filter(Question.is_active == True)
+            .all()
+        )
+        inactive = db.scalars(inactive_questions_query()).all()
+
+        with self.lock:
+            self._reset()
+            self._sequence = sequence
+            self._inactive_questions.update(inactive)
+            by_user: Dict[int, Dict[int, int]] = {}
+            for user_id, question_id, answer_value, stamp in rows:
+                by_user.setdefault(user_id, {})[question_id] = answer_value
+                self._stamps[user_id] = stamp
+            for user_id, answers in by_user.items():
+                self._store(user_id, answers)
+            self._build_index()
+            self._warm = True
+            self._synced_at = time.monotonic()
+            self.version += 1
+            self.epoch += 1
+        print(f"Answer cache synced: {len(by_user)} users")
+
+    warm = resync
+
+    def _resync_from_store(self, db: Session, sequence: Tuple[int, int]) -> bool:
+        """
+        Copy every user with answers out of the answer store in one vectorized
+        pass. The store keeps no activity times, so beyond max_users the newest
+        accounts (highest ids) are kept. False if the store can't be used.
+        """
+        # Stamps before the store's catch-up: every version read here is then in the
+        # store (or something newer is, which only costs a pair score cache miss)
+        stamps = dict(db.execute(select(users.c.id, users.c.answers_version).where(users.c.answers_version > 0)).all())
+        if not answer_store.catch_up(db):
+            return False
+        store = answer_store.matrix()
+        if store is None:
+            return False
+        inactive = db.scalars(inactive_questions_query()).all()
+        answered = np.flatnonzero((store.values != 0).any(axis=1))[-self.max_users:]
+        columns = len(store.question_ids)
+
+        with self.lock:
+            self._reset()
+            self._sequence = sequence
+            self._inactive_questions.update(inactive)
+            self._grow(max(64, len(answered)), max(8, columns))
+            self._values[:len(answered), :columns] = store.values[answered]
+            self._mask[:len(answered), :columns] = self._values[:len(answered), :columns] != 0
+            self._slot_user_ids[:len(answered)] = answered
+            self._rows.update((int(user_id), row) for row, user_id in enumerate(answered))
+            self._stamps.update((user_id, stamps[user_id]) for user_id in self._rows if user_id in stamps)
+            self._size = len(answered)
+            self._question_ids = np.array(store.question_ids, dtype=np.int64)
+            self._columns = {int(question_id): column for column, question_id in enumerate(self._question_ids)}
+            self._build_index()
+            self._warm = True
+            self._synced_at = time.monotonic()
+            self.version += 1
+            self.epoch += 1
+        print(f"Answer cache synced from the answer store: {len(answered)} users")
+        return True
+
+    def invalidate(self):
+        """Force a full resync on the next read"""
+        with self.lock:
+            self._warm = False
+            self.version += 1
+
+    def ensure_fresh(self, db: Session):
+        """
+        Warm the cache on first use, after invalidation or when the resync
+        interval elapsed; otherwise catch up on changes made by any process
+        """
+        expired = self.resync_interval and time.monotonic() - self._synced_at > self.resync_interval
+        if not self._warm or expired:
+            self.resync(db)
+        else:
+            self.catch_up(db)
+
+    def catch_up(self, db: Session):
+        """Reload the users whose answers changed, and drop the questions deactivated, since the last check"""
+        answers, catalog = sequence = self._read_sequence(db)
+        seen_answers, seen_catalog = self._sequence
+        if sequence == self._sequence:
+            return
+        if answers - seen_answers > CATCH_UP_LIMIT:
+            self.resync(db)
+            return
+        inactive = db.scalars(inactive_questions_query()).all() if catalog != seen_catalog else []
+        rows = db.execute(changed_answers_query(seen_answers)).all() if answers != seen_answers else []
+
+        by_user: Dict[int, Dict[int, int]] = {}
+        stamps: Dict[int, int] = {}
+        for user_id, question_id, answer_value, stamp in rows:
+            by_user.setdefault(user_id, {})[question_id] = answer_value
+            stamps[user_id] = stamp
+        with self.lock:
+            for question_id in set(inactive) - self._inactive_questions:
+                self._drop_question(question_id)
+            for user_id, user_answers in by_user.items():
+                if self._stamps.get(user_id, -1) > stamps[user_id]:
+                    continue  # A concurrent catch-up already loaded a newer vector
+                self._replace(user_id, user_answers, stamps[user_id])
+            self._sequence = (max(answers, self._sequence[0]), max(catalog, self._sequence[1]))
+            self.version += 1
+
+    def load_user(self, db: Session, user_id: int) -> bool:
+        """Load (or reload) one user's vector and stamp from the database; False if they have no answers"""
+        rows = db.execute(user_answers_query(user_id)).all()
+        with self.lock:
+            if rows:
+                self._replace(user_id, {question_id: answer_value for _, question_id, answer_value, _ in rows}, rows[0][3])
+            else:
+                self._remove(user_id)
+            self.version += 1
+        return bool(rows)
+
+    # Write hooks used by the routers (call after the transaction commits); other processes catch up on their own
+
+    def update_answers(self, db: Session, user_id: int, answers: Dict[int, int]):
+        """Patch the answer store with new answer values and reload the user's vector"""
+        if answer_store is not None:
+            answer_store.patch(user_id, answers)
+        if not self._warm:
+            return
+        try:
+            # A patch would leave the stamp unknown (another process may have written too), so reload
+            self.load_user(db, user_id)
+        except Exception as e:
+            print(f"Answer cache update failed, scheduling resync: {e}")
+            self.invalidate()
+
+    def deactivate_question(self, question_id: int):
+        """Stop counting a question in every cached vector (and in the answer store)"""
+        if answer_store is not None:
+            answer_store.deactivate_question(question_id)
+        with self.lock:
+            self._drop_question(question_id)
+            self.version += 1
+
+    # Reading
+
+    def matrix(self) -> AnswerMatrix:
+        """
+        Live, zero-copy view of the cached vectors.
+        Rows are in slot order and free slots have an empty mask, so callers
+        must hold `lock` while scoring against it.
+        """
+        return AnswerMatrix(
+            self._slot_user_ids[:self._size],
+            self._question_ids,
+            self._values[:self._size, :len(self._question_ids)],
+            self._mask[:self._size, :len(self._question_ids)],
+            row_index=self._rows,
+        )
+
+    def snapshot(self) -> Tuple[int, AnswerMatrix]:
+        """Compact copy ordered by user id, tagged with the version it was taken at"""
+        with self.lock:
+            if self._snapshot is None or self._snapshot[0] != self.version:
+                occupied = np.fromiter(self._rows.values(), dtype=np.int64, count=len(self._rows))
+                rows = occupied[np.argsort(self._slot_user_ids[occupied])]
+                columns = len(self._question_ids)
+                self._snapshot = (self.version, AnswerMatrix(
+                    self._slot_user_ids[rows],
+                    self._question_ids.copy(),
+                    self._values[rows, :columns],
+                    self._mask[rows, :columns],
+                ))
+            return self._snapshot
+
+    def best_enemy(self, db: Session, user_id: int) -> Optional[Tuple[int, float]]:
+        """Best enemy for a user, loading them first if they were evicted"""
+        return self.stamped_best_enemy(db, user_id)[0]
+
+    def stamped_best_enemy(self, db: Session, user_id: int) -> Tuple[Optional[Tuple[int, float]], Tuple[Optional[int], Optional[int]]]:
+        """best_enemy, with the stamps of the user's and the enemy's vectors it was computed from"""
+        self.ensure_fresh(db)
+        with self.lock:
+            if user_id not in self._rows and not self.load_user(db, user_id):
+                return None, (None, None)
+            self._touch(user_id)
+            if self._index is None:
+                enemy = self.matrix().best_enemy(user_id)
+            else:
+                if self._index.stale:
+                    self._build_index()
+                enemy = self._index.best_enemy(self.matrix(), user_id)
+            return enemy, (self._stamps.get(user_id), None if enemy is None else self._stamps.get(enemy[0]))
+
+    def best_among(self, db: Session, user_id: int, candidate_ids) -> Optional[Tuple[int, float]]:
+        """Best enemy for a user among the given users (those the cache holds)"""
+        self.ensure_fresh(db)
+        with self.lock:
+            if user_id not in self._rows and not self.load_user(db, user_id):
+                return None
+            rows = [self._rows[candidate_id] for candidate_id in candidate_ids if candidate_id in self._rows]
+            candidate_ids, scores = self.matrix().scores(user_id, rows=np.array(rows, dtype=np.int64))
+            return pick_best(candidate_ids, scores)
+
+    def approximate_best_enemy(self, db: Session, user_id: int, candidates: int) -> Optional[Tuple[int, float]]:
+        """
+        Very probably the best enemy: only a short list of about `candidates`
+        users is scored (see projection_sketch.approximate_best_enemy).
+        """
+        self.ensure_fresh(db)
+        with self.lock:
+            if user_id not in self._rows and not self.load_user(db, user_id):
+                return None
+            self._touch(user_id)
+            matrix = self.matrix()
+            if self._sketch is None or self._sketch.stale:
+                self._sketch = ProjectionSketch.build(matrix)
+            return approximate_best_enemy(matrix, user_id, candidates, self._sketch, self._index)
+
+    def scores_reaching(self, db: Session, user_id: int, minimum_hundredths: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (user_ids, hundredths) of every cached user whose rounded score against
+        user_id is at least minimum_hundredths, skipping buckets that can't reach it
+        """
+        self.ensure_fresh(db)
+        with self.lock:
+            if user_id not in self._rows and not self.load_user(db, user_id):
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+            matrix = self.matrix()
+            rows = None
+            if self._index is not None:
+                if self._index.stale:
+                    self._build_index()
+                rows = self._index.rows_reaching(matrix, user_id, minimum_hundredths)
+            candidate_ids, scores = matrix.scores(user_id, rows=rows)
+            hundredths = round_scores(scores)
+            reaching = hundredths >= minimum_hundredths
+            return candidate_ids[reaching], hundredths[reaching]
+
+    def pair_score(self, db: Session, user1_id: int, user2_id: int) -> float:
+        """Rounded score between two users, loading either of them if evicted"""
+        return self.stamped_pair_score(db, user1_id, user2_id)[0]
+
+    def stamped_pair_score(self, db: Session, user1_id: int, user2_id: int) -> Tuple[float, Tuple[Optional[int], Optional[int]]]:
+        """pair_score, with the stamps of the two vectors it was computed from"""
+        self.ensure_fresh(db)
+        with self.lock:
+            for user_id in (user1_id, user2_id):
+                if user_id not in self._rows or user_id not in self._stamps:
+                    self.load_user(db, user_id)
+            return self.matrix().pair_score(user1_id, user2_id), (self._stamps.get(user1_id), self._stamps.get(user2_id))
+
+    def stamps(self, db: Session, *user_ids: int) -> Tuple[Optional[int], ...]:
+        """
+        answers_version of each user's cached vector, loading (or reloading)
+        users whose stamp isn't known; None for users without answers
+        """
+        self.ensure_fresh(db)
+        with self.lock:
+            for user_id in user_ids:
+                if user_id not in self._rows or user_id not in self._stamps:
+                    self.load_user(db, user_id)
+            return tuple(self._stamps.get(user_id) for user_id in user_ids)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # Internals (callers hold the lock, except for _read_sequence)
+
+    @staticmethod
+    def _read_sequence(db: Session) -> Tuple[int, int]:
+        versions = dict(db.execute(sequence_query()).all())
+        return versions.get(ANSWERS, 0), versions.get(CATALOG, 0)
+
+    def _replace(self, user_id: int, answers: Dict[int, int], stamp: int):
+        self._remove(user_id)
+        self._store(user_id, answers)
+        if user_id in self._rows:
+            self._stamps[user_id] = stamp
+
+    def _drop_question(self, question_id: int):
+        self._inactive_questions.add(question_id)
+        column = self._columns.get(question_id)
+        if column is not None:
+            self._values[:, column] = 0
+            self._mask[:, column] = False
+            if self._index is not None:
+                self._index.drop_column(column)
+            self._sketch = None
+        self.epoch += 1
+
+    def _build_index(self):
+        if self.index_bucket_size > 0:
+            self._index = EnemyIndex.build(self.matrix(), bucket_size=self.index_bucket_size)
+
+    def _touch(self, user_id: int):
+        self._rows.move_to_end(user_id)
+
+    def _column(self, question_id: int) -> int:
+        column = self._columns.get(question_id)
+        if column is None:
+            column = len(self._question_ids)
+            if column >= self._values.shape[1]:
+                self._grow(self._values.shape[0], max(8, column * 2))
+            self._columns[question_id] = column
+            self._question_ids = np.append(self._question_ids, question_id)
+        return column
+
+    def _row(self, user_id: int) -> int:
+        row = self._rows.get(user_id)
+        if row is not None:
+            self._touch(user_id)
+            return row
+        if len(self._rows) >= self.max_users:
+            evicted, evicted_row = self._rows.popitem(last=False)
+            self._stamps.pop(evicted, None)
+            self._remove_row(evicted_row)
+        if self._free_rows:
+            row = self._free_rows.pop()
+        else:
+            row = self._size
+            if row >= self._values.shape[0]:
+                self._grow(max(64, row * 2), self._values.shape[1])
+            self._size += 1
+        self._rows[user_id] = row
+        self._slot_user_ids[row] = user_id
+        return row
+
+    def _store(self, user_id: int, answers: Dict[int, int]):
+        answers = {q: v for q, v in answers.items() if q not in self._inactive_questions}
+        if not answers and user_id not in self._rows:
+            return
+        columns = [self._column(question_id) for question_id in answers]
+        row = self._row(user_id)
+        self._values[row, columns] = list(answers.values())
+        self._mask[row, columns] = True
+        if self._index is not None:
+            self._index.upsert(self.matrix(), row)
+        if self._sketch is not None:
+            self._sketch.touch(row)
+
+    def _remove(self, user_id: int):
+        self._stamps.pop(user_id, None)
+        row = self._rows.pop(user_id, None)
+        if row is not None:
+            self._remove_row(row)
+
+    def _remove_row(self, row: int):
+        if self._index is not None:
+            self._index.remove(row)
+        if self._sketch is not None:
+            self._sketch.touch(row)
+        self._values[row] = 0
+        self._mask[row] = False
+        self._slot_user_ids[row] = -1
+        self._free_rows.append(row)
+
+    def _grow(self, rows: int, columns: int):
+        values = np.zeros((rows, columns), dtype=np.int8)
+        mask = np.zeros((rows, columns), dtype=bool)
+        old_rows, old_columns = self._values.shape
+        values[:old_rows, :old_columns] = self._values
+        mask[:old_rows, :old_columns] = self._mask
+        slot_user_ids = np.full(rows, -1, dtype=np.int64)
+        slot_user_ids[:len(self._slot_user_ids)] = self._slot_user_ids
+        self._values, self._mask, self._slot_user_ids = values, mask, slot_user_ids
+
+
+answer_cache = AnswerCache(
+    max_users=settings.answer_cache_max_users,
+    resync_interval=settings.answer_cache_resync_seconds,
+    index_bucket_size=settings.matching_index_bucket_size,
+)
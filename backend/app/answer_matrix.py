@@ -0,0 +1,207 @@
+"""
+Dense users x questions answer matrix used by the enemy matching engine.
+
+Answers are stored as an int8 matrix with a boolean mask marking which cells
+were actually answered, so a user can be scored against every candidate in a
+single vectorized pass instead of one query and Python loop per candidate.
+Answers are 1-10, so a matrix may also leave the mask out and mark unanswered
+cells with 0 (how the memory-mapped answer store keeps them); the mask is
+then derived on first use.
+"""
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app.models import Answer, Question
+from typing import Iterable, Mapping, Optional, Sequence, Tuple
+
+# Largest possible per-question difference on the 1-10 answer scale
+MAX_DIFFERENCE = 9.0
+
+
+def round_score(score: float) -> float:
+    """Round a raw score the same way the original matching code did"""
+    return round(float(score), 2)
+
+
+def normalize_scores(total_difference: np.ndarray, common_count: np.ndarray) -> np.ndarray:
+    """
+    Turn summed differences into 0-100 scores (unrounded).
+    Uses the same operation order as the scalar implementation so results are
+    bit-for-bit identical before rounding.
+    """
+    average_difference = total_difference / common_count
+    return (average_difference / MAX_DIFFERENCE) * 100
+
+
+def round_scores(scores: np.ndarray) -> np.ndarray:
+    """
+    Vectorized equivalent of round(score, 2), returned as integer hundredths.
+    np.rint(x * 100) only disagrees with Python's round() when x * 100 sits
+    within float error of a .5 boundary, so those rare cells are redone exactly.
+    """
+    scaled = scores * 100
+    hundredths = np.rint(scaled)
+    suspect = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-9)
+    for index in suspect:
+        hundredths.flat[index] = np.rint(round_score(scores.flat[index]) * 100)
+    return hundredths.astype(np.int64)
+
+
+def pick_best(candidate_ids: np.ndarray, scores: np.ndarray) -> Optional[Tuple[int, float]]:
+    """
+    Pick the best enemy from unrounded candidate scores.
+    Ties are decided on the rounded score and go to the lowest user id, which
+    matches the original "score > best_score" loop over users ordered by id.
+    """
+    if len(scores) == 0:
+        return None
+
+    hundredths = round_scores(scores)
+    tied = np.flatnonzero(hundredths == hundredths.max())
+    best_index = tied[np.argmin(candidate_ids[tied])]
+    return (int(candidate_ids[best_index]), int(hundredths[best_index]) / 100)
+
+
+class IdentityRows:
+    """Row index of a grid whose row number is the user id"""
+
+    def __init__(self, rows: int):
+        self.rows = rows
+
+    def get(self, user_id: int, default=None):
+        return user_id if 0 <= user_id < self.rows else default
+
+
+class AnswerMatrix:
+    """Answers of many users packed as rows of a dense int8 matrix"""
+
+    def __init__(
+        self,
+        user_ids: np.ndarray,
+        question_ids: np.ndarray,
+        values: np.ndarray,
+        mask: Optional[np.ndarray],
+        row_index: Optional[Mapping[int, int]] = None,
+    ):
+        self.user_ids = user_ids
+        self.question_ids = question_ids
+        self.values = values
+        self.derived_mask = mask is None  # Unanswered cells are 0 in values
+        self._mask = mask
+        self.reopen = None  # (function, args) mapping the same values again in another process
+        if row_index is None:
+            row_index = {int(user_id): row for row, user_id in enumerate(user_ids)}
+        self._row_index = row_index
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence[int]]) -> "AnswerMatrix":
+        """Build a matrix from (user_id, question_id, answer_value) tuples"""
+        data = np.array(list(rows), dtype=np.int64).reshape(-1, 3)
+
+        user_ids, user_rows = np.unique(data[:, 0], return_inverse=True)
+        question_ids, question_cols = np.unique(data[:, 1], return_inverse=True)
+
+        values = np.zeros((len(user_ids), len(question_ids)), dtype=np.int8)
+        mask = np.zeros((len(user_ids), len(question_ids)), dtype=bool)
+        values[user_rows, question_cols] = data[:, 2]
+        mask[user_rows, question_cols] = True
+
+        return cls(user_ids, question_ids, values, mask)
+
+    @classmethod
+    def from_db(cls, db: Session, user_ids: Optional[Iterable[int]] = None, chunk_size: int = 100_000) -> "AnswerMatrix":
+        """
+        Load answers to active questions from the database, streamed chunk by
+        chunk into a preallocated int8 grid, so memory stays at one byte per
+        cell however many answers there are. Like the answer store, row =
+        user id and unanswered cells are 0; rows without answers never score.
+        """
+        answers = select(Answer.user_id, Answer.question_id, Answer.answer_value).join(
+            Question, Question.id == Answer.question_id
+        ).where(Question.is_active == True)
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            answers = answers.where(Answer.user_id.in_(user_ids))
+
+        # Shape first; answers by users or to questions that appear after these reads are left out
+        question_ids = np.array(
+            db.scalars(select(Question.id).where(Question.is_active == True).order_by(Question.id)).all(), dtype=np.int64
+        )
+        if user_ids is None:
+            rows = (db.scalar(select(func.max(Answer.user_id))) or 0) + 1
+        else:
+            rows = max(user_ids, default=0) + 1
+        lookup = np.full(int(question_ids.max(initial=0)) + 1, -1, dtype=np.int64)
+        lookup[question_ids] = np.arange(len(question_ids))
+
+        values = np.zeros((rows, len(question_ids)), dtype=np.int8)
+        for chunk in db.execute(answers.execution_options(yield_per=chunk_size)).partitions():
+            data = np.array(chunk, dtype=np.int64).reshape(-1, 3)
+            data = data[(data[:, 0] < rows) & (data[:, 1] < len(lookup))]
+            data = data[lookup[data[:, 1]] >= 0]
+            values[data[:, 0], lookup[data[:, 1]]] = data[:, 2]
+        return cls(np.arange(rows), question_ids, values, None, row_index=IdentityRows(rows))
+
+    @property
+    def mask(self) -> np.ndarray:
+        if self._mask is None:
+            self._mask = self.values != 0
+        return self._mask
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def row(self, user_id: int) -> Optional[int]:
+        """Row index of a user, or None if the user has no answers"""
+        return self._row_index.get(int(user_id))
+
+    def scores(self, user_id: int, rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score a user against every other user (or only the given rows).
+        Returns (candidate_ids, unrounded_scores) for candidates sharing at
+        least one answered question.
+        """
+        target = self.row(user_id)
+        if target is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        # Only the columns the target answered can contribute to any score
+        columns = np.flatnonzero(self.mask[target])
+        target_values = self.values[target, columns]
+
+        if rows is None:
+            rows = np.arange(len(self.user_ids))
+        candidate_values = self.values[np.ix_(rows, columns)]
+        candidate_mask = self.mask[np.ix_(rows, columns)]
+
+        differences = np.abs(candidate_values - target_values)
+        total_difference = np.where(candidate_mask, differences, 0).sum(axis=1, dtype=np.int64)
+        common_count = candidate_mask.sum(axis=1, dtype=np.int64)
+
+        keep = (common_count > 0) & (rows != target)
+        return self.user_ids[rows[keep]], normalize_scores(total_difference[keep], common_count[keep])
+
+    def best_enemy(self, user_id: int) -> Optional[Tuple[int, float]]:
+        """Return (enemy_id, match_score) for the most incompatible user"""
+        candidate_ids, scores = self.scores(user_id)
+        return pick_best(candidate_ids, scores)
+
+    def pair_hundredths(self, rows1: np.ndarray, rows2: np.ndarray) -> np.ndarray:
+        """Rounded scores x 100 between matching rows of two arrays, -1 where they share no question"""
+        common = self.mask[rows1] & self.mask[rows2]
+        differences = np.abs(self.values[rows1].astype(np.int16) - self.values[rows2])
+        total_difference = np.where(common, differences, 0).sum(axis=1, dtype=np.int64)
+        common_count = common.sum(axis=1, dtype=np.int64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = normalize_scores(total_difference, common_count)
+        return np.where(common_count > 0, round_scores(np.where(common_count > 0, scores, 0.0)), -1)
+
+    def pair_score(self, user1_id: int, user2_id: int) -> float:
+        """Rounded 0-100 score between two users, 0.0 if they share no questions"""
+        row = self.row(user2_id)
+        if row is None or self.row(user1_id) is None:
+            return 0.0
+        _, scores = self.scores(user1_id, rows=np.array([row]))
+        if len(scores) == 0:
+            return 0.0
+        return round_score(scores[0])
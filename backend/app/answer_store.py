@@ -0,0 +1,318 @@
+"""
+Memory-mapped answer vectors, shared by every process on the host.
+
+Matching only needs one small integer per (user, question), so the store
+keeps exactly that: a file holding an int8 grid with one row per user id
+(row = user id, so no lookup table) and one byte per question column, 0
+meaning unanswered. Processes map the file instead of loading answers from
+the database, so they all read the same pages from the OS cache and
+AnswerStore.matrix() hands the grid to the scoring code without a copy.
+
+Layout: a page-aligned header of int64 words followed by the grid.
+    0 magic   1 header bytes   2 rows (allocated)   3 column capacity
+    4 columns used   5 stale   6 users (highest user id written + 1)
+    7 layout version (bumped on any change above)
+    8 answer sequence the grid is known to be complete through
+    9.. question id per column (negated once the question is deactivated)
+
+rebuild() writes a fresh file from the database in one streaming pass and
+swaps it in atomically; readers notice the new inode and remap. Answer
+writes are patched in place after they commit (single-byte stores, safe
+without a lock); growing the grid or claiming a column for a new question
+takes an flock on the file. When something can't be patched (no free column
+left, a failed write) the header is flagged stale and readers fall back to
+the database until the next rebuild.
+
+A patch can still go missing without anyone noticing: the writing process
+may die between its commit and its patch. So the store also records the
+answer sequence (see answer_cache) it is known to be complete through, and
+catch_up() patches in every change committed after it, from the database,
+before moving it forward. Everything that reads the whole store (the answer
+cache's warm-up, the monthly run, rebuild() itself for answers written
+during its pass) catches it up first.
+"""
+import fcntl
+import os
+import threading
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app.answer_matrix import AnswerMatrix, IdentityRows
+from app.config import settings
+from app.models import Answer, Question, User
+from app.question_catalog import current_version
+from typing import Dict, Optional
+
+MAGIC = int.from_bytes(b"NEMSTOR2", "little")
+PAGE = 4096
+HEADER_FIELDS = 9
+MAGIC_WORD, HEADER_BYTES, ROWS, CAPACITY, COLUMNS, STALE, USERS, LAYOUT, SEQUENCE = range(9)
+
+
+def header_bytes(capacity: int) -> int:
+    return -(-8 * (HEADER_FIELDS + capacity) // PAGE) * PAGE
+
+
+def open_values(path: str, offset: int, rows: int, capacity: int, columns: int) -> np.ndarray:
+    """Read-only (rows, columns) view of a store file's grid; used by scoring workers to share it"""
+    grid = np.memmap(path, dtype=np.int8, mode="r", offset=offset, shape=(rows, capacity))
+    return grid[:, :columns]
+
+
+class AnswerStore:
+    """Users x questions int8 grid in a memory-mapped file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._inode: Optional[int] = None
+        self._header: Optional[np.ndarray] = None
+        self._grid: Optional[np.ndarray] = None
+        self._layout = 0
+        self._columns: Dict[int, int] = {}  # question_id -> column, active questions only
+
+    # Building
+
+    def rebuild(self, db: Session, chunk_size: int = 100_000) -> int:
+        """Rewrite the file from the database (active questions only) and catch it up; returns the answers written"""
+        written = self._write(db, chunk_size)
+        self.catch_up(db)
+        return written
+
+    def _write(self, db: Session, chunk_size: int = 100_000) -> int:
+        """The streaming pass of rebuild(), without the catch-up on answers written during it"""
+        from app.answer_cache import ANSWERS
+
+        # Read before the pass: answers written during it are caught up on afterwards
+        sequence = current_version(db, ANSWERS)
+        question_ids = [question_id for (question_id,) in db.query(Question.id).filter(Question.is_active == True).order_by(Question.id)]
+        capacity = max(64, 2 * len(question_ids))
+        max_user_id = db.query(func.max(User.id)).scalar() or 0
+        rows = max_user_id + 1 + max(1024, max_user_id // 4)  # Headroom for signups before the file must grow
+
+        lookup = np.full(max(question_ids, default=0) + 1, -1, dtype=np.int64)
+        lookup[question_ids] = np.arange(len(question_ids))
+
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        offset = header_bytes(capacity)
+        with open(temporary, "wb") as new_file:
+            new_file.truncate(offset + rows * capacity)
+        header = np.memmap(temporary, dtype=np.int64, mode="r+", shape=(offset // 8,))
+        header[:HEADER_FIELDS] = [MAGIC, offset, rows, capacity, len(question_ids), 0, max_user_id + 1, 0, sequence]
+        header[HEADER_FIELDS:HEADER_FIELDS + len(question_ids)] = question_ids
+        grid = np.memmap(temporary, dtype=np.int8, mode="r+", offset=offset, shape=(rows, capacity))
+
+        written = 0
+        answers = db.execute(
+            select(Answer.user_id, Answer.question_id, Answer.answer_value)
+            .join(Question, Question.id == Answer.question_id)
+            .filter(Question.is_active == True)
+            .execution_options(yield_per=chunk_size)
+        )
+        for chunk in answers.partitions():
+            data = np.array(chunk, dtype=np.int64).reshape(-1, 3)
+            # Users and questions created after the reads above are patched in later
+            data = data[(data[:, 0] < rows) & (data[:, 1] < len(lookup))]
+            data = data[lookup[data[:, 1]] >= 0]
+            grid[data[:, 0], lookup[data[:, 1]]] = data[:, 2]
+            written += len(data)
+
+        grid.flush()
+        header.flush()
+        del grid, header
+        os.replace(temporary, self.path)
+        with self._lock:
+            self._inode = None  # Remap on next use
+        return written
+
+    def ensure_built(self, db: Session):
+        """Rebuild when the file is missing or flagged stale, then catch it up"""
+        if not self.usable():
+            print("Answer store missing or stale, rebuilding")
+            with self._file_lock():
+                if not self.usable():
+                    self._write(db)
+        # Outside the file lock, which patches that grow the grid take
+        self.catch_up(db)
+
+    def catch_up(self, db: Session, chunk_size: int = 100_000) -> bool:
+        """
+        Patch in every answer change committed after the store's sequence and
+        move the sequence forward; False if the store can't be used
+        """
+        from app.answer_cache import ANSWERS, changed_answers_query
+
+        with self._lock:
+            if not self._refresh() or self._header[STALE]:
+                return False
+            seen = int(self._header[SEQUENCE])
+        sequence = current_version(db, ANSWERS)
+        if sequence <= seen:
+            return True
+        # One catch-up at a time across processes, so an older one can't patch in values a newer one already replaced
+        with _FileLock(f"{self.path}.catch-up"):
+            with self._lock:
+                if not self._refresh():
+                    return False
+                seen = int(self._header[SEQUENCE])
+            if sequence <= seen:
+                return True
+            # Read after the sequence, so the rows are at least as new as it
+            rows = db.execute(changed_answers_query(seen).execution_options(yield_per=chunk_size))
+            for chunk in rows.partitions():
+                by_user: Dict[int, Dict[int, int]] = {}
+                for user_id, question_id, answer_value, _ in chunk:
+                    by_user.setdefault(user_id, {})[question_id] = answer_value
+                for user_id, answers in by_user.items():
+                    self.patch(user_id, answers)
+            with self._lock:
+                if not self._refresh() or self._header[STALE]:
+                    return False
+                self._header[SEQUENCE] = max(int(self._header[SEQUENCE]), sequence)
+        return True
+
+    # Reading
+
+    def usable(self) -> bool:
+        with self._lock:
+            return self._refresh() and not self._header[STALE]
+
+    def matrix(self) -> Optional[AnswerMatrix]:
+        """
+        Zero-copy view of every user's row, or None when the store can't be
+        used. Rows are user ids (rows without answers simply never score), and
+        the mask is derived from nonzero cells.
+        """
+        with self._lock:
+            if not self._refresh() or self._header[STALE]:
+                return None
+            header, grid = self._header, self._grid
+        rows, columns = int(header[USERS]), int(header[COLUMNS])
+        values = grid[:rows, :columns]
+        matrix = AnswerMatrix(
+            np.arange(rows),
+            np.abs(header[HEADER_FIELDS:HEADER_FIELDS + columns]),
+            values,
+            None,
+            row_index=IdentityRows(rows),
+        )
+        # Lets pool workers map the file themselves rather than receive a pickled copy
+        matrix.reopen = (open_values, (self.path, int(header[HEADER_BYTES]), rows, int(header[CAPACITY]), columns))
+        return matrix
+
+    def user_answers(self, user_id: int) -> Optional[Dict[int, int]]:
+        """{question_id: value} for active questions, or None when the store can't be used"""
+        with self._lock:
+            if not self._refresh() or self._header[STALE]:
+                return None
+            if user_id >= self._grid.shape[0]:
+                return {}
+            row = np.asarray(self._grid[user_id])
+            return {question_id: int(row[column]) for question_id, column in self._columns.items() if row[column]}
+
+    # Patching
+
+    def patch(self, user_id: int, answers: Dict[int, int]):
+        """Write a user's new answer values in place"""
+        try:
+            with self._lock:
+                if not self._refresh():
+                    return
+                missing = [question_id for question_id in answers if question_id not in self._columns]
+                if user_id >= self._header[USERS] or missing:
+                    self._grow(user_id, missing)
+                for question_id, value in answers.items():
+                    column = self._columns.get(question_id)
+                    if column is not None:
+                        self._grid[user_id, column] = value
+        except Exception as e:
+            print(f"Answer store patch failed, marking stale: {e}")
+            self.mark_stale()
+
+    def deactivate_question(self, question_id: int):
+        """Drop a question from every vector (and from future patches)"""
+        with self._lock, self._file_lock():
+            if not self._refresh():
+                return
+            column = self._columns.pop(question_id, None)
+            if column is None:
+                return
+            self._header[HEADER_FIELDS + column] = -question_id
+            self._header[LAYOUT] += 1
+            self._layout += 1
+            self._grid[:, column] = 0
+
+    def mark_stale(self):
+        with self._lock:
+            if self._refresh():
+                self._header[STALE] = 1
+
+    # Internals (callers hold self._lock)
+
+    def _refresh(self) -> bool:
+        """Map the file, remapping when it was replaced or resized; False if there is no usable file"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._inode = self._header = self._grid = None
+            return False
+        if self._inode == stat.st_ino and self._header is not None and self._header[LAYOUT] == self._layout:
+            return True
+        header = np.memmap(self.path, dtype=np.int64, mode="r+", shape=(HEADER_FIELDS,))
+        if header[MAGIC_WORD] != MAGIC:
+            return False
+        offset, capacity = int(header[HEADER_BYTES]), int(header[CAPACITY])
+        self._header = np.memmap(self.path, dtype=np.int64, mode="r+", shape=(offset // 8,))
+        self._grid = np.memmap(self.path, dtype=np.int8, mode="r+", offset=offset, shape=(int(header[ROWS]), capacity))
+        self._layout = int(self._header[LAYOUT])
+        table = self._header[HEADER_FIELDS:HEADER_FIELDS + int(self._header[COLUMNS])]
+        self._columns = {int(question_id): column for column, question_id in enumerate(table) if question_id > 0}
+        self._inode = stat.st_ino
+        return True
+
+    def _grow(self, user_id: int, question_ids):
+        """Make room for a user id past the last one and claim columns for new questions"""
+        with self._file_lock():
+            self._inode = None
+            self._refresh()  # Another process may already have grown it
+            header = self._header
+            if user_id >= int(header[ROWS]):
+                rows = max(user_id + 1, int(header[ROWS]) * 3 // 2)
+                with open(self.path, "r+b") as store_file:
+                    store_file.truncate(int(header[HEADER_BYTES]) + rows * int(header[CAPACITY]))
+                header[ROWS] = rows
+            header[USERS] = max(int(header[USERS]), user_id + 1)
+            for question_id in question_ids:
+                if question_id in self._columns or -question_id in header[HEADER_FIELDS:HEADER_FIELDS + int(header[COLUMNS])]:
+                    continue
+                column = int(header[COLUMNS])
+                if column >= int(header[CAPACITY]):
+                    raise RuntimeError("no free question column left; rebuild the answer store")
+                header[HEADER_FIELDS + column] = question_id
+                header[COLUMNS] = column + 1
+            header[LAYOUT] += 1
+            header.flush()
+            self._inode = None
+            self._refresh()
+
+    def _file_lock(self):
+        return _FileLock(f"{self.path}.lock")
+
+
+class _FileLock:
+    """Exclusive flock on a side file, across processes"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __enter__(self):
+        self._file = open(self.path, "a")
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+
+
+answer_store = AnswerStore(settings.answer_store_path) if settings.answer_store_path else None
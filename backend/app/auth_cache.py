@@ -0,0 +1,103 @@
+"""
+In-process cache for request authentication.
+
+Every authenticated request used to decode its JWT and SELECT the user. Both
+results are cached here for a short TTL, in bounded LRU maps: decoded tokens
+by token string (never past the token's own expiry) and user snapshots by id.
+A snapshot holds only the user's identity columns (id, email, username,
+created_at), and every hit gets a fresh transient User built from it, so no
+ORM instance is ever shared between requests or sessions. Columns that
+change as the user goes about the app (answers_version on every answer,
+updated_at) are left out and read as None on a cached user: handlers that
+need them must read them from the database.
+
+Writes to a snapshot column must call invalidate_user. Other processes only
+see the change once their entry expires, which the TTL bounds.
+"""
+import threading
+import time
+from collections import OrderedDict
+from app.config import settings
+from app.models import User
+from typing import Any, Dict, Generic, Hashable, Optional, TypeVar
+
+V = TypeVar("V")
+
+# Columns copied into snapshots; the hash and the frequently written columns stay in the database
+SNAPSHOT_COLUMNS = ["id", "email", "username", "created_at"]
+
+
+class TTLCache(Generic[V]):
+    """Thread-safe LRU map whose entries also expire after a time-to-live"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: V, ttl: Optional[float] = None):
+        """Store a value; ttl (capped at the cache's own) shortens its life"""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class AuthCache:
+    """Decoded tokens and user snapshots for get_current_user"""
+
+    def __init__(self, max_entries: int = 10_000, ttl: float = 60):
+        self.tokens: TTLCache[int] = TTLCache(max_entries, ttl)
+        self.users: TTLCache[Dict[str, Any]] = TTLCache(max_entries, ttl)
+
+    def user_id(self, token: str) -> Optional[int]:
+        return self.tokens.get(token)
+
+    def put_token(self, token: str, user_id: int, expires_at: Optional[float]):
+        """Remember a decoded token until it (or the cache entry) expires"""
+        ttl = None if expires_at is None else expires_at - time.time()
+        self.tokens.put(token, user_id, ttl)
+
+    def user(self, user_id: int) -> Optional[User]:
+        """A transient User rebuilt from the cached snapshot"""
+        snapshot = self.users.get(user_id)
+        return None if snapshot is None else User(**snapshot)
+
+    def put_user(self, user: User):
+        self.users.put(user.id, {key: getattr(user, key) for key in SNAPSHOT_COLUMNS})
+
+    def invalidate_user(self, user_id: int):
+        self.users.pop(user_id)
+
+
+auth_cache = AuthCache(max_entries=settings.auth_cache_max_entries, ttl=settings.auth_cache_ttl_seconds)
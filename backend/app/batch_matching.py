@@ -0,0 +1,194 @@
+"""
+Blocked all-pairs enemy scoring for the monthly matching job.
+
+The user x user score matrix is never materialized. Users are split into row
+blocks that are handed to a process pool; each worker walks the column blocks
+for its rows and keeps only the running best few enemies per row, so memory
+is bounded by block_size x block_size per worker.
+
+Masked L1 distances are computed with matrix products. For answers on the 1-10
+scale, |x - y| = (x - 1) + (y - 1) - 2 * sum_t [x > t][y > t] for t = 1..9, so
+the summed difference over common questions of two users is
+    X'a . Mb + Ma . X'b - 2 * Ta . Tb
+with X' the masked (value - 1) matrix, M the answered mask and T the
+"thermometer" encoding of values. All terms are small integers, so float32
+BLAS products are exact.
+
+A matrix backed by the answer store (AnswerStore.matrix) carries no mask and
+a `reopen` recipe: workers then map the store file themselves, so every
+process reads the same page cache instead of unpickling its own copy.
+"""
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from app.answer_matrix import AnswerMatrix, normalize_scores, round_scores
+from typing import Callable, Dict, Optional, Tuple
+
+# Thresholds of the thermometer encoding: [value > t] for t = 1..9
+LEVELS = np.arange(1, 10, dtype=np.int8)
+
+# Per-process copy of the matrix, installed once by the pool initializer.
+# A None mask means unanswered cells are 0 in _values.
+_values: Optional[np.ndarray] = None
+_mask: Optional[np.ndarray] = None
+
+
+def _init_worker(values: np.ndarray, mask: Optional[np.ndarray]):
+    global _values, _mask
+    _values = values
+    _mask = mask
+
+
+def _init_shared_worker(reopen: Tuple[Callable[..., np.ndarray], tuple]):
+    """Map the values from the file they live in rather than receiving a copy"""
+    function, args = reopen
+    _init_worker(function(*args), None)
+
+
+def _encode(values: np.ndarray, mask: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return (mask, masked value - 1, thermometer code) as float32 blocks"""
+    if mask is None:
+        mask = values != 0
+    answered = mask.astype(np.float32)
+    shifted = np.where(mask, values - 1, 0).astype(np.float32)
+    thermometer = (values[:, :, None] > LEVELS).reshape(len(values), -1).astype(np.float32)
+    return answered, shifted, thermometer
+
+
+def _score_rows(start: int, stop: int, block_size: int, top: int) -> Tuple[int, np.ndarray]:
+    """
+    Find the `top` best enemy rows for rows [start, stop) against every other row.
+    Returns (start, keys) where keys is a (rows, top) array of ranking keys,
+    best first, -1 where there are fewer candidates.
+    """
+    values, mask = _values, _mask
+    row_answered, row_shifted, row_thermometer = _encode(values[start:stop], _rows(mask, start, stop))
+    row_ids = np.arange(start, stop)
+    size = len(values)
+
+    best_keys = np.full((stop - start, top), -1, dtype=np.int64)
+
+    for col_start in range(0, size, block_size):
+        col_stop = min(col_start + block_size, size)
+        col_answered, col_shifted, col_thermometer = _encode(values[col_start:col_stop], _rows(mask, col_start, col_stop))
+
+        common = row_answered @ col_answered.T
+        total = (
+            row_shifted @ col_answered.T
+            + row_answered @ col_shifted.T
+            - 2 * (row_thermometer @ col_thermometer.T)
+        )
+
+        col_ids = np.arange(col_start, col_stop)
+        valid = common > 0
+        valid &= row_ids[:, None] != col_ids[None, :]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = normalize_scores(total.astype(np.int64), common.astype(np.int64))
+        hundredths = round_scores(np.where(valid, scores, 0.0))
+        keys = np.where(valid, _rank_keys(hundredths, col_ids, size), -1)
+
+        if top == 1:
+            best_keys = np.maximum(best_keys, keys.max(axis=1, keepdims=True))
+        else:
+            # Only rows where something beats the current k-th best need merging
+            improving = (keys > best_keys[:, -1:]).any(axis=1)
+            if improving.any():
+                best_keys[improving] = _top_keys(np.concatenate([best_keys[improving], keys[improving]], axis=1), top)
+
+    return start, best_keys
+
+
+def _rows(mask: Optional[np.ndarray], start: int, stop: int) -> Optional[np.ndarray]:
+    return None if mask is None else mask[start:stop]
+
+
+def _rank_keys(hundredths: np.ndarray, rows: np.ndarray, size: int) -> np.ndarray:
+    """
+    Single int64 ranking key per candidate: higher rounded score first, then
+    lower row (lower user id), matching find_enemy_match's tie-breaking.
+    """
+    return hundredths * (size + 1) + (size - rows)
+
+
+def _decode_keys(keys: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Split ranking keys back into (rows, hundredths); -1 for empty slots"""
+    rows = np.where(keys >= 0, size - keys % (size + 1), -1)
+    hundredths = np.where(keys >= 0, keys // (size + 1), -1)
+    return rows, hundredths
+
+
+def _top_keys(keys: np.ndarray, top: int) -> np.ndarray:
+    """Largest `top` keys of each row, best first"""
+    if keys.shape[1] > top:
+        keys = np.take_along_axis(keys, np.argpartition(-keys, top - 1, axis=1)[:, :top], axis=1)
+    return -np.sort(-keys, axis=1)
+
+
+def find_top_enemies(
+    matrix: AnswerMatrix,
+    top: int = 1,
+    block_size: int = 1024,
+    workers: int = 1,
+    rows: Optional[Tuple[int, int]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score every user against everyone and keep each user's `top` best enemies.
+    Returns (rows, hundredths), both (users, top) arrays of matrix rows and
+    rounded scores x 100, best first, -1 where a user has fewer candidates.
+    rows=(start, stop) only scores those rows (still against everyone); the
+    others are left at -1. workers <= 0 means one per CPU.
+    """
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    first, last = rows if rows is not None else (0, len(matrix))
+
+    keys = np.full((len(matrix), top), -1, dtype=np.int64)
+    blocks = [(start, min(start + block_size, last)) for start in range(first, last, block_size)]
+
+    mask = None if matrix.derived_mask else matrix.mask
+    if workers == 1 or len(blocks) <= 1:
+        _init_worker(matrix.values, mask)
+        results = [_score_rows(start, stop, block_size, top) for start, stop in blocks]
+    else:
+        if matrix.reopen is not None:
+            initializer, initargs = _init_shared_worker, (matrix.reopen,)
+        else:
+            initializer, initargs = _init_worker, (matrix.values, mask)
+        with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+            futures = [executor.submit(_score_rows, start, stop, block_size, top) for start, stop in blocks]
+            results = [future.result() for future in futures]
+
+    for start, block_keys in results:
+        keys[start:start + len(block_keys)] = block_keys
+
+    return _decode_keys(keys, len(matrix))
+
+
+def find_all_enemies(
+    matrix: AnswerMatrix,
+    block_size: int = 1024,
+    workers: int = 1,
+    user_range: Optional[Tuple[int, int]] = None,
+) -> Dict[int, Tuple[int, float]]:
+    """
+    Compute every user's best enemy in one job.
+    Returns {user_id: (enemy_id, match_score)} with the same scores and
+    tie-breaking as find_enemy_match. user_range=(first_id, last_id) limits
+    the result to those user ids, inclusive. workers <= 0 means one per CPU.
+    """
+    rows = None
+    if user_range is not None:
+        first_id, last_id = user_range
+        rows = (
+            int(np.searchsorted(matrix.user_ids, first_id, side="left")),
+            int(np.searchsorted(matrix.user_ids, last_id, side="right")),
+        )
+    best_rows, best_hundredths = find_top_enemies(matrix, top=1, block_size=block_size, workers=workers, rows=rows)
+
+    enemies = {}
+    for row in np.flatnonzero(best_rows[:, 0] >= 0):
+        enemies[int(matrix.user_ids[row])] = (
+            int(matrix.user_ids[best_rows[row, 0]]),
+            int(best_hundredths[row, 0]) / 100,
+        )
+    return enemies
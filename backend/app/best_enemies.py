@@ -0,0 +1,286 @@
+"""
+Each user's best enemy, materialized in best_enemies.
+
+find-enemy used to rescore a user against everyone on every call, even when
+no answers had changed since the last one. Now the result is stored per user
+and served with a primary-key read for as long as it stays valid. An entry
+can only go stale when someone's answers change, so when user X's do:
+    - X's own entry, every entry whose enemy is X and every entry with no
+      enemy at all is marked dirty in the same transaction as the answers
+      (answers_changed): their scores against X moved, in unknown directions;
+    - later, off the request path, X is offered to the users who might now
+      prefer X (offer_changes, run by the sweep). A score below the lowest
+      stored best score can't beat any entry, so the enemy index skips every
+      bucket that can't reach it, and entries X does beat are pointed at X
+      in place (exactly what a recompute would find).
+Deactivating a question dirties everything.
+
+Offers are tracked against the answer sequence (see answer_cache): the
+"best_enemy_offers" row of cache_versions holds the sequence value up to
+which changed users have been offered. Until then a clean entry may still
+miss a changed user that now beats its enemy, so lookup scores the user
+against those few pending users before serving it (and when too many are
+pending, makes the offers itself first).
+
+Dirty and missing entries are recomputed on read (lookup) or in the
+background (sweep), from the answer cache caught up against the primary.
+Every change bumps the row's version and recomputed results are only
+written back over the version they started from, so a slow recompute never
+overwrites a newer change: a write landing after the entry was read either
+bumped its version or left a pending offer.
+
+Entries are computed by the in-process answer cache, so like find-enemy
+itself they only consider users the cache holds.
+"""
+from sqlalchemy import and_, bindparam, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Insert, Select, Update
+from app.answer_cache import ANSWERS, answer_cache
+from app.models import BestEnemy, CacheVersion, User
+from app.pair_scores import pair_score_cache
+from app.question_catalog import current_version
+from typing import Dict, Optional, Tuple
+
+Enemy = Optional[Tuple[int, float]]
+
+table = BestEnemy.__table__
+
+OFFERED = "best_enemy_offers"
+
+# Candidate entries read per IN query when offering a changed user
+OFFER_CHUNK = 5000
+
+# Pending changed users a lookup scores itself; beyond this it makes the offers first
+PENDING_LIMIT = 256
+
+# Write back a recomputed entry, unless it changed since it was read (run executemany-style)
+_store = (
+    update(table)
+    .where(table.c.user_id == bindparam("b_user"), table.c.version == bindparam("b_version"))
+    .values(enemy_id=bindparam("b_enemy"), match_score=bindparam("b_score"), dirty=False)
+)
+
+# Point an entry at a changed user who now beats its enemy (ties go to the lower id)
+_offer_statement = (
+    update(table)
+    .where(
+        table.c.user_id == bindparam("b_user"),
+        or_(
+            table.c.match_score < bindparam("b_score"),
+            and_(table.c.match_score == bindparam("b_score"), table.c.enemy_id > bindparam("b_enemy")),
+        ),
+    )
+    .values(enemy_id=bindparam("b_enemy"), match_score=bindparam("b_score"), version=table.c.version + 1)
+)
+
+
+def _mark_dirty(*conditions):
+    statement = update(table).values(dirty=True, version=table.c.version + 1)
+    return statement.where(*conditions) if conditions else statement
+
+
+def entry_query(user_id: int) -> Select:
+    return select(table.c.enemy_id, table.c.match_score, table.c.dirty, table.c.version).where(table.c.user_id == user_id)
+
+
+def changed_statement(user_id: int) -> Update:
+    """Dirty the changed user's entry, entries pointing at them and entries with no enemy"""
+    return _mark_dirty(or_(table.c.user_id == user_id, table.c.enemy_id == user_id, table.c.enemy_id.is_(None)))
+
+
+def pending_query(user_id: int, limit: int) -> Select:
+    """Users (other than user_id) whose answers changed since the last offers"""
+    offered = select(CacheVersion.version).where(CacheVersion.name == OFFERED).scalar_subquery()
+    return select(User.id).where(User.answers_version > func.coalesce(offered, 0), User.id != user_id).limit(limit)
+
+
+def changed_users_query(after: int, through: int) -> Select:
+    """Users whose answers changed in (after, through], in the order they changed (read off ix_users_answers_version)"""
+    return (
+        select(User.id)
+        .where(User.answers_version > after, User.answers_version <= through)
+        .order_by(User.answers_version)
+    )
+
+
+def lowest_score_query() -> Select:
+    return select(func.min(table.c.match_score))
+
+
+def dirty_queue_query(limit: int) -> Select:
+    return select(table.c.user_id, table.c.version).where(table.c.dirty == True).order_by(table.c.user_id).limit(limit)
+
+
+def range_query(first_user_id: int, last_user_id: int) -> Select:
+    return select(table.c.user_id, table.c.enemy_id, table.c.match_score, table.c.dirty, table.c.version).where(
+        table.c.user_id.between(first_user_id, last_user_id)
+    )
+
+
+def _insert_new(dialect: str) -> Insert:
+    """Insert entries, leaving any another process stored first (run executemany-style)"""
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        return dialect_insert(table).prefix_with("IGNORE")
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        return dialect_insert(table).on_conflict_do_nothing(index_elements=[table.c.user_id])
+    raise ValueError(f"No insert-ignore for database dialect {dialect!r}")
+
+
+def save(db: Session, enemies: Dict[int, Enemy], versions: Dict[int, Optional[int]]):
+    """
+    Store recomputed entries as clean. versions holds the version each was
+    read at (None = there was no row); rows changed since are left alone.
+    """
+    updates, inserts = [], []
+    for user_id, enemy in enemies.items():
+        enemy_id, match_score = enemy if enemy is not None else (None, None)
+        version = versions.get(user_id)
+        if version is None:
+            inserts.append({"user_id": user_id, "enemy_id": enemy_id, "match_score": match_score, "dirty": False, "version": 0})
+        else:
+            updates.append({"b_user": user_id, "b_version": version, "b_enemy": enemy_id, "b_score": match_score})
+    if updates:
+        db.execute(_store, updates)
+    if inserts:
+        db.execute(_insert_new(db.get_bind().dialect.name), inserts)
+
+
+def lookup(db: Session, user_id: int) -> Enemy:
+    """
+    A user's best enemy: the stored entry while it is clean (checked against
+    pending changed users), otherwise recomputed exactly, stored and committed
+    """
+    row = db.execute(entry_query(user_id)).first()
+    if row is not None and not row.dirty:
+        stored_enemy = None if row.enemy_id is None else (row.enemy_id, row.match_score)
+        pending = db.scalars(pending_query(user_id, PENDING_LIMIT + 1)).all()
+        if not pending:
+            return stored_enemy
+        if len(pending) <= PENDING_LIMIT:
+            return _better(stored_enemy, answer_cache.best_among(db, user_id, pending))
+        offer_changes(db)
+        row = db.execute(entry_query(user_id)).first()
+        if not row.dirty:
+            return None if row.enemy_id is None else (row.enemy_id, row.match_score)
+    # The primary's answers, so the result is current as of the version read above
+    enemy, stamps = answer_cache.stamped_best_enemy(db, user_id)
+    if enemy is not None or user_id in answer_cache:
+        # Users without answers get no entry yet; their first lookup after answering creates it
+        save(db, {user_id: enemy}, {user_id: None if row is None else row.version})
+        db.commit()
+    if enemy is not None:
+        pair_score_cache.remember(db, user_id, enemy[0], enemy[1], stamps)
+    return enemy
+
+
+def _better(stored_enemy: Enemy, challenger: Enemy) -> Enemy:
+    """The better of two enemies by rounded score, ties to the lower id"""
+    if challenger is None:
+        return stored_enemy
+    if stored_enemy is None:
+        return challenger
+    if (-challenger[1], challenger[0]) < (-stored_enemy[1], stored_enemy[0]):
+        return challenger
+    return stored_enemy
+
+
+def answers_changed(db: Session, user_id: int):
+    """Dirty the entries a user's answer change may have moved; call before committing the answers"""
+    db.execute(changed_statement(user_id))
+
+
+def offer_changes(db: Session) -> int:
+    """
+    Offer every user whose answers changed since the last offers to the
+    entries they might now beat, then advance the watermark (commits).
+    Returns how many users were offered.
+    """
+    offered = current_version(db, OFFERED)
+    sequence = current_version(db, ANSWERS)
+    if sequence <= offered:
+        return 0
+    changed = db.scalars(changed_users_query(offered, sequence)).all()
+    lowest = db.scalar(lowest_score_query())
+    if lowest is not None:
+        for user_id in changed:
+            _offer(db, user_id, int(round(lowest * 100)))
+    _advance(db, OFFERED, sequence)
+    db.commit()
+    return len(changed)
+
+
+def _offer(db: Session, user_id: int, lowest_hundredths: int):
+    candidate_ids, hundredths = answer_cache.scores_reaching(db, user_id, lowest_hundredths)
+    reaching = dict(zip(candidate_ids.tolist(), hundredths.tolist()))
+    offers = []
+    # Read the candidates' entries first: most offers lose, and sending them all costs far more than this
+    for start in range(0, len(candidate_ids), OFFER_CHUNK):
+        chunk = candidate_ids[start:start + OFFER_CHUNK].tolist()
+        for candidate_id, enemy_id, match_score in db.execute(
+            select(table.c.user_id, table.c.enemy_id, table.c.match_score).where(table.c.user_id.in_(chunk))
+        ):
+            if enemy_id is None:
+                continue
+            score = reaching[candidate_id]
+            stored = int(round(match_score * 100))
+            if score > stored or (score == stored and user_id < enemy_id):
+                offers.append({"b_user": candidate_id, "b_enemy": user_id, "b_score": score / 100})
+    if offers:
+        db.execute(_offer_statement, offers)
+
+
+def _advance(db: Session, name: str, version: int):
+    """Move a cache_versions counter forward to version (never back)"""
+    moved = db.execute(
+        update(CacheVersion)
+        .where(CacheVersion.name == name, CacheVersion.version < version)
+        .values(version=version)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if moved or db.get(CacheVersion, name) is not None:
+        return
+    try:
+        with db.begin_nested():
+            db.add(CacheVersion(name=name, version=version))
+    except IntegrityError:
+        pass  # Another process created it first; the next offers catch up from its value
+
+
+def invalidate_all(db: Session):
+    """Mark every entry dirty, e.g. when a question stops counting; call before committing that change"""
+    db.execute(_mark_dirty())
+
+
+def stored(db: Session, first_user_id: int, last_user_id: int) -> Tuple[Dict[int, Enemy], Dict[int, int]]:
+    """({user_id: enemy} for clean entries, {user_id: version} for dirty ones) in a user id range"""
+    clean: Dict[int, Enemy] = {}
+    dirty: Dict[int, int] = {}
+    for user_id, enemy_id, match_score, is_dirty, version in db.execute(range_query(first_user_id, last_user_id)):
+        if is_dirty:
+            dirty[user_id] = version
+        else:
+            clean[user_id] = None if enemy_id is None else (enemy_id, match_score)
+    return clean, dirty
+
+
+def sweep(db: Session, limit: int = 500) -> int:
+    """
+    Make the pending offers, then recompute up to `limit` dirty entries,
+    lowest user ids first; returns how many entries were recomputed.
+
+    The scheduler process serves no answer writes, so its answer cache only
+    hears of them from the database: it is caught up against db (the
+    primary) before anything is offered or recomputed.
+    """
+    answer_cache.ensure_fresh(db)
+    offer_changes(db)
+    rows = db.execute(dirty_queue_query(limit)).all()
+    if not rows:
+        return 0
+    versions = {user_id: version for user_id, version in rows}
+    save(db, {user_id: answer_cache.best_enemy(db, user_id) for user_id in versions}, versions)
+    db.commit()
+    return len(rows)
@@ -10,6 +10,16 @@ class Settings(BaseSettings):
     mysql_user: str = "root"
     mysql_password: str = ""
     mysql_database: str = "nemesis"
+    database_async: bool = False  # Serve the hot routes on AsyncSession (needs aiosqlite / aiomysql)
+    read_database_url: str = ""  # Read replica (any SQLAlchemy URL); empty = read from the primary
+    db_pool_size: int = 5  # Connections kept open per engine
+    db_max_overflow: int = 10  # Extra connections allowed under bursts
+    db_pool_pre_ping: bool = False  # Test connections on checkout (worth it when MySQL drops idle ones)
+    db_pool_recycle: int = -1  # Reconnect connections older than this many seconds, -1 = never
+    sqlite_journal_mode: str = "wal"  # Readers don't block the writer; "" leaves the file's mode alone
+    sqlite_synchronous: str = "normal"  # Safe with WAL and far fewer fsyncs than "full"
+    sqlite_mmap_size: int = 268435456  # Bytes of the file read through mmap, 0 = off
+    sqlite_busy_timeout_ms: int = 5000  # Wait this long for a lock instead of failing
     
     # Email settings
     smtp_host: str = "smtp.gmail.com"
@@ -17,10 +27,48 @@ class Settings(BaseSettings):
     smtp_user: str = ""
     smtp_password: str = ""
     smtp_from_email: str = ""
+    smtp_use_tls: bool = True  # Implicit TLS on connect
+    smtp_pool_size: int = 4  # SMTP connections kept open while sending match emails
+    smtp_concurrency: int = 16  # Match emails in flight at once
+    
+    # Monthly matching settings
+    matching_workers: int = 1  # Processes for the batch scorer, 0 = one per CPU
+    matching_block_size: int = 1024  # Users per tile; bounds memory per worker
+    matching_pairing: Literal["argmax", "global"] = "argmax"  # Per-user best enemy, or mutual pairs maximizing the total
+    matching_pairing_candidates: int = 16  # Top enemies per user considered by global pairing
+    matching_chunk_size: int = 1000  # Users loaded, inserted and emailed at a time
+    matching_shard_size: int = 5000  # User ids per shard of a matching run
+    matching_lease_seconds: int = 300  # A worker silent for this long loses its shard to another
+    answer_cache_max_users: int = 200000  # Least recently active users beyond this are evicted
+    answer_cache_resync_seconds: int = 0  # Periodic full resync from the DB, 0 = only when invalidated (changes are caught up on each read)
+    matching_index_bucket_size: int = 128  # Users per bucket of the exact enemy index, 0 = always scan everyone
+    matching_approximate: bool = False  # Interactive find-enemy uses the approximate search by default
+    matching_approximate_candidates: int = 4096  # Users scored exactly per approximate search
+    scheduler_enabled: bool = True  # Take part in the election for running scheduled jobs
+    scheduler_lease_seconds: int = 30  # The leader renews every third of this; a dead one is replaced after it
+    best_enemy_sweep_seconds: int = 30  # Background recompute of dirty materialized best enemies, 0 = only on read
+    best_enemy_sweep_batch: int = 500  # Dirty entries recomputed per sweep
+    answer_store_path: str = ""  # Memory-mapped answer vectors shared by all processes on the host, "" = off
+    find_enemy_workers: int = 1  # Threads running background find-enemy jobs; caps the CPU they take from requests
+    find_enemy_queue_limit: int = 64  # Jobs allowed to wait for a worker before 503s
+    find_enemy_retry_after_seconds: int = 5  # Retry-After sent with those 503s
+    find_enemy_job_timeout_seconds: int = 300  # Unfinished jobs older than this count as failed (their process died)
+    pair_score_cache_size: int = 100000  # Pair scores kept in memory, keyed by both users' answer versions; 0 = off
+    pair_score_cache_persist: bool = False  # Also keep them in the pair_scores table, shared by every process
+    
+    # Question catalog
+    question_catalog_cache: bool = True  # Serve GET /api/questions/ from memory while its version is unchanged
     
     # App settings
+    startup_warmup: bool = True  # Load the question catalog and answer cache before reporting ready
     secret_key: str = "your-secret-key-change-in-production"
+    auth_cache_ttl_seconds: int = 60  # Decoded tokens and users reused for this long, 0 = off
+    auth_cache_max_entries: int = 10000  # Per map (tokens, users), least recently used evicted first
     algorithm: str = "HS256"
+    bcrypt_rounds: int = 12  # Cost of new hashes; older hashes are upgraded on the next login
+    password_hash_workers: int = 2  # Threads doing bcrypt, kept apart from the request threadpool
+    password_hash_queue_limit: int = 8  # Logins/signups allowed to wait for a worker before 503s
+    password_hash_retry_after_seconds: int = 1  # Retry-After sent with those 503s
     
     class Config:
         env_file = ".env"
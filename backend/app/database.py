@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
@@ -6,20 +7,96 @@ from app.config import settings
 # Determine database URL based on type
 if settings.database_type == "sqlite":
     database_url = settings.database_url
-    connect_args = {"check_same_thread": False}
 else:
     # MySQL connection
     database_url = (
         f"mysql+pymysql://{settings.mysql_user}:{settings.mysql_password}"
         f"@{settings.mysql_host}:{settings.mysql_port}/{settings.mysql_database}"
     )
-    connect_args = {}
 
-engine = create_engine(database_url, connect_args=connect_args)
+# Reads that can tolerate replication lag go here; the primary when no replica is configured
+read_database_url = settings.read_database_url or database_url
+
+def engine_options(url: str) -> dict:
+    """create_engine keyword arguments for the configured pool profile"""
+    url = make_url(url)
+    options = {
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "pool_recycle": settings.db_pool_recycle,
+    }
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            # In-memory databases live in a single connection; there is no pool to size
+            return options
+    options["pool_size"] = settings.db_pool_size
+    options["max_overflow"] = settings.db_max_overflow
+    return options
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Per-connection SQLite tuning; WAL lets readers run alongside the writer"""
+    pragmas = {
+        "journal_mode": settings.sqlite_journal_mode,
+        "synchronous": settings.sqlite_synchronous,
+        "mmap_size": settings.sqlite_mmap_size,
+        "busy_timeout": settings.sqlite_busy_timeout_ms,
+    }
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        if value != "":
+            cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+def create_configured_engine(url: str):
+    engine = create_engine(url, **engine_options(url))
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", apply_sqlite_pragmas)
+    return engine
+
+engine = create_configured_engine(database_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+read_engine = engine if read_database_url == database_url else create_configured_engine(read_database_url)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
 Base = declarative_base()
 
+# Async drivers standing in for the sync ones when database_async is on
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "mysql": "mysql+aiomysql"}
+
+def async_database_url(url: str) -> str:
+    """Same database as a sync URL, through the matching async driver"""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()]).render_as_string(hide_password=False)
+
+def create_configured_async_engine(url: str):
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    async_url = async_database_url(url)
+    options = engine_options(async_url)
+    if "pool_size" in options:
+        # aiosqlite defaults to NullPool, which would reconnect (and re-run the pragmas) per request
+        options["poolclass"] = AsyncAdaptedQueuePool
+    engine = create_async_engine(async_url, **options)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine.sync_engine, "connect", apply_sqlite_pragmas)
+    return engine
+
+# Async engines for the hot routes; only built when enabled, so aiosqlite/aiomysql stay optional
+async_engine = None
+async_read_engine = None
+AsyncSessionLocal = None
+AsyncReadSessionLocal = None
+if settings.database_async:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    async_engine = create_configured_async_engine(database_url)
+    async_read_engine = async_engine if read_engine is engine else create_configured_async_engine(read_database_url)
+    # Objects stay readable after commit without another round trip
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+
 def get_db():
     """Dependency for getting database session"""
     db = SessionLocal()
@@ -27,3 +104,21 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def get_read_db():
+    """Dependency for a session on the read replica (the primary if none is configured)"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    """Dependency for getting an async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_read_db():
+    """Async counterpart of get_read_db"""
+    async with AsyncReadSessionLocal() as db:
+        yield db
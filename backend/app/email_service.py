@@ -3,14 +3,26 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from app.config import settings
 from sqlalchemy.orm import Session
-from app.models import User, Match
+from app.models import User
+from app.smtp_pool import SMTPPool
+from typing import Optional
 
-async def send_match_email(user: User, enemy: User, match_score: float):
-    """Send email notification about new enemy match"""
-    if not settings.smtp_user or not settings.smtp_password:
-        print(f"Email not configured. Would send match notification to {user.email}")
-        return
-    
+def email_configured() -> bool:
+    return bool(settings.smtp_user and settings.smtp_password)
+
+def create_smtp_pool() -> SMTPPool:
+    """SMTP connection pool built from settings"""
+    return SMTPPool(
+        hostname=settings.smtp_host,
+        port=settings.smtp_port,
+        username=settings.smtp_user,
+        password=settings.smtp_password,
+        use_tls=settings.smtp_use_tls,
+        size=settings.smtp_pool_size,
+    )
+
+def build_match_message(user: User, enemy: User, match_score: float) -> MIMEMultipart:
+    """Match notification email for one user"""
     message = MIMEMultipart("alternative")
     message["Subject"] = "🎯 You Have a New Enemy Match!"
     message["From"] = settings.smtp_from_email or settings.smtp_user
@@ -51,6 +63,21 @@ async def send_match_email(user: User, enemy: User, match_score: float):
     
     message.attach(part1)
     message.attach(part2)
+    return message
+
+async def send_match_email(user: User, enemy: User, match_score: float, pool: Optional[SMTPPool] = None) -> bool:
+    """Send email notification about new enemy match, over the pool if one is given"""
+    if not email_configured():
+        print(f"Email not configured. Would send match notification to {user.email}")
+        return False
+    
+    message = build_match_message(user, enemy, match_score)
+    
+    if pool is not None:
+        sent = await pool.send(message)
+        if sent:
+            print(f"Match email sent to {user.email}")
+        return sent
     
     try:
         await aiosmtplib.send(
@@ -59,36 +86,20 @@ async def send_match_email(user: User, enemy: User, match_score: float):
             port=settings.smtp_port,
             username=settings.smtp_user,
             password=settings.smtp_password,
-            use_tls=True,
+            use_tls=settings.smtp_use_tls,
         )
         print(f"Match email sent to {user.email}")
+        return True
     except Exception as e:
         print(f"Failed to send email to {user.email}: {str(e)}")
+        return False
 
-async def match_all_users(db: Session):
-    """Match all users with enemies and send emails"""
-    users = db.query(User).all()
+async def match_all_users(db: Session, run_key: Optional[str] = None):
+    """
+    Match all users with enemies and send emails.
+    Runs as a resumable sharded run (this month's unless run_key is given) that
+    other worker processes can join; see app.matching_runs.
+    """
+    from app.matching_runs import monthly_run_key, run_worker
     
-    for user in users:
-        from app.matching import find_enemy_match
-        
-        enemy_id, match_score = find_enemy_match(user.id, db)
-        if enemy_id:
-            enemy = db.query(User).filter(User.id == enemy_id).first()
-            
-            # Create match record
-            match = Match(
-                user_id=user.id,
-                enemy_id=enemy_id,
-                match_score=match_score
-            )
-            db.add(match)
-            db.commit()
-            db.refresh(match)
-            
-            # Send email
-            await send_match_email(user, enemy, match_score)
-            
-            # Mark email as sent
-            match.email_sent = True
-            db.commit()
+    await run_worker(db, run_key or monthly_run_key())
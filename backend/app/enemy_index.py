@@ -0,0 +1,356 @@
+"""
+Exact furthest-neighbor index for enemy search.
+
+Users are partitioned into buckets of similar answer vectors (recursive median
+splits on the highest-variance question). Each bucket keeps per-question
+min/max summaries of its members' answers, a center vector p with the radius
+R = max over members of sum |v_q - p_q|, and the smallest number of questions
+any member answered. A member sharing the set S of questions with a target t
+then has a summed difference of at most
+
+    min(sum_{q in S} max(|t_q - min_q|, |t_q - max_q|),
+        sum_{q in S} |t_q - p_q| + R)
+
+(box summary and triangle inequality respectively). Both sums are bounded by
+the top-|S| terms, and |S| is bounded below by the minimum answered count, so
+maximizing the mean over the possible sizes of S bounds every member's score.
+Buckets are visited in decreasing bound order and skipped once their bound
+cannot beat (or tie with a lower user id) the best score found so far, so the
+result is exactly the same as an exhaustive scan.
+
+The index does not own answer data: it stores row numbers into an
+AnswerMatrix and is kept in sync by whoever owns the matrix (AnswerCache).
+Updates only ever widen bucket summaries, so bounds stay valid; once enough
+updates have accumulated the owner should rebuild it.
+"""
+import warnings
+import numpy as np
+from app.answer_matrix import AnswerMatrix, MAX_DIFFERENCE, round_scores
+from typing import Dict, List, Optional, Tuple
+
+# Sentinels for "no member answered this question" in the min/max summaries
+NO_LOW = 11
+NO_HIGH = 0
+
+# Slack for comparing float bounds against rounded scores
+EPSILON = 1e-9
+
+
+class EnemyIndex:
+    """Bucketed min/max summaries over rows of an AnswerMatrix"""
+
+    def __init__(self, bucket_size: int = 128, rebuild_fraction: float = 0.25, batch_rows: int = 8192):
+        self.bucket_size = bucket_size
+        self.batch_rows = batch_rows
+        self.rebuild_fraction = rebuild_fraction
+        self._buckets: List[np.ndarray] = []
+        self._bucket_of: Dict[int, int] = {}
+        self._low = np.full((0, 0), NO_LOW, dtype=np.int8)
+        self._high = np.full((0, 0), NO_HIGH, dtype=np.int8)
+        self._center = np.zeros((0, 0), dtype=np.float32)
+        self._radius = np.zeros(0, dtype=np.float64)
+        self._min_answered = np.zeros(0, dtype=np.int64)
+        self._min_user = np.zeros(0, dtype=np.int64)
+        self._updates = 0
+        # Candidates scored / candidates indexed for the most recent query
+        self.last_scored = 0
+        self.last_total = 0
+
+    @classmethod
+    def build(cls, matrix: AnswerMatrix, bucket_size: int = 128, rebuild_fraction: float = 0.25) -> "EnemyIndex":
+        """Partition every answered row of a matrix into buckets"""
+        index = cls(bucket_size=bucket_size, rebuild_fraction=rebuild_fraction)
+        index._ensure_width(matrix.values.shape[1])
+        rows = np.flatnonzero(matrix.mask.any(axis=1))
+        for bucket_rows in index._split(matrix, rows):
+            index._add_bucket(matrix, bucket_rows)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._bucket_of)
+
+    @property
+    def stale(self) -> bool:
+        """True once updates have loosened enough summaries that a rebuild pays off"""
+        return self._updates > max(self.bucket_size, self.rebuild_fraction * len(self))
+
+    # Maintenance
+
+    def upsert(self, matrix: AnswerMatrix, row: int):
+        """Index a new row, or widen its bucket after the row's answers changed"""
+        answered = np.flatnonzero(matrix.mask[row])
+        if len(answered) == 0:
+            self.remove(row)
+            return
+        self._ensure_width(matrix.values.shape[1])
+
+        bucket = self._bucket_of.get(row)
+        if bucket is None:
+            bucket = self._nearest_bucket(matrix.values[row, answered], answered)
+            if bucket is None:
+                self._add_bucket(matrix, np.array([row]))
+                return
+            self._buckets[bucket] = np.append(self._buckets[bucket], row)
+            self._bucket_of[row] = bucket
+
+        values = matrix.values[row, answered]
+        new_columns = self._high[bucket, answered] < self._low[bucket, answered]
+        self._center[bucket, answered[new_columns]] = values[new_columns]
+        self._low[bucket, answered] = np.minimum(self._low[bucket, answered], values)
+        self._high[bucket, answered] = np.maximum(self._high[bucket, answered], values)
+        distance = np.abs(values - self._center[bucket, answered]).sum()
+        self._radius[bucket] = max(self._radius[bucket], distance)
+        self._min_answered[bucket] = min(self._min_answered[bucket], len(answered))
+        self._min_user[bucket] = min(self._min_user[bucket], int(matrix.user_ids[row]))
+        self._updates += 1
+
+        if len(self._buckets[bucket]) > 2 * self.bucket_size:
+            self._resplit(matrix, bucket)
+
+    def remove(self, row: int):
+        """Drop a row; its bucket's summaries stay as a (looser) valid bound"""
+        bucket = self._bucket_of.pop(row, None)
+        if bucket is not None:
+            self._buckets[bucket] = self._buckets[bucket][self._buckets[bucket] != row]
+            self._updates += 1
+
+    def drop_column(self, column: int):
+        """A question stopped counting: forget it and lower answered counts"""
+        if column < self._low.shape[1]:
+            self._low[:, column] = NO_LOW
+            self._high[:, column] = NO_HIGH
+        self._min_answered = np.maximum(self._min_answered - 1, 0)
+        self._updates += 1
+
+    # Query
+
+    def best_enemy(self, matrix: AnswerMatrix, user_id: int) -> Optional[Tuple[int, float]]:
+        """Same result as matrix.best_enemy(user_id), scoring as few candidates as possible"""
+        self.last_scored = 0
+        self.last_total = len(self)
+        target = matrix.row(user_id)
+        if target is None or not self._buckets:
+            return None
+
+        columns = np.flatnonzero(matrix.mask[target])
+        columns = columns[columns < self._low.shape[1]]
+        bounds = self._upper_bounds(matrix.values[target, columns], columns, matrix.values.shape[1])
+
+        best_hundredths = -1
+        best_id = None
+        batch: List[np.ndarray] = []
+        batch_size = 0
+        batch_limit = self.bucket_size
+
+        for bucket in np.argsort(-bounds, kind="stable"):
+            bound = bounds[bucket]
+            if bound < 0:
+                break
+            if best_id is not None:
+                # Sorted by bound, so if this bucket cannot even tie, no later one can
+                if bound < (best_hundredths - 0.5) / 100 - EPSILON:
+                    break
+                # It can at best tie, and ties go to the lowest user id
+                if bound < (best_hundredths + 0.5) / 100 - EPSILON and self._min_user[bucket] > best_id:
+                    continue
+
+            batch.append(self._buckets[bucket])
+            batch_size += len(self._buckets[bucket])
+            if batch_size < batch_limit:
+                continue
+
+            # Score in growing batches: small ones first to find a good best
+            # quickly, larger ones later to keep per-call overhead down
+            best_hundredths, best_id = self._score_batch(matrix, user_id, batch, best_hundredths, best_id)
+            batch, batch_size = [], 0
+            batch_limit = min(batch_limit * 2, self.batch_rows)
+
+        if batch:
+            best_hundredths, best_id = self._score_batch(matrix, user_id, batch, best_hundredths, best_id)
+
+        if best_id is None:
+            return None
+        return (best_id, best_hundredths / 100)
+
+    def rows_reaching(self, matrix: AnswerMatrix, user_id: int, minimum_hundredths: int) -> np.ndarray:
+        """Rows of every bucket where some member could score at least minimum_hundredths against a target"""
+        target = matrix.row(user_id)
+        if target is None or not self._buckets:
+            return np.zeros(0, dtype=np.int64)
+
+        columns = np.flatnonzero(matrix.mask[target])
+        columns = columns[columns < self._low.shape[1]]
+        bounds = self._upper_bounds(matrix.values[target, columns], columns, matrix.values.shape[1])
+        reaching = np.flatnonzero((bounds >= 0) & (bounds >= (minimum_hundredths - 0.5) / 100 - EPSILON))
+        if len(reaching) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([self._buckets[bucket] for bucket in reaching])
+
+    def candidate_rows(self, matrix: AnswerMatrix, user_id: int, candidates: int) -> np.ndarray:
+        """
+        Rows of the buckets whose centers are farthest from a target, about
+        `candidates` of them. Used as a short list by approximate search.
+        """
+        target = matrix.row(user_id)
+        if target is None or not self._buckets:
+            return np.zeros(0, dtype=np.int64)
+
+        buckets = len(self._buckets)
+        columns = np.flatnonzero(matrix.mask[target])
+        columns = columns[columns < self._low.shape[1]]
+        present = self._high[:buckets, columns] >= self._low[:buckets, columns]
+        distance = np.where(present, np.abs(matrix.values[target, columns] - self._center[:buckets, columns]), 0)
+        mean_distance = np.where(present.any(axis=1), distance.sum(axis=1) / np.maximum(present.sum(axis=1), 1), -1)
+
+        rows = []
+        count = 0
+        for bucket in np.argsort(-mean_distance, kind="stable"):
+            if mean_distance[bucket] < 0 or count >= candidates:
+                break
+            rows.append(self._buckets[bucket])
+            count += len(self._buckets[bucket])
+        return np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+
+    # Internals
+
+    def _score_batch(
+        self,
+        matrix: AnswerMatrix,
+        user_id: int,
+        batch: List[np.ndarray],
+        best_hundredths: int,
+        best_id: Optional[int],
+    ) -> Tuple[int, Optional[int]]:
+        rows = np.concatenate(batch)
+        self.last_scored += len(rows)
+        candidate_ids, scores = matrix.scores(user_id, rows=rows)
+        if len(scores) == 0:
+            return best_hundredths, best_id
+        hundredths = round_scores(scores)
+        top = int(hundredths.max())
+        candidate = int(candidate_ids[hundredths == top].min())
+        if top > best_hundredths or (top == best_hundredths and candidate < best_id):
+            return top, candidate
+        return best_hundredths, best_id
+
+    def _upper_bounds(self, target_values: np.ndarray, columns: np.ndarray, width: int) -> np.ndarray:
+        """Upper bound on the unrounded score of any member of each bucket (-1 = no common question)"""
+        buckets = len(self._buckets)
+        if len(columns) == 0:
+            return np.full(buckets, -1.0)
+
+        low = self._low[:buckets, columns].astype(np.int16)
+        high = self._high[:buckets, columns].astype(np.int16)
+        target = target_values.astype(np.int16)
+        present = high >= low
+        present_count = present.sum(axis=1)
+
+        # Largest possible summed difference over the k most favourable
+        # shared questions, for every k, from the box and from the ball
+        box = np.where(present, np.maximum(np.abs(target - low), np.abs(high - target)), 0)
+        ball = np.where(present, np.abs(target - self._center[:buckets, columns]), 0)
+        box_sums = np.cumsum(-np.sort(-box, axis=1), axis=1)
+        ball_sums = np.cumsum(-np.sort(-ball, axis=1), axis=1) + self._radius[:buckets, None]
+        sizes = np.arange(1, len(columns) + 1)
+        means = np.minimum(box_sums, ball_sums) / sizes
+
+        # Every member shares at least `shared` and at most `present_count` questions
+        shared = np.clip(self._min_answered[:buckets] - (width - len(columns)), 1, None)
+        possible = (sizes >= shared[:, None]) & (sizes <= present_count[:, None])
+        mean_difference = np.where(possible, means, -1).max(axis=1)
+        bounds = (mean_difference / MAX_DIFFERENCE) * 100
+        return np.where(possible.any(axis=1), bounds, -1.0)
+
+    def _split(self, matrix: AnswerMatrix, rows: np.ndarray) -> List[np.ndarray]:
+        """Recursively halve rows on their highest-variance question until buckets are small"""
+        done = []
+        pending = [rows]
+        while pending:
+            rows = pending.pop()
+            if len(rows) <= self.bucket_size:
+                if len(rows):
+                    done.append(rows)
+                continue
+            values = matrix.values[rows].astype(np.float32)
+            mask = matrix.mask[rows]
+            counts = np.maximum(mask.sum(axis=0), 1)
+            means = (values * mask).sum(axis=0) / counts
+            keys = np.where(mask, values, means)
+            column = int(np.argmax(keys.var(axis=0)))
+            order = np.argsort(keys[:, column], kind="stable")
+            half = len(rows) // 2
+            pending.append(rows[order[:half]])
+            pending.append(rows[order[half:]])
+        return done
+
+    def _add_bucket(self, matrix: AnswerMatrix, rows: np.ndarray):
+        bucket = len(self._buckets)
+        if bucket >= self._low.shape[0]:
+            self._grow(max(16, bucket * 2), self._low.shape[1])
+        self._buckets.append(rows)
+        self._summarize(matrix, bucket)
+
+    def _summarize(self, matrix: AnswerMatrix, bucket: int):
+        """Recompute a bucket's summaries exactly from its current rows"""
+        rows = self._buckets[bucket]
+        width = matrix.values.shape[1]
+        values = matrix.values[rows]
+        mask = matrix.mask[rows]
+        self._low[bucket] = NO_LOW
+        self._high[bucket] = NO_HIGH
+        self._low[bucket, :width] = np.where(mask, values, NO_LOW).min(axis=0)
+        self._high[bucket, :width] = np.where(mask, values, NO_HIGH).max(axis=0)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN columns nobody answered
+            center = np.nanmedian(np.where(mask, values, np.nan), axis=0)
+        center = np.nan_to_num(center).astype(np.float32)
+        self._center[bucket] = 0
+        self._center[bucket, :width] = center
+        self._radius[bucket] = np.where(mask, np.abs(values - center), 0).sum(axis=1).max()
+        self._min_answered[bucket] = mask.sum(axis=1).min()
+        self._min_user[bucket] = matrix.user_ids[rows].min()
+        for row in rows:
+            self._bucket_of[int(row)] = bucket
+
+    def _resplit(self, matrix: AnswerMatrix, bucket: int):
+        first, *rest = self._split(matrix, self._buckets[bucket])
+        self._buckets[bucket] = first
+        self._summarize(matrix, bucket)
+        for rows in rest:
+            self._add_bucket(matrix, rows)
+
+    def _nearest_bucket(self, values: np.ndarray, columns: np.ndarray) -> Optional[int]:
+        """Bucket whose summary box is closest to a new row (L1 to box centers)"""
+        buckets = len(self._buckets)
+        if buckets == 0:
+            return None
+        low = self._low[:buckets, columns].astype(np.float32)
+        high = self._high[:buckets, columns].astype(np.float32)
+        present = high >= low
+        distance = np.where(present, np.abs((low + high) / 2 - values), MAX_DIFFERENCE).sum(axis=1)
+        sizes = np.array([len(rows) for rows in self._buckets])
+        distance[sizes == 0] = np.inf
+        nearest = int(np.argmin(distance))
+        return nearest if np.isfinite(distance[nearest]) else None
+
+    def _ensure_width(self, columns: int):
+        if columns > self._low.shape[1]:
+            self._grow(self._low.shape[0], max(columns, self._low.shape[1] * 2))
+
+    def _grow(self, buckets: int, columns: int):
+        low = np.full((buckets, columns), NO_LOW, dtype=np.int8)
+        high = np.full((buckets, columns), NO_HIGH, dtype=np.int8)
+        old_buckets, old_columns = self._low.shape
+        low[:old_buckets, :old_columns] = self._low
+        high[:old_buckets, :old_columns] = self._high
+        min_answered = np.zeros(buckets, dtype=np.int64)
+        min_answered[:old_buckets] = self._min_answered
+        min_user = np.zeros(buckets, dtype=np.int64)
+        min_user[:old_buckets] = self._min_user
+        center = np.zeros((buckets, columns), dtype=np.float32)
+        center[:old_buckets, :old_columns] = self._center
+        radius = np.zeros(buckets, dtype=np.float64)
+        radius[:old_buckets] = self._radius
+        self._low, self._high = low, high
+        self._center, self._radius = center, radius
+        self._min_answered, self._min_user = min_answered, min_user
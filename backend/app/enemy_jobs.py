@@ -0,0 +1,185 @@
+"""
+Background find-enemy jobs.
+
+A find-enemy scan can take long enough to hold a request thread (and the
+client) for seconds. With ?background=true the request only records a job in
+enemy_jobs and answers 202; the scan runs on a small dedicated thread pool
+and the client polls the job by id. Jobs live in the database, so any
+process can answer the poll.
+
+Requests are coalesced per user: while a user has a job queued or running,
+further requests (from this process, or seen in the table from another one)
+get that job back instead of a new scan. At most `workers` scans run at once
+and `queue_limit` more may wait; beyond that submit raises FindEnemyBusy, so
+matching can't crowd out the rest of the traffic.
+
+A job left unfinished by a process that died is reported failed once it is
+older than job_timeout, and no longer absorbs new requests.
+"""
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.sql import Select
+from app.config import settings
+from app.database import ReadSessionLocal, SessionLocal
+from app.matching import find_enemy_match
+from app.models import EnemyJob, Match, User
+from app.schemas import EnemyJobResponse, MatchResponse
+from typing import Dict, Optional
+
+IN_FLIGHT = ("queued", "running")
+NO_ENEMY = "No suitable enemy found. Make sure there are other users with answers."
+
+enemy = aliased(User)
+
+
+class FindEnemyBusy(Exception):
+    """Every find-enemy worker and queue slot is taken"""
+
+
+def utcnow() -> datetime:
+    """Naive UTC time, the form job times are stored in"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _jobs() -> Select:
+    """Jobs with their match and enemy, if any"""
+    return (
+        select(
+            EnemyJob.id, EnemyJob.status, EnemyJob.created_at, EnemyJob.finished_at, EnemyJob.error,
+            Match.id, Match.enemy_id, enemy.username, enemy.email, Match.match_score, Match.matched_at,
+        )
+        .outerjoin(Match, Match.id == EnemyJob.match_id)
+        .outerjoin(enemy, enemy.id == Match.enemy_id)
+    )
+
+
+def job_query(job_id: str, user_id: int) -> Select:
+    return _jobs().filter(EnemyJob.id == job_id, EnemyJob.user_id == user_id)
+
+
+def recent_jobs_query(user_id: int, limit: int) -> Select:
+    return _jobs().filter(EnemyJob.user_id == user_id).order_by(EnemyJob.created_at.desc()).limit(limit)
+
+
+def in_flight_query(user_id: int, since: datetime) -> Select:
+    return select(EnemyJob.id).filter(
+        EnemyJob.user_id == user_id, EnemyJob.created_at >= since, EnemyJob.status.in_(IN_FLIGHT)
+    ).order_by(EnemyJob.created_at.desc()).limit(1)
+
+
+def job_response(row, timeout: Optional[float] = None) -> EnemyJobResponse:
+    """EnemyJobResponse for a row of job_query / recent_jobs_query"""
+    job_id, status, created_at, finished_at, error, match_id = row[:6]
+    timeout = settings.find_enemy_job_timeout_seconds if timeout is None else timeout
+    if status in IN_FLIGHT and created_at < utcnow() - timedelta(seconds=timeout):
+        status, error = "failed", "Job timed out"
+    match = None
+    if match_id is not None:
+        match = MatchResponse(
+            id=match_id,
+            enemy_id=row[6],
+            enemy_username=row[7],
+            enemy_email=row[8],
+            match_score=row[9],
+            matched_at=row[10],
+        )
+    return EnemyJobResponse(id=job_id, status=status, created_at=created_at, finished_at=finished_at, match=match, error=error)
+
+
+class EnemyJobs:
+    """Per-user single-flight find-enemy jobs on a bounded thread pool"""
+
+    def __init__(self, workers: int = 1, queue_limit: int = 64, job_timeout: float = 300):
+        self.job_timeout = job_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="find-enemy")
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self._lock = threading.Lock()
+        self._in_flight: Dict[int, str] = {}  # user_id -> job id, for jobs of this process
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    def submit(self, db: Session, user_id: int, approximate: Optional[bool] = None) -> str:
+        """Id of the user's in-flight job, or of a new one queued for them (commits)"""
+        with self._lock:
+            job_id = self._in_flight.get(user_id)
+        if job_id is None:
+            # Another process may be working on it already
+            job_id = db.scalar(in_flight_query(user_id, utcnow() - timedelta(seconds=self.job_timeout)))
+        if job_id is not None:
+            self.coalesced += 1
+            return job_id
+
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise FindEnemyBusy()
+        with self._lock:
+            job_id = self._in_flight.get(user_id)
+            if job_id is not None:
+                # A concurrent request got here first
+                self._slots.release()
+                self.coalesced += 1
+                return job_id
+            job_id = uuid.uuid4().hex
+            self._in_flight[user_id] = job_id
+        try:
+            db.add(EnemyJob(id=job_id, user_id=user_id, approximate=approximate, status="queued", created_at=utcnow()))
+            db.commit()
+        except BaseException:
+            self._finished(user_id)
+            raise
+        try:
+            self._executor.submit(self._run, job_id, user_id, approximate)
+        except BaseException:
+            # Left queued, the job would absorb the user's requests until it timed out, and never run
+            try:
+                self._set(db, job_id, status="failed", error="Job could not be started", finished_at=utcnow())
+            finally:
+                self._finished(user_id)
+            raise
+        self.submitted += 1
+        return job_id
+
+    def _run(self, job_id: str, user_id: int, approximate: Optional[bool]):
+        try:
+            with ReadSessionLocal() as read_db, SessionLocal() as db:
+                self._set(db, job_id, status="running")
+                try:
+                    found = find_enemy_match(user_id, read_db, approximate=approximate, primary_db=db)
+                    if found is None:
+                        self._set(db, job_id, status="failed", error=NO_ENEMY, finished_at=utcnow())
+                        return
+                    match = Match(user_id=user_id, enemy_id=found[0], match_score=found[1])
+                    db.add(match)
+                    db.flush()
+                    self._set(db, job_id, status="done", match_id=match.id, finished_at=utcnow())
+                except Exception as e:
+                    db.rollback()
+                    print(f"Find-enemy job {job_id} for user {user_id} failed: {e}")
+                    self._set(db, job_id, status="failed", error="Matching failed", finished_at=utcnow())
+        finally:
+            self._finished(user_id)
+
+    @staticmethod
+    def _set(db: Session, job_id: str, **values):
+        db.execute(update(EnemyJob).where(EnemyJob.id == job_id).values(**values))
+        db.commit()
+
+    def _finished(self, user_id: int):
+        with self._lock:
+            self._in_flight.pop(user_id, None)
+        self._slots.release()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+enemy_jobs = EnemyJobs(
+    workers=settings.find_enemy_workers,
+    queue_limit=settings.find_enemy_queue_limit,
+    job_timeout=settings.find_enemy_job_timeout_seconds,
+)
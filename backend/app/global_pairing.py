@@ -0,0 +1,166 @@
+"""
+Global monthly pairing: mutual enemies chosen to maximize total incompatibility.
+
+The per-user argmax lets a handful of extreme users become everyone's enemy.
+Here users are paired off instead, one enemy each, as an approximate
+maximum-weight matching on a sparse candidate graph:
+
+1. every user's top-K enemies come from the blocked batch scorer,
+2. the candidate edges are matched greedily, heaviest first,
+3. pairs are improved by 2-swaps: (a, b), (c, d) become (a, c), (b, d)
+   whenever the candidate edge (a, c) makes the total heavier,
+4. users left unpaired are re-run on their own until no new pair forms.
+
+Whoever is still alone (an odd one out, or nobody left sharing a question
+with them) keeps their per-user argmax enemy, so every user gets a match.
+"""
+import time
+import numpy as np
+from app.answer_matrix import AnswerMatrix
+from app.batch_matching import find_top_enemies
+from typing import Dict, NamedTuple, Tuple
+
+
+class PairingReport(NamedTuple):
+    users: int
+    pairs: int
+    unpaired: int
+    objective: float  # Sum of every user's match score under global pairing
+    baseline_objective: float  # Same sum with per-user argmax enemies
+    baseline_max_chosen: int  # Most users sharing one enemy under argmax
+    runtime_seconds: float
+
+    def summary(self) -> str:
+        ratio = self.objective / self.baseline_objective if self.baseline_objective else 1.0
+        return (
+            f"Global pairing: {self.users} users, {self.pairs} pairs, {self.unpaired} unpaired, "
+            f"objective {self.objective:.2f} vs argmax {self.baseline_objective:.2f} ({ratio:.1%}), "
+            f"argmax most-chosen enemy {self.baseline_max_chosen}x, {self.runtime_seconds:.2f}s"
+        )
+
+
+def pair_globally(
+    matrix: AnswerMatrix,
+    candidates: int = 16,
+    rounds: int = 3,
+    block_size: int = 1024,
+    workers: int = 1,
+) -> Tuple[Dict[int, Tuple[int, float]], PairingReport]:
+    """
+    Pair users mutually.
+    Returns ({user_id: (enemy_id, match_score)}, report).
+    """
+    started = time.perf_counter()
+    rows, hundredths = find_top_enemies(matrix, top=candidates, block_size=block_size, workers=workers)
+    fallback_rows, fallback_hundredths = rows[:, 0], hundredths[:, 0]
+
+    partner = np.full(len(matrix), -1, dtype=np.int64)
+    weight = np.full(len(matrix), -1, dtype=np.int64)
+    _match(matrix, rows, hundredths, partner, weight, rounds)
+
+    # Users nobody paired with get another chance among themselves
+    while True:
+        alone = np.flatnonzero((partner < 0) & (fallback_rows >= 0))
+        if len(alone) < 2:
+            break
+        sub = AnswerMatrix(matrix.user_ids[alone], matrix.question_ids, matrix.values[alone], matrix.mask[alone])
+        sub_rows, sub_hundredths = find_top_enemies(sub, top=candidates, block_size=block_size, workers=workers)
+        sub_partner = np.full(len(alone), -1, dtype=np.int64)
+        sub_weight = np.full(len(alone), -1, dtype=np.int64)
+        _match(sub, sub_rows, sub_hundredths, sub_partner, sub_weight, rounds)
+        paired = sub_partner >= 0
+        if not paired.any():
+            break
+        partner[alone[paired]] = alone[sub_partner[paired]]
+        weight[alone[paired]] = sub_weight[paired]
+
+    enemies = {}
+    for row in np.flatnonzero(fallback_rows >= 0):
+        if partner[row] >= 0:
+            enemy_row, score = partner[row], weight[row]
+        else:
+            enemy_row, score = fallback_rows[row], fallback_hundredths[row]
+            weight[row] = score
+        enemies[int(matrix.user_ids[row])] = (int(matrix.user_ids[enemy_row]), int(score) / 100)
+
+    has_enemy = fallback_rows >= 0
+    report = PairingReport(
+        users=int(has_enemy.sum()),
+        pairs=int((partner >= 0).sum() // 2),
+        unpaired=int((has_enemy & (partner < 0)).sum()),
+        objective=int(weight[has_enemy].sum()) / 100,
+        baseline_objective=int(fallback_hundredths[has_enemy].sum()) / 100,
+        baseline_max_chosen=int(np.bincount(fallback_rows[has_enemy]).max()) if has_enemy.any() else 0,
+        runtime_seconds=time.perf_counter() - started,
+    )
+    return enemies, report
+
+
+def _match(
+    matrix: AnswerMatrix,
+    rows: np.ndarray,
+    hundredths: np.ndarray,
+    partner: np.ndarray,
+    weight: np.ndarray,
+    rounds: int,
+):
+    """Greedy matching on the top-K graph followed by 2-swap improvement (fills partner/weight)"""
+    sources = np.repeat(np.arange(len(rows)), rows.shape[1])
+    targets = rows.ravel()
+    weights = hundredths.ravel()
+    keep = targets >= 0
+    first = np.minimum(sources[keep], targets[keep])
+    second = np.maximum(sources[keep], targets[keep])
+    weights = weights[keep]
+
+    # Scores are symmetric, so each undirected edge only needs to appear once
+    _, unique = np.unique(first * len(rows) + second, return_index=True)
+    first, second, weights = first[unique], second[unique], weights[unique]
+
+    order = np.argsort(-weights, kind="stable")
+    first, second, weights = first[order], second[order], weights[order]
+
+    for a, c, w in zip(first.tolist(), second.tolist(), weights.tolist()):
+        if partner[a] < 0 and partner[c] < 0:
+            partner[a], partner[c] = c, a
+            weight[a] = weight[c] = w
+
+    for _ in range(rounds):
+        if not _improve(matrix, first, second, weights, partner, weight):
+            break
+
+
+def _improve(
+    matrix: AnswerMatrix,
+    first: np.ndarray,
+    second: np.ndarray,
+    weights: np.ndarray,
+    partner: np.ndarray,
+    weight: np.ndarray,
+) -> bool:
+    """One pass of 2-swaps along candidate edges; returns whether anything changed"""
+    a, c = first, second
+    b, d = partner[a], partner[c]
+    possible = (b >= 0) & (d >= 0) & (b != c)
+    a, b, c, d, ac = a[possible], b[possible], c[possible], d[possible], weights[possible]
+    if len(a) == 0:
+        return False
+
+    bd = matrix.pair_hundredths(b, d)
+    gain = ac + bd - weight[a] - weight[c]
+    better = (bd >= 0) & (gain > 0)
+    if not better.any():
+        return False
+
+    changed = np.zeros(len(partner), dtype=bool)
+    order = np.flatnonzero(better)[np.argsort(-gain[better], kind="stable")]
+    for i in order.tolist():
+        quad = (a[i], b[i], c[i], d[i])
+        if changed[list(quad)].any():
+            continue
+        changed[list(quad)] = True
+        partner[a[i]], partner[c[i]] = c[i], a[i]
+        partner[b[i]], partner[d[i]] = d[i], b[i]
+        weight[a[i]] = weight[c[i]] = ac[i]
+        weight[b[i]] = weight[d[i]] = bd[i]
+    return True
@@ -0,0 +1,94 @@
+"""
+Leader election through a lease row.
+
+Every process that may run scheduled jobs (each API worker, run_scheduler.py)
+competes for one row of scheduler_leases. Whoever holds the unexpired lease
+is the leader and runs the jobs; the rest skip them. The leader renews every
+third of the lease. If it dies, its lease runs out and the next renewal
+attempt of any other process takes over; a clean shutdown releases it
+straight away.
+
+Like the shard leases of matching_runs, expiry is judged by each process's
+own clock against the stored UTC time. To keep two leaders apart despite
+small skews, a process stops treating itself as leader a sixth of the lease
+before its lease runs out unless it has renewed by then.
+"""
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.matching_runs import utcnow, worker_name
+from app.models import SchedulerLease
+from typing import Optional
+
+
+class LeaderLease:
+    """Leadership of one named role, held through its scheduler_leases row"""
+
+    def __init__(self, name: str, lease_seconds: float = 30, owner: Optional[str] = None):
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.owner = owner or worker_name()
+        self._valid_until = 0.0  # time.monotonic() deadline of our own leadership
+
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self._valid_until
+
+    def renew(self, db: Session) -> Optional[datetime]:
+        """
+        Acquire or extend the lease. When this call took it over from another
+        owner, returns the last time that owner was known alive (jobs due
+        since then may not have run); None otherwise.
+        """
+        started = time.monotonic()
+        was_leader = self.is_leader
+        now = utcnow()
+        previous = db.execute(
+            select(SchedulerLease.owner, SchedulerLease.renewed_at).filter(SchedulerLease.name == self.name)
+        ).first()
+        if previous is None:
+            db.add(SchedulerLease(name=self.name, owner=self.owner, lease_expires_at=now + timedelta(seconds=self.lease_seconds), renewed_at=now))
+            try:
+                db.commit()
+                won = True
+            except IntegrityError:
+                # Another process created it first
+                db.rollback()
+                won = False
+        else:
+            # Only one of several processes racing for an expired lease matches the WHERE clause
+            won = bool(db.execute(
+                update(SchedulerLease)
+                .where(
+                    SchedulerLease.name == self.name,
+                    or_(SchedulerLease.owner == self.owner, SchedulerLease.owner.is_(None), SchedulerLease.lease_expires_at < now),
+                )
+                .values(owner=self.owner, lease_expires_at=now + timedelta(seconds=self.lease_seconds), renewed_at=now)
+                .execution_options(synchronize_session=False)
+            ).rowcount)
+            db.commit()
+
+        if not won:
+            self._valid_until = 0.0
+            if was_leader:
+                print(f"Lost the {self.name} lease")
+            return None
+        self._valid_until = started + self.lease_seconds * 5 / 6
+        if not was_leader:
+            print(f"{self.owner} now leads {self.name}")
+        if previous is not None and previous.owner != self.owner:
+            return previous.renewed_at
+        return None
+
+    def release(self, db: Session):
+        """Give the lease up so another process can take over at once"""
+        self._valid_until = 0.0
+        db.execute(
+            update(SchedulerLease)
+            .where(SchedulerLease.name == self.name, SchedulerLease.owner == self.owner)
+            .values(owner=None, lease_expires_at=None, renewed_at=utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
@@ -1,13 +1,15 @@
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine, Base
+from app.config import settings
 from app.routers import users, questions, answers, matches, auth
-from app.scheduler import scheduler
-
-# Create database tables
-Base.metadata.create_all(bind=engine)
+from app.startup import lifespan
 
-app = FastAPI(title="Nemesis App", version="1.0.0")
+# Migrations, warm-up and the scheduler run at startup, not on import (see app.startup)
+app = FastAPI(title="Nemesis App", version="1.0.0", lifespan=lifespan(IMPORT_STARTED))
 
 # CORS middleware
 app.add_middleware(
@@ -18,20 +20,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Include routers
+# Include routers (the hot ones on AsyncSession when database_async is set)
+if settings.database_async:
+    from app.routers import async_auth, async_questions, async_answers, async_matches
+    # Registered before auth.router so its /me wins; login and logout stay sync
+    app.include_router(async_auth.router, prefix="/api/auth", tags=["auth"])
+    questions_router, answers_router, matches_router = async_questions.router, async_answers.router, async_matches.router
+else:
+    questions_router, answers_router, matches_router = questions.router, answers.router, matches.router
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(users.router, prefix="/api/users", tags=["users"])
-app.include_router(questions.router, prefix="/api/questions", tags=["questions"])
-app.include_router(answers.router, prefix="/api/answers", tags=["answers"])
-app.include_router(matches.router, prefix="/api/matches", tags=["matches"])
-
-# Start scheduler
-scheduler.start()
+app.include_router(questions_router, prefix="/api/questions", tags=["questions"])
+app.include_router(answers_router, prefix="/api/answers", tags=["answers"])
+app.include_router(matches_router, prefix="/api/matches", tags=["matches"])
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Nemesis App - Find Your Enemy!"}
-
-@app.on_event("shutdown")
-def shutdown_event():
-    scheduler.shutdown()
@@ -0,0 +1,558 @@
+"""
+Resumable, sharded monthly matching.
+
+A run (one per month by default) splits the user id space into shards
+recorded in the matching_shards table. Any number of worker processes, on any
+number of hosts sharing the database, claim shards under a lease, renew it
+with heartbeats while they work, and give it up when they are done. When a
+worker dies, its lease runs out and another worker takes the shard over.
+Running the same run again only touches the shards that aren't done.
+
+A shard goes pending -> matched -> done. Its Match rows are inserted in the
+same transaction that moves it to matched, and that transition only succeeds
+for the current lease holder, so each user gets exactly one Match per run
+however often a shard is retried. Emails go out afterwards and are marked row
+by row, so a retried shard only sends the ones still unsent; a crash between
+sending and marking can repeat an email, never a match.
+
+A shard scores every one of its users from the answer matrix the run
+loaded, as one blocked batch. The materialized best_enemies entries are not
+reused: they may lag behind that matrix (offers still pending) or leave out
+users an answer cache evicted, and the monthly result must be exact.
+
+Global pairing (matching_pairing = "global") pairs users across shards, so
+it can't be computed shard by shard, and workers computing it each from
+their own matrix could disagree. Before claiming shards, one worker takes a
+lease on the run's pairing, computes it and stores it in matching_pairs in
+the transaction that sets paired_at; the others wait for it (or take over
+the lease if it lapses). Every shard then reads its users' enemies from
+that one stored result. The pairs are deleted once the run is done.
+"""
+import asyncio
+import functools
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select, Update
+from app.config import settings
+from app.database import ReadSessionLocal
+from app.models import Match, MatchingPair, MatchingRun, MatchingShard, User
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from app.smtp_pool import SMTPPool
+
+Enemies = Dict[int, Tuple[int, float]]
+
+class LeaseLost(Exception):
+    """Another worker took over the shard"""
+
+
+def utcnow() -> datetime:
+    """Naive UTC time, the form lease times are stored in"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def monthly_run_key(now: Optional[datetime] = None) -> str:
+    return (now or utcnow()).strftime("%Y-%m")
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def start_run(db: Session, key: str, shard_size: int) -> MatchingRun:
+    """Get the run with this key, creating it and its shards on first use"""
+    run = db.query(MatchingRun).filter(MatchingRun.key == key).first()
+    if run is not None:
+        return run
+
+    first_id, last_id = db.query(func.min(User.id), func.max(User.id)).one()
+    # Whole seconds, since MySQL DATETIME drops the fraction and the stamp is matched on
+    run = MatchingRun(key=key, matched_at=utcnow().replace(microsecond=0))
+    if first_id is not None:
+        run.shards = [
+            MatchingShard(first_user_id=start, last_user_id=min(start + shard_size - 1, last_id))
+            for start in range(first_id, last_id + 1, shard_size)
+        ]
+    db.add(run)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another worker created it first
+        db.rollback()
+        run = db.query(MatchingRun).filter(MatchingRun.key == key).one()
+    return run
+
+
+def _claimable(run_id: int, now: datetime):
+    return (
+        MatchingShard.run_id == run_id,
+        MatchingShard.status != "done",
+        or_(MatchingShard.owner.is_(None), MatchingShard.lease_expires_at < now),
+    )
+
+
+def claimable_shards_query(run_id: int, now: datetime, limit: int = 16) -> Select:
+    """Unfinished shards nobody holds (or whose holder went quiet), in range order read straight off uq_run_shard"""
+    return select(MatchingShard.id).where(*_claimable(run_id, now)).order_by(MatchingShard.first_user_id).limit(limit)
+
+
+def claim_shard(db: Session, run: MatchingRun, owner: str, lease_seconds: int) -> Optional[MatchingShard]:
+    """Lease an unfinished shard that nobody holds, or whose holder went quiet"""
+    now = utcnow()
+    claimable = _claimable(run.id, now)
+    for shard_id in db.scalars(claimable_shards_query(run.id, now)).all():
+        # Only one of several workers racing for the same shard matches the WHERE clause
+        claimed = db.execute(
+            update(MatchingShard)
+            .where(MatchingShard.id == shard_id, *claimable)
+            .values(
+                owner=owner,
+                lease_expires_at=now + timedelta(seconds=lease_seconds),
+                heartbeat_at=now,
+                attempts=MatchingShard.attempts + 1,
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        if claimed:
+            return db.get(MatchingShard, shard_id)
+    return None
+
+
+def renew_lease(db: Session, shard_id: int, owner: str, lease_seconds: int) -> bool:
+    """Extend a lease; False if the shard now belongs to someone else"""
+    now = utcnow()
+    renewed = db.execute(
+        update(MatchingShard)
+        .where(MatchingShard.id == shard_id, MatchingShard.owner == owner)
+        .values(lease_expires_at=now + timedelta(seconds=lease_seconds), heartbeat_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return bool(renewed)
+
+
+def release_shard(db: Session, shard_id: int, owner: str, status: Optional[str] = None):
+    """Give up a lease, optionally moving the shard to a new status"""
+    values = {"owner": None, "lease_expires_at": None}
+    if status is not None:
+        values["status"] = status
+    db.execute(
+        update(MatchingShard)
+        .where(MatchingShard.id == shard_id, MatchingShard.owner == owner)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def claim_pairing(db: Session, run: MatchingRun, owner: str, lease_seconds: int) -> bool:
+    """Lease the computation of a run's global pairing, if it isn't stored and nobody (alive) holds it"""
+    now = utcnow()
+    claimed = db.execute(
+        update(MatchingRun)
+        .where(
+            MatchingRun.id == run.id,
+            MatchingRun.paired_at.is_(None),
+            or_(MatchingRun.pairing_owner.is_(None), MatchingRun.pairing_lease_expires_at < now),
+        )
+        .values(pairing_owner=owner, pairing_lease_expires_at=now + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return bool(claimed)
+
+
+def renew_pairing_lease(db: Session, run_id: int, owner: str, lease_seconds: int) -> bool:
+    """Extend the pairing lease; False if someone else now holds it"""
+    renewed = db.execute(
+        update(MatchingRun)
+        .where(MatchingRun.id == run_id, MatchingRun.pairing_owner == owner)
+        .values(pairing_lease_expires_at=utcnow() + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return bool(renewed)
+
+
+def release_pairing(db: Session, run_id: int, owner: str):
+    db.execute(
+        update(MatchingRun)
+        .where(MatchingRun.id == run_id, MatchingRun.pairing_owner == owner)
+        .values(pairing_owner=None, pairing_lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def store_pairing(db: Session, run: MatchingRun, owner: str, enemies: Enemies) -> bool:
+    """Write a run's pairing and mark it paired, all in one transaction; False if the lease was lost"""
+    taken = db.execute(
+        update(MatchingRun)
+        .where(MatchingRun.id == run.id, MatchingRun.pairing_owner == owner, MatchingRun.paired_at.is_(None))
+        .values(paired_at=utcnow(), pairing_owner=None, pairing_lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not taken:
+        db.rollback()
+        return False
+    rows = [
+        {"run_id": run.id, "user_id": user_id, "enemy_id": enemy_id, "match_score": match_score}
+        for user_id, (enemy_id, match_score) in enemies.items()
+    ]
+    for start in range(0, len(rows), settings.matching_chunk_size):
+        db.execute(insert(MatchingPair), rows[start:start + settings.matching_chunk_size])
+    db.commit()
+    return True
+
+
+def pairs_query(run_id: int, first_user_id: int, last_user_id: int) -> Select:
+    """A run's stored pairing for the users of one shard, read off the primary key"""
+    return select(MatchingPair.user_id, MatchingPair.enemy_id, MatchingPair.match_score).where(
+        MatchingPair.run_id == run_id,
+        MatchingPair.user_id >= first_user_id,
+        MatchingPair.user_id <= last_user_id,
+    )
+
+
+def finish_run(db: Session, run: MatchingRun) -> bool:
+    """Mark the run done once every shard is; returns whether it is done"""
+    remaining = db.query(func.count(MatchingShard.id)).filter(
+        MatchingShard.run_id == run.id, MatchingShard.status != "done"
+    ).scalar()
+    if remaining:
+        return False
+    db.execute(
+        update(MatchingRun)
+        .where(MatchingRun.id == run.id, MatchingRun.status != "done")
+        .values(status="done", finished_at=utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    # Every shard has written its matches, so the stored pairing is no longer read
+    db.execute(delete(MatchingPair).where(MatchingPair.run_id == run.id))
+    db.commit()
+    return True
+
+
+async def run_worker(db: Session, key: str, owner: Optional[str] = None) -> int:
+    """
+    Work on a run until all of its shards are done, waiting on shards other
+    workers hold in case their leases lapse. Returns how many shards this
+    worker finished.
+    """
+    from app.email_service import create_smtp_pool, email_configured
+
+    owner = owner or worker_name()
+    lease_seconds = settings.matching_lease_seconds
+    run = start_run(db, key, settings.matching_shard_size)
+    scorer = _RunScorer()
+    pool = create_smtp_pool() if email_configured() else None
+    finished = 0
+
+    if settings.matching_pairing == "global":
+        await _pair_run(db, run, owner, lease_seconds, scorer)
+    try:
+        while True:
+            shard = claim_shard(db, run, owner, lease_seconds)
+            if shard is None:
+                if finish_run(db, run):
+                    break
+                await asyncio.sleep(max(1, lease_seconds / 10))
+                continue
+
+            lost = asyncio.Event()
+            renew = functools.partial(renew_lease, shard_id=shard.id, owner=owner, lease_seconds=lease_seconds)
+            heartbeat = asyncio.create_task(_heartbeat(db, renew, lease_seconds, lost))
+            try:
+                await _process_shard(db, run, shard, owner, scorer, pool, lost)
+                finished += 1
+            except LeaseLost:
+                db.rollback()
+                print(f"Lost the lease on users {shard.first_user_id}-{shard.last_user_id} of run {key}")
+            except BaseException:
+                db.rollback()
+                release_shard(db, shard.id, owner)
+                raise
+            finally:
+                heartbeat.cancel()
+    finally:
+        if pool is not None:
+            await pool.close()
+            print(pool.summary())
+
+    print(f"Matching run {key}: {finished} shards finished by {owner}")
+    return finished
+
+
+async def _pair_run(db: Session, run: MatchingRun, owner: str, lease_seconds: int, scorer: "_RunScorer"):
+    """Make sure the run's global pairing is stored, computing it here unless another worker is"""
+    while True:
+        db.refresh(run)
+        if run.paired_at is not None or run.status == "done":
+            return
+        if not claim_pairing(db, run, owner, lease_seconds):
+            await asyncio.sleep(max(1, lease_seconds / 10))
+            continue
+
+        lost = asyncio.Event()
+        renew = functools.partial(renew_pairing_lease, run_id=run.id, owner=owner, lease_seconds=lease_seconds)
+        heartbeat = asyncio.create_task(_heartbeat(db, renew, lease_seconds, lost))
+        try:
+            paired = await scorer.pair(db)
+        except BaseException:
+            db.rollback()
+            release_pairing(db, run.id, owner)
+            raise
+        finally:
+            heartbeat.cancel()
+        if not lost.is_set() and store_pairing(db, run, owner, paired):
+            print(f"Stored the global pairing of run {run.key}: {len(paired)} users")
+        # Otherwise another worker took the lease over; go round and read what it stores
+
+
+async def _heartbeat(db: Session, renew: Callable[[Session], bool], lease_seconds: int, lost: asyncio.Event):
+    """Renew a lease (renew(session) is False once it's lost) until cancelled, on a session of its own"""
+    with Session(db.get_bind()) as heartbeat_db:
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            if not renew(heartbeat_db):
+                lost.set()
+                return
+
+
+class _RunScorer:
+    """This process's enemies for a run, loaded on first use"""
+
+    def __init__(self):
+        self._matrix = None
+        self._stamps: Optional[Dict[int, int]] = None  # answers_version of every user, when the matrix is as new
+
+    def _load(self):
+        from app.answer_matrix import AnswerMatrix
+        from app.answer_store import answer_store
+        from app.pair_scores import versions_query
+
+        if self._matrix is None and answer_store is not None:
+            # Zero-copy view of the shared store, once it holds every committed change; pool workers map the same file
+            with ReadSessionLocal() as read_db:
+                if answer_store.catch_up(read_db):
+                    self._matrix = answer_store.matrix()
+        if self._matrix is None:
+            # The big scan goes to the read replica; the run's own tables stay on the primary
+            with ReadSessionLocal() as read_db:
+                # Stamps on both sides of the scan: a user whose version moved in between may have
+                # been read at either one, so only unchanged users' scores are worth caching
+                before = dict(read_db.execute(versions_query()).all())
+                self._matrix = AnswerMatrix.from_db(read_db)
+                after = dict(read_db.execute(versions_query()).all())
+                self._stamps = {user_id: version for user_id, version in after.items() if before.get(user_id) == version}
+        return self._matrix
+
+    def _cache_scores(self, db: Session, fresh: Enemies):
+        """Hand freshly scored pairs to the pair score cache (the store's answers carry no stamps)"""
+        from app.pair_scores import pair_score_cache
+
+        if self._stamps is None:
+            return
+        pair_score_cache.put_many(db, (
+            (user_id, enemy_id, self._stamps[user_id], self._stamps[enemy_id], match_score)
+            for user_id, (enemy_id, match_score) in fresh.items()
+            if user_id in self._stamps and enemy_id in self._stamps
+        ))
+
+    async def pair(self, db: Session) -> Enemies:
+        """The global pairing of every user, for _pair_run to store"""
+        from app.global_pairing import pair_globally
+
+        loop = asyncio.get_running_loop()
+        paired, report = await loop.run_in_executor(
+            None,
+            functools.partial(
+                pair_globally,
+                await loop.run_in_executor(None, self._load),
+                candidates=settings.matching_pairing_candidates,
+                block_size=settings.matching_block_size,
+                workers=settings.matching_workers,
+            ),
+        )
+        print(report.summary())
+        self._cache_scores(db, paired)
+        db.commit()
+        return paired
+
+    async def enemies(self, db: Session, run: MatchingRun, first_user_id: int, last_user_id: int) -> Enemies:
+        from app.batch_matching import find_all_enemies
+
+        if settings.matching_pairing == "global":
+            # Pairs span shards: every shard reads the one pairing stored for the run
+            rows = db.execute(pairs_query(run.id, first_user_id, last_user_id)).all()
+            return {user_id: (enemy_id, match_score) for user_id, enemy_id, match_score in rows}
+
+        loop = asyncio.get_running_loop()
+        scored = await loop.run_in_executor(
+            None,
+            functools.partial(
+                find_all_enemies,
+                await loop.run_in_executor(None, self._load),
+                block_size=settings.matching_block_size,
+                workers=settings.matching_workers,
+                user_range=(first_user_id, last_user_id),
+            ),
+        )
+        self._cache_scores(db, scored)
+        db.commit()
+        return scored
+
+
+async def _process_shard(
+    db: Session,
+    run: MatchingRun,
+    shard: MatchingShard,
+    owner: str,
+    scorer: _RunScorer,
+    pool: Optional["SMTPPool"],
+    lost: asyncio.Event,
+):
+    if shard.status == "pending":
+        enemies = await scorer.enemies(db, run, shard.first_user_id, shard.last_user_id)
+        if lost.is_set():
+            raise LeaseLost()
+        _insert_matches(db, run, shard, owner, enemies, email_sent=pool is None)
+    if pool is not None:
+        await _send_emails(db, run, shard, pool, lost)
+    release_shard(db, shard.id, owner, status="done")
+
+
+def _insert_matches(db: Session, run: MatchingRun, shard: MatchingShard, owner: str, enemies: Enemies, email_sent: bool):
+    """Write a shard's Match rows and mark it matched, all in one transaction"""
+    # Flip the status first: a worker that lost its lease matches nothing here and writes nothing
+    taken = db.execute(
+        update(MatchingShard)
+        .where(MatchingShard.id == shard.id, MatchingShard.owner == owner, MatchingShard.status == "pending")
+        .values(status="matched")
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not taken:
+        raise LeaseLost()
+
+    count = 0
+    for chunk in _user_chunks(db, settings.matching_chunk_size, shard.first_user_id, shard.last_user_id):
+        users = _with_enemies(db, chunk, enemies)
+        rows = []
+        for user in chunk:
+            enemy_id, match_score = enemies.get(user.id, (None, 0.0))
+            if enemy_id and enemy_id in users:
+                rows.append({
+                    "user_id": user.id,
+                    "enemy_id": enemy_id,
+                    "match_score": match_score,
+                    "matched_at": run.matched_at,
+                    "email_sent": email_sent,
+                })
+        if rows:
+            db.execute(insert(Match), rows)
+            count += len(rows)
+        if email_sent:
+            for row in rows:
+                print(f"Email not configured. Would send match notification to {users[row['user_id']].email}")
+
+    db.execute(
+        update(MatchingShard)
+        .where(MatchingShard.id == shard.id)
+        .values(matches=count)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def unsent_matches_query(matched_at: datetime, after_user_id: int, last_user_id: int, limit: int) -> Select:
+    """A run's matches still awaiting their email, for users in (after_user_id, last_user_id]"""
+    return (
+        select(Match.user_id, Match.enemy_id, Match.match_score)
+        .filter(
+            Match.matched_at == matched_at,
+            Match.email_sent == False,
+            Match.user_id > after_user_id,
+            Match.user_id <= last_user_id,
+        )
+        .order_by(Match.user_id)
+        .limit(limit)
+    )
+
+
+async def _send_emails(db: Session, run: MatchingRun, shard: MatchingShard, pool: "SMTPPool", lost: asyncio.Event):
+    """Send the shard's still-unsent match emails, chunk by chunk"""
+    from app.email_service import send_match_email
+    from app.smtp_pool import fan_out
+
+    last_user_id = shard.first_user_id - 1
+    while True:
+        if lost.is_set():
+            raise LeaseLost()
+        chunk = db.execute(
+            unsent_matches_query(run.matched_at, last_user_id, shard.last_user_id, settings.matching_chunk_size)
+        ).all()
+        if not chunk:
+            return
+        last_user_id = chunk[-1].user_id
+
+        ids = {match.user_id for match in chunk} | {match.enemy_id for match in chunk}
+        users = {user.id: user for user in db.query(User.id, User.username, User.email).filter(User.id.in_(ids))}
+
+        sent = []
+        async def notify(match):
+            if await send_match_email(users[match.user_id], users[match.enemy_id], match.match_score, pool):
+                sent.append(match.user_id)
+
+        await fan_out(
+            (functools.partial(notify, match) for match in chunk if match.user_id in users and match.enemy_id in users),
+            settings.smtp_concurrency,
+        )
+
+        # Mark emails as sent
+        if sent:
+            db.execute(mark_sent_statement(sent, run.matched_at).execution_options(synchronize_session=False))
+            db.commit()
+
+
+def mark_sent_statement(user_ids: List[int], matched_at: datetime) -> Update:
+    return update(Match).where(Match.user_id.in_(user_ids), Match.matched_at == matched_at).values(email_sent=True)
+
+
+def _user_chunks(db: Session, chunk_size: int, first_user_id: int, last_user_id: int) -> Iterator[List]:
+    """Users in an id range as (id, username, email) rows in id order, chunk_size at a time"""
+    last_id = first_user_id - 1
+    while True:
+        chunk = db.execute(user_chunk_query(last_id, last_user_id, chunk_size)).all()
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1].id
+
+
+def user_chunk_query(after_user_id: int, last_user_id: int, limit: int) -> Select:
+    """Users in (after_user_id, last_user_id] as (id, username, email), in id order"""
+    return (
+        select(User.id, User.username, User.email)
+        .where(User.id > after_user_id, User.id <= last_user_id)
+        .order_by(User.id)
+        .limit(limit)
+    )
+
+
+def _with_enemies(db: Session, chunk: List, enemies: Enemies) -> Dict[int, object]:
+    """The chunk's users plus their enemies, by id"""
+    users = {user.id: user for user in chunk}
+    missing = {enemies[user.id][0] for user in chunk if user.id in enemies} - users.keys()
+    if missing:
+        users.update(
+            (user.id, user)
+            for user in db.query(User.id, User.username, User.email).filter(User.id.in_(missing))
+        )
+    return users
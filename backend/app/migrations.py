@@ -0,0 +1,166 @@
+"""
+Versioned schema migrations.
+
+The schema used to come from Base.metadata.create_all alone, which creates
+missing tables but never touches existing ones, so databases created by an
+older release never picked up new indexes. Migrations are numbered
+functions run once each, in order, with the applied versions recorded in
+schema_migrations.
+
+An empty database is built straight from the models and stamped with the
+latest version. A database created before this module existed (tables but
+no schema_migrations) replays every migration, so each one must be
+idempotent against a schema that create_all may already have built; use
+checkfirst/inspection rather than bare DDL.
+"""
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+from app.database import Base
+from app import models  # Registers every table on Base.metadata
+from app import question_stats
+from typing import Callable, List, Tuple
+
+# Kept out of Base.metadata so create_all never builds it unstamped
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _baseline(connection: Connection):
+    """Tables from before versioning; create_all only adds the missing ones"""
+    Base.metadata.create_all(connection)
+
+
+def _create_indexes(*names: str) -> Callable[[Connection], None]:
+    def migration(connection: Connection):
+        indexes = {index.name: index for table in Base.metadata.tables.values() for index in table.indexes}
+        for name in names:
+            indexes[name].create(connection, checkfirst=True)
+    return migration
+
+
+def _question_answer_counts(connection: Connection):
+    models.QuestionAnswerCount.__table__.create(connection, checkfirst=True)
+    question_stats.rebuild(connection)
+
+
+def _best_enemies(connection: Connection):
+    models.BestEnemy.__table__.create(connection, checkfirst=True)
+
+
+def _pair_scores(connection: Connection):
+    """users.answers_version (create_all never adds columns to existing tables) and the persisted pair scores"""
+    if "answers_version" not in {column["name"] for column in inspect(connection).get_columns("users")}:
+        connection.execute(text("ALTER TABLE users ADD COLUMN answers_version INTEGER NOT NULL DEFAULT 0"))
+    models.PairScore.__table__.create(connection, checkfirst=True)
+
+
+def _enemy_jobs(connection: Connection):
+    models.EnemyJob.__table__.create(connection, checkfirst=True)
+
+
+def _scheduler_leases(connection: Connection):
+    models.SchedulerLease.__table__.create(connection, checkfirst=True)
+
+
+def _answer_sequence(connection: Connection):
+    """
+    answers_version becomes a global sequence: start it above every per-user
+    counter stamped so far, so no new stamp can repeat an old one
+    """
+    _create_indexes("ix_users_answers_version")(connection)
+    highest = connection.scalar(select(func.max(models.User.answers_version))) or 0
+    cache_versions = models.CacheVersion.__table__
+    current = connection.scalar(select(cache_versions.c.version).where(cache_versions.c.name == "answers"))
+    if current is None:
+        connection.execute(cache_versions.insert().values(name="answers", version=highest))
+    elif current < highest:
+        connection.execute(cache_versions.update().where(cache_versions.c.name == "answers").values(version=highest))
+
+
+def _best_enemy_offers(connection: Connection):
+    """Answer changes were offered to best enemies inline until now, so every change so far counts as offered"""
+    cache_versions = models.CacheVersion.__table__
+    sequence = connection.scalar(select(cache_versions.c.version).where(cache_versions.c.name == "answers")) or 0
+    if connection.scalar(select(cache_versions.c.version).where(cache_versions.c.name == "best_enemy_offers")) is None:
+        connection.execute(cache_versions.insert().values(name="best_enemy_offers", version=sequence))
+
+
+def _matching_pairs(connection: Connection):
+    """The pairing lease columns on matching_runs and the table the pairing is stored in"""
+    columns = {column["name"] for column in inspect(connection).get_columns("matching_runs")}
+    for name, kind in (("pairing_owner", "VARCHAR(255)"), ("pairing_lease_expires_at", "DATETIME"), ("paired_at", "DATETIME")):
+        if name not in columns:
+            connection.execute(text(f"ALTER TABLE matching_runs ADD COLUMN {name} {kind}"))
+    models.MatchingPair.__table__.create(connection, checkfirst=True)
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "baseline", _baseline),
+    (2, "indexes for match history, email sends and per-question scans", _create_indexes(
+        "ix_matches_user_matched",
+        "ix_matches_run_unsent",
+        "ix_answers_question_value",
+    )),
+    (3, "per-question answer counters", _question_answer_counts),
+    (4, "materialized best enemies", _best_enemies),
+    (5, "answer versions and persisted pair scores", _pair_scores),
+    (6, "background find-enemy jobs", _enemy_jobs),
+    (7, "scheduler leader lease", _scheduler_leases),
+    (8, "answer versions from one global sequence", _answer_sequence),
+    (9, "best enemy offers off the request path", _best_enemy_offers),
+    (10, "global pairing stored once per run", _matching_pairs),
+    (11, "index for deactivated questions", _create_indexes("ix_questions_active")),
+]
+
+HEAD = MIGRATIONS[-1][0]
+
+
+def applied_versions(engine: Engine) -> List[int]:
+    if not inspect(engine).has_table(schema_migrations.name):
+        return []
+    with engine.connect() as connection:
+        return sorted(connection.scalars(select(schema_migrations.c.version)))
+
+
+def _record(connection: Connection, version: int, name: str):
+    connection.execute(schema_migrations.insert().values(version=version, name=name, applied_at=datetime.utcnow()))
+
+
+def migrate(engine: Engine) -> List[int]:
+    """Bring the database up to HEAD; returns the versions applied by this call"""
+    fresh = not inspect(engine).get_table_names()
+    schema_migrations.create(engine, checkfirst=True)
+
+    if fresh:
+        # Nothing to upgrade: build the current schema and mark every migration as done
+        try:
+            with engine.begin() as connection:
+                Base.metadata.create_all(connection)
+                for version, name, _ in MIGRATIONS:
+                    _record(connection, version, name)
+            return [version for version, _, _ in MIGRATIONS]
+        except IntegrityError:
+            pass  # Another process built it at the same moment; check what's left below
+
+    done = set(applied_versions(engine))
+    applied = []
+    for version, name, migration in MIGRATIONS:
+        if version in done:
+            continue
+        try:
+            with engine.begin() as connection:
+                migration(connection)
+                _record(connection, version, name)
+        except IntegrityError:
+            # Another process recorded this version first; its DDL is what we'd have run
+            continue
+        print(f"Applied migration {version}: {name}")
+        applied.append(version)
+    return applied
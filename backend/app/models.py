@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Text, Boolean, UniqueConstraint
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Text, Boolean, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -12,11 +12,16 @@ class User(Base):
     password_hash = Column(String(255), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    answers_version = Column(Integer, nullable=False, default=0, server_default="0")  # Answer sequence value of the last answer write
     
     # Relationships
     answers = relationship("Answer", back_populates="user", cascade="all, delete-orphan")
     matches = relationship("Match", foreign_keys="Match.user_id", back_populates="user")
     enemy_matches = relationship("Match", foreign_keys="Match.enemy_id", back_populates="enemy")
+    
+    __table_args__ = (
+        Index('ix_users_answers_version', 'answers_version'),  # Users whose answers changed since a point of the sequence
+    )
 
 class Question(Base):
     __tablename__ = "questions"
@@ -28,6 +33,10 @@ class Question(Base):
     
     # Relationships
     answers = relationship("Answer", back_populates="question", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index('ix_questions_active', 'is_active'),  # Deactivated questions, read by answer cache catch-ups after a catalog change
+    )
 
 class Answer(Base):
     __tablename__ = "answers"
@@ -43,11 +52,47 @@ class Answer(Base):
     user = relationship("User", back_populates="answers")
     question = relationship("Question", back_populates="answers")
     
-    # Unique constraint: one answer per user per question
+    # Unique constraint: one answer per user per question (also serves per-user lookups)
     __table_args__ = (
         UniqueConstraint('user_id', 'question_id', name='uq_user_question'),
+        Index('ix_answers_question_value', 'question_id', 'answer_value'),  # Per-question scans and distributions
+    )
+
+class QuestionAnswerCount(Base):
+    __tablename__ = "question_answer_counts"
+    
+    # One row per (question, value) bucket, kept in step with answers by the answer routes
+    question_id = Column(Integer, ForeignKey("questions.id"), primary_key=True)
+    answer_value = Column(Integer, primary_key=True)  # 1-10
+    count = Column(Integer, nullable=False, default=0)
+
+class BestEnemy(Base):
+    __tablename__ = "best_enemies"
+    
+    # Each user's current best enemy, materialized; dirty rows are recomputed on read or by the sweeper
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    enemy_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # NULL = nobody shares a question with them
+    match_score = Column(Float, nullable=True)
+    dirty = Column(Boolean, nullable=False, default=True)
+    version = Column(Integer, nullable=False, default=0)  # Bumped on every change, so recomputes can't overwrite newer news
+    computed_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        Index('ix_best_enemies_enemy', 'enemy_id'),  # Users whose enemy just changed their answers
+        Index('ix_best_enemies_dirty', 'dirty', 'user_id'),  # The sweeper's work queue
+        Index('ix_best_enemies_score', 'match_score'),  # Lowest best score, the bar a changed user must clear
     )
 
+class PairScore(Base):
+    __tablename__ = "pair_scores"
+    
+    # Persisted pair score cache; a row is only valid while both users' answers_version still match
+    user1_id = Column(Integer, ForeignKey("users.id"), primary_key=True)  # The lower id of the pair
+    user2_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    version1 = Column(Integer, nullable=False)
+    version2 = Column(Integer, nullable=False)
+    match_score = Column(Float, nullable=False)
+
 class Match(Base):
     __tablename__ = "matches"
     
@@ -61,3 +106,87 @@ class Match(Base):
     # Relationships
     user = relationship("User", foreign_keys=[user_id], back_populates="matches")
     enemy = relationship("User", foreign_keys=[enemy_id], back_populates="enemy_matches")
+    
+    __table_args__ = (
+        Index('ix_matches_user_matched', 'user_id', 'matched_at', 'id'),  # Match history, newest first
+        Index('ix_matches_run_unsent', 'matched_at', 'email_sent', 'user_id'),  # A run's unsent emails, by user
+    )
+
+class MatchingRun(Base):
+    __tablename__ = "matching_runs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String(64), unique=True, nullable=False)  # e.g. "2024-05" for that month's run
+    matched_at = Column(DateTime, nullable=False)  # Stamped on every Match row the run writes
+    status = Column(String(16), default="running")  # running, done
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime)
+    # Global pairing, computed by one worker under this lease and stored in matching_pairs
+    pairing_owner = Column(String(255))
+    pairing_lease_expires_at = Column(DateTime)  # UTC
+    paired_at = Column(DateTime)  # UTC; set in the transaction that writes the pairs
+    
+    # Relationships
+    shards = relationship("MatchingShard", back_populates="run", cascade="all, delete-orphan")
+
+class MatchingShard(Base):
+    __tablename__ = "matching_shards"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, ForeignKey("matching_runs.id"), nullable=False)
+    first_user_id = Column(Integer, nullable=False)  # Inclusive user id range
+    last_user_id = Column(Integer, nullable=False)
+    status = Column(String(16), default="pending")  # pending, matched (rows written), done (emails sent)
+    owner = Column(String(255))  # Worker holding the lease, if any
+    lease_expires_at = Column(DateTime)  # UTC
+    heartbeat_at = Column(DateTime)
+    attempts = Column(Integer, default=0)
+    matches = Column(Integer, default=0)
+    
+    # Relationships
+    run = relationship("MatchingRun", back_populates="shards")
+    
+    __table_args__ = (
+        UniqueConstraint('run_id', 'first_user_id', name='uq_run_shard'),
+    )
+
+class MatchingPair(Base):
+    __tablename__ = "matching_pairs"
+    
+    # A run's global pairing, one row per user with an enemy; shards read their id range
+    run_id = Column(Integer, ForeignKey("matching_runs.id"), primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    enemy_id = Column(Integer, nullable=False)
+    match_score = Column(Float, nullable=False)
+
+class EnemyJob(Base):
+    __tablename__ = "enemy_jobs"
+    
+    # Background find-enemy requests, pollable from any process
+    id = Column(String(32), primary_key=True)  # uuid4 hex
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    approximate = Column(Boolean, nullable=True)  # As requested; NULL = the matching_approximate setting
+    status = Column(String(16), nullable=False, default="queued")  # queued, running, done, failed
+    match_id = Column(Integer, ForeignKey("matches.id"), nullable=True)  # Set once done
+    error = Column(String(255), nullable=True)  # Set once failed
+    created_at = Column(DateTime, nullable=False)  # UTC
+    finished_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index('ix_enemy_jobs_user_created', 'user_id', 'created_at'),  # A user's in-flight and recent jobs
+    )
+
+class SchedulerLease(Base):
+    __tablename__ = "scheduler_leases"
+    
+    # One row per leader-elected role; whoever holds the unexpired lease runs the scheduled jobs
+    name = Column(String(64), primary_key=True)  # e.g. "scheduler"
+    owner = Column(String(255), nullable=True)  # NULL = released
+    lease_expires_at = Column(DateTime, nullable=True)  # UTC
+    renewed_at = Column(DateTime, nullable=True)  # UTC; the last time the owner was known alive
+
+class CacheVersion(Base):
+    __tablename__ = "cache_versions"
+    
+    name = Column(String(64), primary_key=True)  # e.g. "questions", "answers"
+    version = Column(Integer, nullable=False, default=0)  # Bumped in the same transaction as the data it covers
@@ -0,0 +1,215 @@
+"""
+Cached scores between pairs of users.
+
+A pair's score depends on nothing but the two users' answers, so it is
+cached against a stamp of those answers: users.answers_version, which every
+answer route bumps in the same transaction as the answers themselves. An
+entry holds the score of (u1, u2) at stamps (v1, v2) and is only served
+while both users are still at those stamps, so a changed answer on either
+side invalidates it without anyone having to find and evict it.
+
+Entries live in a bounded in-process LRU and, with pair_score_cache_persist,
+in the pair_scores table, where they survive restarts and are shared by
+every process (the monthly job's and find-enemy's scores included). A
+lookup reads both users' current answers_version from the database in one
+query and keys on those. A score is computed by the answer cache, which
+reports the stamps of the vectors it used, and is only cached when they are
+the versions just read; otherwise a write landed in between and the score
+is served uncached.
+
+Deactivating a question moves scores without touching any stamp: it clears
+the persisted entries (invalidate_all) and, through the answer cache's
+epoch, the in-memory ones.
+"""
+import threading
+from collections import OrderedDict
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Insert, Select
+from app.answer_cache import answer_cache
+from app.config import settings
+from app.database import SessionLocal
+from app.models import PairScore, User
+from typing import Dict, Iterable, Optional, Tuple
+
+Stamps = Tuple[int, int]
+
+table = PairScore.__table__
+users = User.__table__
+
+
+def versions_query() -> Select:
+    return select(users.c.id, users.c.answers_version)
+
+
+def pair_versions_query(user1_id: int, user2_id: int) -> Select:
+    """Both users' answers_version in one primary-key read"""
+    return versions_query().where(users.c.id.in_((user1_id, user2_id)))
+
+
+def entry_query(user1_id: int, user2_id: int) -> Select:
+    return select(table.c.version1, table.c.version2, table.c.match_score).where(
+        table.c.user1_id == user1_id, table.c.user2_id == user2_id
+    )
+
+
+def _upsert(dialect: str) -> Insert:
+    """Store entries, replacing whatever an older stamp left behind (run executemany-style)"""
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        statement = dialect_insert(table)
+        return statement.on_duplicate_key_update(
+            version1=statement.inserted.version1,
+            version2=statement.inserted.version2,
+            match_score=statement.inserted.match_score,
+        )
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        statement = dialect_insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=[table.c.user1_id, table.c.user2_id],
+            set_={
+                "version1": statement.excluded.version1,
+                "version2": statement.excluded.version2,
+                "match_score": statement.excluded.match_score,
+            },
+        )
+    raise ValueError(f"No pair score upsert for database dialect {dialect!r}")
+
+
+class PairScoreCache:
+    """Bounded LRU of (u1, u2) -> (v1, v2, score), optionally backed by pair_scores"""
+
+    def __init__(self, max_entries: int = 100_000, persist: bool = False):
+        self.max_entries = max_entries
+        self.persist = persist
+        self._entries: "OrderedDict[Tuple[int, int], Tuple[int, int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._epoch = answer_cache.epoch
+        self.hits = 0
+        self.persisted_hits = 0
+        self.misses = 0
+
+    def score(self, db: Session, user1_id: int, user2_id: int) -> float:
+        """Score between two users; with persistence, new entries are committed through a session of their own"""
+        key = (min(user1_id, user2_id), max(user1_id, user2_id))
+        stamps = self._versions(db, key)
+        if None in stamps:
+            # No such user
+            return 0.0
+        score = self._get(key, stamps)
+        if score is not None:
+            return score
+        if self.persist:
+            row = db.execute(entry_query(*key)).first()
+            if row is not None and (row.version1, row.version2) == stamps:
+                with self._lock:
+                    self.persisted_hits += 1
+                self._put(key, stamps, row.match_score)
+                return row.match_score
+
+        score, scored_stamps = answer_cache.stamped_pair_score(db, *key)
+        with self._lock:
+            self.misses += 1
+        if scored_stamps == stamps:
+            self._store(key, stamps, score)
+        return score
+
+    def remember(self, db: Session, user1_id: int, user2_id: int, score: float, stamps: Tuple[Optional[int], Optional[int]]):
+        """
+        Cache a score computed elsewhere from vectors at the given stamps, if
+        those are still both users' versions (persisted like score's entries)
+        """
+        key = (min(user1_id, user2_id), max(user1_id, user2_id))
+        if user1_id > user2_id:
+            stamps = (stamps[1], stamps[0])
+        if None not in stamps and self._versions(db, key) == stamps:
+            self._store(key, stamps, score)
+
+    def put_many(self, db: Session, scores: Iterable[Tuple[int, int, int, int, float]]):
+        """
+        Cache (user_id, other_id, user_version, other_version, score) rows
+        scored elsewhere; persisted ones are written through db, uncommitted
+        """
+        entries = []
+        for user_id, other_id, user_version, other_version, score in scores:
+            if user_id > other_id:
+                user_id, other_id, user_version, other_version = other_id, user_id, other_version, user_version
+            entries.append(((user_id, other_id), (user_version, other_version), score))
+        for key, stamps, score in entries:
+            self._put(key, stamps, score)
+        if self.persist and entries:
+            self._save(db, entries)
+
+    def invalidate_all(self, db: Session):
+        """Drop every persisted entry, e.g. when a question stops counting; call before committing that change"""
+        db.execute(delete(table))
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "persisted_hits": self.persisted_hits,
+                "misses": self.misses,
+            }
+
+    @staticmethod
+    def _versions(db: Session, key: Tuple[int, int]) -> Tuple[Optional[int], Optional[int]]:
+        versions = dict(db.execute(pair_versions_query(*key)).all())
+        return versions.get(key[0]), versions.get(key[1])
+
+    def _store(self, key: Tuple[int, int], stamps: Stamps, score: float):
+        self._put(key, stamps, score)
+        if self.persist:
+            # The caller's transaction is not ours to commit: it may hold work meant to roll back
+            with SessionLocal() as own_db:
+                self._save(own_db, [(key, stamps, score)])
+                own_db.commit()
+
+    def _sync_epoch(self):
+        if self._epoch != answer_cache.epoch:
+            # Every score may have moved (resync or deactivated question)
+            self._entries.clear()
+            self._epoch = answer_cache.epoch
+
+    def _get(self, key: Tuple[int, int], stamps: Stamps) -> Optional[float]:
+        with self._lock:
+            self._sync_epoch()
+            entry = self._entries.get(key)
+            if entry is None or entry[:2] != stamps:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def _put(self, key: Tuple[int, int], stamps: Stamps, score: float):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            # Scored under the answer cache's current epoch
+            self._sync_epoch()
+            self._entries[key] = (stamps[0], stamps[1], score)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _save(db: Session, entries):
+        rows = [
+            {"user1_id": key[0], "user2_id": key[1], "version1": stamps[0], "version2": stamps[1], "match_score": score}
+            for key, stamps, score in entries
+        ]
+        db.execute(_upsert(db.get_bind().dialect.name), rows)
+
+
+pair_score_cache = PairScoreCache(
+    max_entries=settings.pair_score_cache_size,
+    persist=settings.pair_score_cache_persist,
+)
@@ -0,0 +1,59 @@
+"""
+Password hashing on its own small, bounded executor.
+
+bcrypt is deliberately slow, and login/signup used to run it on the shared
+request threadpool, so a burst of logins could occupy every thread. Hashes
+now run on a few dedicated threads (bcrypt releases the GIL), and at most
+queue_limit more callers may wait for one; anyone beyond that is refused
+straight away with PasswordHasherBusy instead of holding a request thread.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+from app.config import settings
+from typing import Callable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class PasswordHasherBusy(Exception):
+    """Every hashing worker and queue slot is taken"""
+
+
+class PasswordHasher:
+    """bcrypt hashing and verification through a bounded thread pool"""
+
+    def __init__(self, rounds: int = 12, workers: int = 2, queue_limit: int = 8):
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self.rejected = 0
+
+    def _run(self, function: Callable[..., T], *args) -> T:
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        try:
+            return self._executor.submit(function, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password: str) -> str:
+        return self._run(self.context.hash, password)
+
+    def verify(self, password: str, password_hash: str) -> bool:
+        return self._run(self.context.verify, password, password_hash)
+
+    def verify_and_update(self, password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+        """Verify, and when the hash uses an outdated cost, also return a fresh one"""
+        return self._run(self.context.verify_and_update, password, password_hash)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+password_hasher = PasswordHasher(
+    rounds=settings.bcrypt_rounds,
+    workers=settings.password_hash_workers,
+    queue_limit=settings.password_hash_queue_limit,
+)
@@ -0,0 +1,136 @@
+"""
+Random-projection sketch for approximate enemy search.
+
+Every user's answer vector (centered on the middle of the scale, unanswered
+questions counted as neutral) is projected onto random directions, and each
+projection is kept sorted. A target's enemy would sit on the other side of the
+scale on most questions, so the candidates at the matching end of the
+projections best aligned with that direction make a short list, which is then
+scored exactly. The candidate budget is the knob trading recall for latency.
+
+Like EnemyIndex, the sketch stores row numbers into an AnswerMatrix owned by
+someone else. Sorted projections are only rebuilt after enough updates; rows
+changed since the last sort are always added to the short list, so a stale
+sort costs a little budget but never hides a changed user.
+"""
+import numpy as np
+from app.answer_matrix import AnswerMatrix, pick_best
+from typing import TYPE_CHECKING, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    from app.enemy_index import EnemyIndex
+
+# Middle of the 1-10 answer scale, used to center answer vectors
+NEUTRAL_ANSWER = 5.5
+
+
+class ProjectionSketch:
+    """Sorted random projections over rows of an AnswerMatrix"""
+
+    def __init__(self, projections: int = 64, resort_fraction: float = 0.01, seed: int = 0):
+        self.projections = projections
+        self.resort_fraction = resort_fraction
+        self._rng = np.random.default_rng(seed)
+        self._directions = np.zeros((0, projections), dtype=np.float32)
+        self._order = np.zeros((projections, 0), dtype=np.int64)
+        self._recent: Set[int] = set()
+        # Rows scored exactly in the most recent query
+        self.last_scored = 0
+
+    @classmethod
+    def build(cls, matrix: AnswerMatrix, projections: int = 64) -> "ProjectionSketch":
+        sketch = cls(projections=projections)
+        sketch.resort(matrix)
+        return sketch
+
+    def resort(self, matrix: AnswerMatrix):
+        """Project every row and sort each projection"""
+        rows = np.flatnonzero(matrix.mask.any(axis=1))
+        projected = self._project(matrix.values[rows], matrix.mask[rows])
+        self._order = rows[np.argsort(projected, axis=0).T]
+        self._recent.clear()
+
+    def touch(self, row: int):
+        """Note that a row changed (or was freed) since the last sort"""
+        self._recent.add(row)
+
+    @property
+    def stale(self) -> bool:
+        return len(self._recent) > max(256, self.resort_fraction * self._order.shape[1])
+
+    def best_enemy(self, matrix: AnswerMatrix, user_id: int, candidates: int = 2048) -> Optional[Tuple[int, float]]:
+        """Very probably the best enemy, scoring about `candidates` users exactly"""
+        rows = self.candidate_rows(matrix, user_id, candidates)
+        self.last_scored = len(rows)
+        candidate_ids, scores = matrix.scores(user_id, rows=rows)
+        return pick_best(candidate_ids, scores)
+
+    def candidate_rows(self, matrix: AnswerMatrix, user_id: int, candidates: int) -> np.ndarray:
+        """Short list of about `candidates` rows likely to contain the target's enemy"""
+        target = matrix.row(user_id)
+        if target is None:
+            return np.zeros(0, dtype=np.int64)
+
+        # Direction in which an enemy's answers would lie: away from the target's
+        # side of the scale on every question the target answered
+        away = np.where(matrix.mask[target], np.sign(NEUTRAL_ANSWER - matrix.values[target]), 0)
+        alignment = away @ self._ensure_directions(len(away))
+
+        # Spend the budget on the projections best aligned with that direction,
+        # taking rows from the end of each projection the enemy would be at
+        weights = alignment ** 2
+        if weights.sum() == 0:
+            weights = np.ones(self.projections)
+        shares = np.floor(candidates * weights / weights.sum()).astype(np.int64)
+        slices = []
+        for projection in np.flatnonzero(shares):
+            share = min(shares[projection], self._order.shape[1])
+            if alignment[projection] > 0:
+                slices.append(self._order[projection, -share:])
+            else:
+                slices.append(self._order[projection, :share])
+        rows = np.concatenate(slices) if slices else np.zeros(0, dtype=np.int64)
+
+        if self._recent:
+            rows = np.concatenate([rows, np.fromiter(self._recent, dtype=np.int64)])
+        rows = np.unique(rows)
+        return rows[rows < len(matrix.user_ids)]
+
+    def _project(self, values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """(rows, projections) coordinates of answer vectors"""
+        directions = self._ensure_directions(values.shape[1])
+        centered = np.where(mask, values - NEUTRAL_ANSWER, 0).astype(np.float32)
+        # Scores are means over answered questions, so project the per-question average
+        answered = np.maximum(mask.sum(axis=1, keepdims=True), 1)
+        return (centered / answered) @ directions
+
+    def _ensure_directions(self, width: int) -> np.ndarray:
+        """Random directions for the first `width` questions, drawing more for new questions"""
+        if width > len(self._directions):
+            extra = self._rng.standard_normal((width - len(self._directions), self.projections))
+            self._directions = np.vstack([self._directions, extra.astype(np.float32)])
+        return self._directions[:width]
+
+
+def approximate_best_enemy(
+    matrix: AnswerMatrix,
+    user_id: int,
+    candidates: int,
+    sketch: ProjectionSketch,
+    index: Optional["EnemyIndex"] = None,
+) -> Optional[Tuple[int, float]]:
+    """
+    Very probably the best enemy, scoring about `candidates` users exactly.
+    With an EnemyIndex, half the budget goes to the buckets farthest from the
+    user, which holds up better than projections alone when users answered
+    every question and many candidates are nearly tied.
+    """
+    if index is None:
+        rows = sketch.candidate_rows(matrix, user_id, candidates)
+    else:
+        rows = np.union1d(
+            sketch.candidate_rows(matrix, user_id, candidates // 2),
+            index.candidate_rows(matrix, user_id, candidates // 2),
+        )
+    candidate_ids, scores = matrix.scores(user_id, rows=rows)
+    return pick_best(candidate_ids, scores)
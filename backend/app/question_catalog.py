@@ -0,0 +1,124 @@
+"""
+Serialized question catalog with ETags, shared across worker processes.
+
+The catalog only changes through create_question and deactivate_question, so
+each process keeps the rendered JSON in memory. Validity is tracked by a
+counter row in cache_versions that those routes bump inside their own
+transaction. A GET costs one primary-key SELECT of that counter: if the
+counter still matches, the cached bytes are served (or a 304 when the client's
+If-None-Match already names this version), otherwise the catalog is rendered
+again. Any process can bump it, so every process notices on its next request.
+"""
+import re
+import threading
+from fastapi import Response, status
+from pydantic import TypeAdapter
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from app.config import settings
+from app.models import CacheVersion, Question
+from app.schemas import QuestionResponse
+from typing import Dict, List, Optional, Tuple
+
+CATALOG = "questions"
+
+_serializer = TypeAdapter(List[QuestionResponse])
+
+# One entity-tag of an If-None-Match list; the opaque part may itself hold commas
+_ENTITY_TAG = re.compile(r'(?:W/)?("[^"]*")')
+
+
+def version_query(name: str) -> Select:
+    return select(CacheVersion.version).where(CacheVersion.name == name)
+
+
+def current_version(db: Session, name: str) -> int:
+    version = db.scalar(version_query(name))
+    return version or 0
+
+
+def bump_version(db: Session, name: str):
+    """Invalidate every process's copy; call before committing the change it covers"""
+    bumped = db.execute(
+        update(CacheVersion)
+        .where(CacheVersion.name == name)
+        .values(version=CacheVersion.version + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if bumped:
+        return
+    try:
+        with db.begin_nested():
+            db.add(CacheVersion(name=name, version=1))
+    except IntegrityError:
+        # Someone else created the row first; bump theirs
+        db.execute(
+            update(CacheVersion)
+            .where(CacheVersion.name == name)
+            .values(version=CacheVersion.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header names etag. GET compares weakly (RFC 9110
+    13.1.2), so a W/ on either side is ignored: proxies that compress the body
+    weaken the tag they pass on. "*" matches any current catalog.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in _ENTITY_TAG.findall(if_none_match)
+
+
+class QuestionCatalog:
+    """Rendered GET /api/questions/ bodies, keyed by active_only and stamped with a version"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._bodies: Dict[bool, Tuple[int, bytes]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def etag(version: int, active_only: bool) -> str:
+        return f'"questions-{version}-{"active" if active_only else "all"}"'
+
+    def response(self, db: Session, active_only: bool, if_none_match: Optional[str]) -> Response:
+        # Read the version before the rows: a change landing in between then only costs a re-render
+        version = current_version(db, CATALOG)
+        etag = self.etag(version, active_only)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        cached = self._bodies.get(active_only) if self.enabled else None
+        if cached is not None and cached[0] == version:
+            body = cached[1]
+        else:
+            body = self._render(db, active_only)
+            if self.enabled:
+                with self._lock:
+                    self._bodies[active_only] = (version, body)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def _render(self, db: Session, active_only: bool) -> bytes:
+        query = db.query(Question)
+        if active_only:
+            query = query.filter(Question.is_active == True)
+        return _serializer.dump_json(_serializer.validate_python(query.all(), from_attributes=True))
+
+    def preload(self, db: Session):
+        """Render both bodies ahead of the first request"""
+        if self.enabled:
+            for active_only in (True, False):
+                self.response(db, active_only, None)
+
+    def invalidate(self, db: Session):
+        bump_version(db, CATALOG)
+
+
+question_catalog = QuestionCatalog(enabled=settings.question_catalog_cache)
@@ -0,0 +1,93 @@
+"""
+Per-question answer distributions, maintained incrementally.
+
+Aggregating the answers table on every stats request would scan every answer
+to a question. Instead question_answer_counts keeps one counter per (question,
+value), and every route that writes answers adjusts those counters in the same
+transaction: +1 on the new value and, when an existing answer changes, -1 on
+the old one. Reading a question's stats is then at most ten primary-key rows.
+
+Anything that writes answers behind the routes' back (bulk loads, manual SQL)
+leaves the counters drifted; rebuild() recomputes them all in one pass, and
+rebuild_question_stats.py runs it.
+"""
+from collections import Counter
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Insert
+from app.models import Answer, QuestionAnswerCount
+from app.schemas import QuestionStatsResponse
+from typing import Dict, Optional, Tuple
+
+VALUES = range(1, 11)
+
+
+def answer_deltas(old: Dict[int, int], new: Dict[int, int]) -> Dict[Tuple[int, int], int]:
+    """Counter changes for answers moving from old to new values (question id -> value)"""
+    deltas: Counter = Counter()
+    for question_id, value in new.items():
+        previous = old.get(question_id)
+        if previous == value:
+            continue
+        if previous is not None:
+            deltas[(question_id, previous)] -= 1
+        deltas[(question_id, value)] += 1
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+def _upsert_counts(dialect: str) -> Insert:
+    """Add each row's count to its bucket, creating the bucket if needed (run executemany-style)"""
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        statement = dialect_insert(QuestionAnswerCount)
+        return statement.on_duplicate_key_update(count=QuestionAnswerCount.count + statement.inserted.count)
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        statement = dialect_insert(QuestionAnswerCount)
+        return statement.on_conflict_do_update(
+            index_elements=[QuestionAnswerCount.question_id, QuestionAnswerCount.answer_value],
+            set_={"count": QuestionAnswerCount.count + statement.excluded.count},
+        )
+    raise ValueError(f"No counter upsert for database dialect {dialect!r}")
+
+
+def record_answers(db: Session, old: Dict[int, int], new: Dict[int, int]):
+    """Adjust the counters for one user's answers; call before committing the answers themselves"""
+    deltas = answer_deltas(old, new)
+    if not deltas:
+        return
+    rows = [
+        {"question_id": question_id, "answer_value": value, "count": delta}
+        for (question_id, value), delta in deltas.items()
+    ]
+    db.execute(_upsert_counts(db.get_bind().dialect.name), rows)
+
+
+def question_stats(question_id: int, counts: Dict[int, int]) -> QuestionStatsResponse:
+    buckets = [max(counts.get(value, 0), 0) for value in VALUES]
+    total = sum(buckets)
+    mean: Optional[float] = None
+    variance: Optional[float] = None
+    if total:
+        mean = sum(value * count for value, count in zip(VALUES, buckets)) / total
+        variance = sum(count * (value - mean) ** 2 for value, count in zip(VALUES, buckets)) / total
+    return QuestionStatsResponse(question_id=question_id, total=total, counts=buckets, mean=mean, variance=variance)
+
+
+def counts_query(question_id: int):
+    return select(QuestionAnswerCount.answer_value, QuestionAnswerCount.count).filter(
+        QuestionAnswerCount.question_id == question_id
+    )
+
+
+def rebuild(db: Session) -> int:
+    """Recompute every counter from the answers table; returns the number of buckets written"""
+    db.execute(delete(QuestionAnswerCount))
+    written = db.execute(
+        insert(QuestionAnswerCount).from_select(
+            ["question_id", "answer_value", "count"],
+            select(Answer.question_id, Answer.answer_value, func.count())
+            .group_by(Answer.question_id, Answer.answer_value),
+        )
+    ).rowcount
+    return written
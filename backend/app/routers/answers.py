@@ -1,13 +1,87 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import case, func, select
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import Insert
 from app.database import get_db
 from app.models import Answer, Question, User
 from app.schemas import AnswerCreate, AnswerResponse, AnswerUpdate, SurveyResponse
 from app.routers.auth import get_current_user
-from typing import List
+from app.answer_cache import answer_cache, bump_answers_version
+from app import best_enemies
+from app.question_stats import record_answers
+from typing import Dict, Iterable, List
 
 router = APIRouter()
 
+def survey_values(survey: SurveyResponse) -> Dict[int, int]:
+    """Validated answer values by question id; a repeated question keeps its last value"""
+    values = {}
+    for answer_data in survey.answers:
+        if answer_data.answer_value < 1 or answer_data.answer_value > 10:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Answer value for question {answer_data.question_id} must be between 1 and 10"
+            )
+        values[answer_data.question_id] = answer_data.answer_value
+    return values
+
+def existing_questions_query(question_ids: Iterable[int]):
+    return select(Question.id).filter(Question.id.in_(list(question_ids)))
+
+def check_questions_exist(question_ids: Iterable[int], found: Iterable[int]):
+    found = set(found)
+    for question_id in question_ids:
+        if question_id not in found:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Question {question_id} not found"
+            )
+
+def upsert_answers(dialect: str, user_id: int, values: Dict[int, int]) -> Insert:
+    """One INSERT for all of a user's answers that updates rows already in uq_user_question"""
+    rows = [
+        {"user_id": user_id, "question_id": question_id, "answer_value": answer_value}
+        for question_id, answer_value in values.items()
+    ]
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(Answer).values(rows)
+        new_value = statement.inserted.answer_value
+        # MySQL applies assignments left to right, so updated_at must still see the old value
+        return statement.on_duplicate_key_update([
+            ("updated_at", case((Answer.answer_value != new_value, func.now()), else_=Answer.updated_at)),
+            ("answer_value", new_value),
+        ])
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        statement = insert(Answer).values(rows)
+        new_value = statement.excluded.answer_value
+        return statement.on_conflict_do_update(
+            index_elements=[Answer.user_id, Answer.question_id],
+            set_={
+                "answer_value": new_value,
+                # Like the ORM's onupdate, only a changed value counts as an update
+                "updated_at": case((Answer.answer_value != new_value, func.now()), else_=Answer.updated_at),
+            },
+        )
+    raise ValueError(f"No answer upsert for database dialect {dialect!r}")
+
+def previous_values_query(user_id: int, question_ids: Iterable[int]):
+    """Locking read of the values being replaced; run it after bump_answers_version has serialized the write"""
+    return select(Answer.question_id, Answer.answer_value).filter(
+        Answer.user_id == user_id, Answer.question_id.in_(list(question_ids))
+    ).with_for_update()
+
+def previous_values(rows: Iterable[tuple]) -> Dict[int, int]:
+    return {question_id: answer_value for question_id, answer_value in rows}
+
+def survey_answers_query(user_id: int, question_ids: Iterable[int]):
+    return select(Answer).filter(Answer.user_id == user_id, Answer.question_id.in_(list(question_ids)))
+
+def in_survey_order(answers: Iterable[Answer], values: Dict[int, int]) -> List[Answer]:
+    by_question = {answer.question_id: answer for answer in answers}
+    return [by_question[question_id] for question_id in values]
+
 @router.post("/", response_model=AnswerResponse, status_code=status.HTTP_201_CREATED)
 def create_answer(answer: AnswerCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     # Validate answer value (1-10)
@@ -25,15 +99,22 @@ def create_answer(answer: AnswerCreate, current_user: User = Depends(get_current
             detail="Question not found"
         )
     
+    # Serialize with the user's other answer writes before reading what this one replaces,
+    # so concurrent writes never both count the same old value out of the stats
+    bump_answers_version(db, current_user.id)
+    best_enemies.answers_changed(db, current_user.id)
+
     # Check if answer already exists (update if so)
     existing_answer = db.query(Answer).filter(
         Answer.user_id == current_user.id,
         Answer.question_id == answer.question_id
-    ).first()
+    ).with_for_update().first()
     
     if existing_answer:
+        record_answers(db, {answer.question_id: existing_answer.answer_value}, {answer.question_id: answer.answer_value})
         existing_answer.answer_value = answer.answer_value
         db.commit()
+        answer_cache.update_answers(db, current_user.id, {answer.question_id: answer.answer_value})
         db.refresh(existing_answer)
         return existing_answer
     
@@ -44,50 +125,28 @@ def create_answer(answer: AnswerCreate, current_user: User = Depends(get_current
         answer_value=answer.answer_value
     )
     db.add(db_answer)
+    record_answers(db, {}, {answer.question_id: answer.answer_value})
     db.commit()
+    answer_cache.update_answers(db, current_user.id, {answer.question_id: answer.answer_value})
     db.refresh(db_answer)
     return db_answer
 
 @router.post("/survey", response_model=List[AnswerResponse], status_code=status.HTTP_201_CREATED)
 def submit_survey(survey: SurveyResponse, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    answers = []
-    for answer_data in survey.answers:
-        # Validate answer value
-        if answer_data.answer_value < 1 or answer_data.answer_value > 10:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Answer value for question {answer_data.question_id} must be between 1 and 10"
-            )
-        
-        # Check if question exists
-        question = db.query(Question).filter(Question.id == answer_data.question_id).first()
-        if not question:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Question {answer_data.question_id} not found"
-            )
-        
-        # Update or create answer
-        existing_answer = db.query(Answer).filter(
-            Answer.user_id == current_user.id,
-            Answer.question_id == answer_data.question_id
-        ).first()
-        
-        if existing_answer:
-            existing_answer.answer_value = answer_data.answer_value
-            answers.append(existing_answer)
-        else:
-            db_answer = Answer(
-                user_id=current_user.id,
-                question_id=answer_data.question_id,
-                answer_value=answer_data.answer_value
-            )
-            db.add(db_answer)
-            answers.append(db_answer)
+    values = survey_values(survey)
+    if not values:
+        return []
     
+    # One IN query validates every question, one statement writes every answer
+    check_questions_exist(values, db.scalars(existing_questions_query(values)))
+    bump_answers_version(db, current_user.id)
+    best_enemies.answers_changed(db, current_user.id)
+    record_answers(db, previous_values(db.execute(previous_values_query(current_user.id, values))), values)
+    db.execute(upsert_answers(db.get_bind().dialect.name, current_user.id, values))
     db.commit()
-    for answer in answers:
-        db.refresh(answer)
+    answer_cache.update_answers(db, current_user.id, values)
+    
+    answers = in_survey_order(db.scalars(survey_answers_query(current_user.id, values)), values)
     return answers
 
 @router.get("/user", response_model=List[AnswerResponse])
@@ -110,7 +169,13 @@ def update_answer(answer_id: int, answer_update: AnswerUpdate, db: Session = Dep
             detail="Answer not found"
         )
     
+    bump_answers_version(db, db_answer.user_id)
+    best_enemies.answers_changed(db, db_answer.user_id)
+    # Re-read the value under the row lock: another write may have replaced it since the read above
+    db.refresh(db_answer, with_for_update=True)
+    record_answers(db, {db_answer.question_id: db_answer.answer_value}, {db_answer.question_id: answer_update.answer_value})
     db_answer.answer_value = answer_update.answer_value
     db.commit()
+    answer_cache.update_answers(db, db_answer.user_id, {db_answer.question_id: db_answer.answer_value})
     db.refresh(db_answer)
     return db_answer
@@ -0,0 +1,124 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db, SessionLocal
+from app.models import Answer, Question, User
+from app.schemas import AnswerCreate, AnswerResponse, AnswerUpdate, SurveyResponse
+from app.routers.async_auth import get_current_user
+from app.routers.answers import (
+    survey_values, check_questions_exist, existing_questions_query, upsert_answers, survey_answers_query,
+    in_survey_order, previous_values_query, previous_values,
+)
+from app.answer_cache import answer_cache, bump_answers_version
+from app import best_enemies
+from app.question_stats import record_answers
+from typing import Dict, List
+
+router = APIRouter()
+
+def _update_cache_sync(user_id: int, answers: Dict[int, int]):
+    # Reloading the vector takes the answer cache lock, which find-enemy scans hold for their whole length
+    with SessionLocal() as db:
+        answer_cache.update_answers(db, user_id, answers)
+
+async def _existing_answer(db: AsyncSession, user_id: int, question_id: int):
+    return await db.scalar(
+        select(Answer).filter(Answer.user_id == user_id, Answer.question_id == question_id).with_for_update()
+    )
+
+@router.post("/", response_model=AnswerResponse, status_code=status.HTTP_201_CREATED)
+async def create_answer(answer: AnswerCreate, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    # Validate answer value (1-10)
+    if answer.answer_value < 1 or answer.answer_value > 10:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Answer value must be between 1 and 10"
+        )
+
+    # Check if question exists
+    question = await db.get(Question, answer.question_id)
+    if not question:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Question not found"
+        )
+
+    # Serialize with the user's other answer writes before reading what this one replaces,
+    # so concurrent writes never both count the same old value out of the stats
+    await db.run_sync(bump_answers_version, current_user.id)
+    await db.run_sync(best_enemies.answers_changed, current_user.id)
+
+    # Check if answer already exists (update if so)
+    existing_answer = await _existing_answer(db, current_user.id, answer.question_id)
+
+    if existing_answer:
+        await db.run_sync(record_answers, {answer.question_id: existing_answer.answer_value}, {answer.question_id: answer.answer_value})
+        existing_answer.answer_value = answer.answer_value
+        await db.commit()
+        await db.refresh(existing_answer)
+        await run_in_threadpool(_update_cache_sync, current_user.id, {answer.question_id: answer.answer_value})
+        return existing_answer
+
+    # Create new answer
+    db_answer = Answer(
+        user_id=current_user.id,
+        question_id=answer.question_id,
+        answer_value=answer.answer_value
+    )
+    db.add(db_answer)
+    await db.run_sync(record_answers, {}, {answer.question_id: answer.answer_value})
+    await db.commit()
+    await db.refresh(db_answer)
+    await run_in_threadpool(_update_cache_sync, current_user.id, {answer.question_id: answer.answer_value})
+    return db_answer
+
+@router.post("/survey", response_model=List[AnswerResponse], status_code=status.HTTP_201_CREATED)
+async def submit_survey(survey: SurveyResponse, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    values = survey_values(survey)
+    if not values:
+        return []
+
+    # One IN query validates every question, one statement writes every answer
+    check_questions_exist(values, await db.scalars(existing_questions_query(values)))
+    await db.run_sync(bump_answers_version, current_user.id)
+    await db.run_sync(best_enemies.answers_changed, current_user.id)
+    old_values = previous_values(await db.execute(previous_values_query(current_user.id, values)))
+    await db.run_sync(record_answers, old_values, values)
+    await db.execute(upsert_answers(db.get_bind().dialect.name, current_user.id, values))
+    await db.commit()
+
+    answers = in_survey_order(await db.scalars(survey_answers_query(current_user.id, values)), values)
+    await run_in_threadpool(_update_cache_sync, current_user.id, values)
+    return answers
+
+@router.get("/user", response_model=List[AnswerResponse])
+async def get_user_answers(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    answers = (await db.scalars(select(Answer).filter(Answer.user_id == current_user.id))).all()
+    return answers
+
+@router.put("/{answer_id}", response_model=AnswerResponse)
+async def update_answer(answer_id: int, answer_update: AnswerUpdate, db: AsyncSession = Depends(get_async_db)):
+    if answer_update.answer_value < 1 or answer_update.answer_value > 10:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Answer value must be between 1 and 10"
+        )
+
+    db_answer = await db.get(Answer, answer_id)
+    if not db_answer:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Answer not found"
+        )
+
+    await db.run_sync(bump_answers_version, db_answer.user_id)
+    await db.run_sync(best_enemies.answers_changed, db_answer.user_id)
+    # Re-read the value under the row lock: another write may have replaced it since the read above
+    await db.refresh(db_answer, with_for_update=True)
+    await db.run_sync(record_answers, {db_answer.question_id: db_answer.answer_value}, {db_answer.question_id: answer_update.answer_value})
+    db_answer.answer_value = answer_update.answer_value
+    await db.commit()
+    await db.refresh(db_answer)
+    await run_in_threadpool(_update_cache_sync, db_answer.user_id, {db_answer.question_id: db_answer.answer_value})
+    return db_answer
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
+from app.models import User
+from app.schemas import UserResponse
+from app.routers.auth import oauth2_scheme, decode_user_id, credentials_exception
+from app.auth_cache import auth_cache
+
+router = APIRouter()
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> User:
+    user_id = decode_user_id(token)
+    user = auth_cache.user(user_id)
+    if user is not None:
+        return user
+    
+    user = await db.get(User, user_id)
+    if user is None:
+        raise credentials_exception()
+    auth_cache.put_user(user)
+    return user
+
+@router.get("/me", response_model=UserResponse)
+async def read_users_me(current_user: User = Depends(get_current_user)):
+    return current_user
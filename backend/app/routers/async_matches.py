@@ -0,0 +1,125 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db, get_async_read_db, ReadSessionLocal, SessionLocal
+from app.models import Match, User
+from app.schemas import EnemyJobResponse, MatchResponse, MatchHistoryResponse, MatchScoreResponse, PairScoreCacheStats
+from app.routers.async_auth import get_current_user
+from app.routers.matches import match_history_query, match_history_page, find_enemy_busy, job_accepted, job_not_found
+from typing import List, Optional, Tuple
+from app.matching import calculate_match_score, find_enemy_match
+from app.pair_scores import pair_score_cache
+from app.enemy_jobs import FindEnemyBusy, enemy_jobs, job_query, job_response, recent_jobs_query
+
+router = APIRouter()
+
+def _find_enemy_sync(user_id: int, approximate: Optional[bool]) -> Optional[Tuple[int, float]]:
+    # Scoring is CPU-bound and the answer cache loads through a sync session, so it keeps a worker thread
+    with ReadSessionLocal() as read_db, SessionLocal() as db:
+        return find_enemy_match(user_id, read_db, approximate=approximate, primary_db=db)
+
+def _match_score_sync(user_id: int, other_user_id: int) -> float:
+    with SessionLocal() as db:
+        return calculate_match_score(user_id, other_user_id, db)
+
+@router.get("/user", response_model=MatchHistoryResponse)
+async def get_user_matches(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    # One joined query per page, however long the history
+    rows = (await db.execute(match_history_query(current_user.id, limit, cursor))).all()
+    return match_history_page(rows, limit)
+
+@router.get("/user/latest", response_model=MatchResponse)
+async def get_latest_match(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_read_db)):
+    rows = (await db.execute(match_history_query(current_user.id, 0))).all()
+    if not rows:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No matches found for this user"
+        )
+
+    return match_history_page(rows, 1).matches[0]
+
+@router.get("/user/score/{other_user_id}", response_model=MatchScoreResponse)
+async def get_match_score(other_user_id: int, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_read_db)):
+    """Score between the current user and another one, cached until either changes their answers"""
+    if await db.scalar(select(User.id).filter(User.id == other_user_id)) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    match_score = await run_in_threadpool(_match_score_sync, current_user.id, other_user_id)
+    return MatchScoreResponse(user_id=current_user.id, other_user_id=other_user_id, match_score=match_score)
+
+@router.get("/score-cache", response_model=PairScoreCacheStats)
+async def get_score_cache_stats():
+    """Hit and miss counters of this process's pair score cache"""
+    return pair_score_cache.stats()
+
+@router.get("/user/find-enemy/jobs", response_model=List[EnemyJobResponse])
+async def get_find_enemy_jobs(
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """The user's most recent background find-enemy jobs, newest first"""
+    return [job_response(row) for row in await db.execute(recent_jobs_query(current_user.id, limit))]
+
+@router.get("/user/find-enemy/jobs/{job_id}", response_model=EnemyJobResponse)
+async def get_find_enemy_job(job_id: str, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """Poll a background find-enemy job; its match is included once done"""
+    row = (await db.execute(job_query(job_id, current_user.id))).first()
+    if row is None:
+        raise job_not_found()
+    return job_response(row)
+
+@router.post("/user/find-enemy")
+async def find_enemy(
+    approximate: Optional[bool] = None,
+    background: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Manually trigger enemy matching for a user (approximate=true for a faster, probable match).
+    background=true queues the search instead and answers 202 with a job to poll.
+    """
+    if background:
+        try:
+            job_id = await db.run_sync(enemy_jobs.submit, current_user.id, approximate)
+        except FindEnemyBusy:
+            raise find_enemy_busy()
+        return job_accepted(job_response((await db.execute(job_query(job_id, current_user.id))).first()))
+
+    found = await run_in_threadpool(_find_enemy_sync, current_user.id, approximate)
+    if found is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No suitable enemy found. Make sure there are other users with answers."
+        )
+    enemy_id, match_score = found
+
+    # Create match record
+    match = Match(
+        user_id=current_user.id,
+        enemy_id=enemy_id,
+        match_score=match_score
+    )
+    db.add(match)
+    await db.commit()
+    await db.refresh(match)
+
+    enemy = await db.get(User, enemy_id)
+    return MatchResponse(
+        id=match.id,
+        enemy_id=enemy_id,
+        enemy_username=enemy.username,
+        enemy_email=enemy.email,
+        match_score=match_score,
+        matched_at=match.matched_at
+    )
@@ -0,0 +1,71 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db, get_async_read_db, ReadSessionLocal
+from app.models import Question
+from app.schemas import QuestionCreate, QuestionResponse, QuestionStatsResponse
+from app.answer_cache import answer_cache
+from app import best_enemies
+from app.pair_scores import pair_score_cache
+from app.question_catalog import question_catalog
+from app.question_stats import counts_query, question_stats
+from typing import List, Optional
+
+router = APIRouter()
+
+def _catalog_response_sync(active_only: bool, if_none_match: Optional[str]):
+    # The catalog reads and renders through a sync session, which must stay off the event loop
+    with ReadSessionLocal() as db:
+        return question_catalog.response(db, active_only, if_none_match)
+
+@router.post("/", response_model=QuestionResponse, status_code=status.HTTP_201_CREATED)
+async def create_question(question: QuestionCreate, db: AsyncSession = Depends(get_async_db)):
+    db_question = Question(text=question.text, is_active=True)
+    db.add(db_question)
+    await db.run_sync(question_catalog.invalidate)
+    await db.commit()
+    await db.refresh(db_question)
+    return db_question
+
+@router.get("/", response_model=List[QuestionResponse])
+async def get_questions(active_only: bool = True, if_none_match: Optional[str] = Header(None)):
+    # Cached JSON with an ETag; 304 when the client already has this version
+    return await run_in_threadpool(_catalog_response_sync, active_only, if_none_match)
+
+@router.get("/{question_id}", response_model=QuestionResponse)
+async def get_question(question_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    db_question = await db.get(Question, question_id)
+    if not db_question:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Question not found"
+        )
+    return db_question
+
+@router.get("/{question_id}/stats", response_model=QuestionStatsResponse)
+async def get_question_stats(question_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    # Read from the maintained counters, never the answers table
+    counts = dict((await db.execute(counts_query(question_id))).all())
+    if not counts and await db.get(Question, question_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Question not found"
+        )
+    return question_stats(question_id, counts)
+
+@router.patch("/{question_id}/deactivate")
+async def deactivate_question(question_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_question = await db.get(Question, question_id)
+    if not db_question:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Question not found"
+        )
+    db_question.is_active = False
+    await db.run_sync(question_catalog.invalidate)
+    await db.run_sync(best_enemies.invalidate_all)
+    await db.run_sync(pair_score_cache.invalidate_all)
+    await db.commit()
+    # Takes the answer cache lock, like the reloads after answer writes
+    await run_in_threadpool(answer_cache.deactivate_question, question_id)
+    return {"message": "Question deactivated"}
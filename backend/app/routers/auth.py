@@ -6,8 +6,10 @@ from jose import JWTError, jwt
 from app.database import get_db
 from app.models import User
 from app.schemas import UserResponse, Token, TokenData
-from app.routers.users import verify_password
+from app.routers.users import hashing_busy
+from app.password_hashing import password_hasher, PasswordHasherBusy
 from app.config import settings
+from app.auth_cache import auth_cache
 from typing import Optional
 
 router = APIRouter()
@@ -23,31 +25,46 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
-    credentials_exception = HTTPException(
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
+def decode_user_id(token: str) -> int:
+    """User id from a bearer token, or 401"""
     if not token:
-        raise credentials_exception
+        raise credentials_exception()
+    
+    cached = auth_cache.user_id(token)
+    if cached is not None:
+        return cached
     
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
         user_id = payload.get("sub")
         if user_id is None:
-            raise credentials_exception
+            raise credentials_exception()
         # Ensure user_id is an integer
         user_id = int(user_id)
         token_data = TokenData(user_id=user_id)
     except (JWTError, ValueError, TypeError) as e:
         print(f"JWT decode error: {e}")
-        raise credentials_exception
+        raise credentials_exception()
+    auth_cache.put_token(token, token_data.user_id, payload.get("exp"))
+    return token_data.user_id
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+    user_id = decode_user_id(token)
+    user = auth_cache.user(user_id)
+    if user is not None:
+        return user
     
-    user = db.query(User).filter(User.id == token_data.user_id).first()
+    user = db.query(User).filter(User.id == user_id).first()
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
+    auth_cache.put_user(user)
     return user
 
 @router.post("/login", response_model=Token)
@@ -61,13 +78,23 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
-        if not verify_password(form_data.password, user.password_hash):
+        try:
+            verified, new_hash = password_hasher.verify_and_update(form_data.password, user.password_hash)
+        except PasswordHasherBusy:
+            raise hashing_busy()
+        if not verified:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect email or password",
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
+        # Upgrade hashes made with an older cost while the password is at hand
+        if new_hash:
+            user.password_hash = new_hash
+            db.commit()
+            auth_cache.invalidate_user(user.id)
+        
         access_token_expires = timedelta(hours=24)
         access_token = create_access_token(
             data={"sub": str(user.id)}, expires_delta=access_token_expires
@@ -1,62 +1,183 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import base64
+import json
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
-from app.database import get_db
+from sqlalchemy import String, and_, cast, literal, or_, select
+from sqlalchemy.sql import Select
+from app.database import get_db, get_read_db
 from app.models import Match, User, Answer
-from app.schemas import MatchResponse
+from app.schemas import EnemyJobResponse, MatchResponse, MatchHistoryResponse, MatchScoreResponse, PairScoreCacheStats
 from app.routers.auth import get_current_user
-from typing import List
+from typing import List, Optional, Tuple
 from app.matching import calculate_match_score, find_enemy_match
+from app.pair_scores import pair_score_cache
+from app.config import settings
+from app.enemy_jobs import FindEnemyBusy, enemy_jobs, job_query, job_response, recent_jobs_query
 
 router = APIRouter()
 
-@router.get("/user", response_model=List[MatchResponse])
-def get_user_matches(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # Get all matches for the user
-    matches = db.query(Match).filter(Match.user_id == current_user.id).all()
-    
-    result = []
-    for match in matches:
-        enemy = db.query(User).filter(User.id == match.enemy_id).first()
-        result.append(MatchResponse(
-            id=match.id,
-            enemy_id=match.enemy_id,
-            enemy_username=enemy.username,
-            enemy_email=enemy.email,
-            match_score=match.match_score,
-            matched_at=match.matched_at
+def find_enemy_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many enemy searches in progress, please retry shortly",
+        headers={"Retry-After": str(settings.find_enemy_retry_after_seconds)},
+    )
+
+def job_accepted(job: EnemyJobResponse) -> JSONResponse:
+    """202 for a queued (or coalesced) find-enemy job, pointing at where to poll it"""
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=jsonable_encoder(job),
+        headers={"Location": f"/api/matches/user/find-enemy/jobs/{job.id}"},
+    )
+
+def job_not_found() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Job not found"
+    )
+
+def encode_cursor(matched_at: str, match_id: int) -> str:
+    raw = json.dumps([matched_at, match_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        matched_at, match_id = json.loads(raw)
+        datetime.fromisoformat(matched_at)
+        return matched_at, int(match_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def match_history_query(user_id: int, limit: int, cursor: Optional[str] = None) -> Select:
+    """Newest-first matches joined to their enemy; one extra row tells whether another page exists"""
+    query = (
+        select(
+            Match.id, Match.enemy_id, User.username, User.email, Match.match_score, Match.matched_at,
+            cast(Match.matched_at, String).label("stored_matched_at"),
+        )
+        .join(User, User.id == Match.enemy_id)
+        .filter(Match.user_id == user_id)
+    )
+    if cursor:
+        # Keyset on (matched_at, id): resume strictly after the last row already returned. The cursor
+        # carries matched_at as the database stores it, since SQLite compares (and sorts) the stored
+        # text: CURRENT_TIMESTAMP rows have no fraction, so a bound datetime ("...:00.000000") would
+        # sort after them and the page would repeat
+        matched_at, match_id = decode_cursor(cursor)
+        stored = literal(matched_at, String)
+        query = query.filter(or_(
+            Match.matched_at < stored,
+            and_(Match.matched_at == stored, Match.id < match_id),
         ))
-    
-    return result
+    return query.order_by(Match.matched_at.desc(), Match.id.desc()).limit(limit + 1)
+
+def match_history_page(rows: List[tuple], limit: int) -> MatchHistoryResponse:
+    matches = [
+        MatchResponse(
+            id=row[0],
+            enemy_id=row[1],
+            enemy_username=row[2],
+            enemy_email=row[3],
+            match_score=row[4],
+            matched_at=row[5]
+        )
+        for row in rows[:limit]
+    ]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last[6], last[0])
+    return MatchHistoryResponse(matches=matches, next_cursor=next_cursor)
+
+@router.get("/user", response_model=MatchHistoryResponse)
+def get_user_matches(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    # One joined query per page, however long the history
+    rows = db.execute(match_history_query(current_user.id, limit, cursor)).all()
+    return match_history_page(rows, limit)
 
 @router.get("/user/latest", response_model=MatchResponse)
-def get_latest_match(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    match = db.query(Match).filter(Match.user_id == current_user.id).order_by(Match.matched_at.desc()).first()
-    if not match:
+def get_latest_match(current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    rows = db.execute(match_history_query(current_user.id, 0)).all()
+    if not rows:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No matches found for this user"
         )
     
-    enemy = db.query(User).filter(User.id == match.enemy_id).first()
-    return MatchResponse(
-        id=match.id,
-        enemy_id=match.enemy_id,
-        enemy_username=enemy.username,
-        enemy_email=enemy.email,
-        match_score=match.match_score,
-        matched_at=match.matched_at
-    )
+    return match_history_page(rows, 1).matches[0]
+
+@router.get("/user/score/{other_user_id}", response_model=MatchScoreResponse)
+def get_match_score(other_user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Score between the current user and another one, cached until either changes their answers"""
+    if db.scalar(select(User.id).filter(User.id == other_user_id)) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    match_score = calculate_match_score(current_user.id, other_user_id, db)
+    return MatchScoreResponse(user_id=current_user.id, other_user_id=other_user_id, match_score=match_score)
+
+@router.get("/score-cache", response_model=PairScoreCacheStats)
+def get_score_cache_stats():
+    """Hit and miss counters of this process's pair score cache"""
+    return pair_score_cache.stats()
+
+@router.get("/user/find-enemy/jobs", response_model=List[EnemyJobResponse])
+def get_find_enemy_jobs(
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """The user's most recent background find-enemy jobs, newest first"""
+    return [job_response(row) for row in db.execute(recent_jobs_query(current_user.id, limit))]
+
+@router.get("/user/find-enemy/jobs/{job_id}", response_model=EnemyJobResponse)
+def get_find_enemy_job(job_id: str, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Poll a background find-enemy job; its match is included once done"""
+    row = db.execute(job_query(job_id, current_user.id)).first()
+    if row is None:
+        raise job_not_found()
+    return job_response(row)
 
 @router.post("/user/find-enemy")
-def find_enemy(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Manually trigger enemy matching for a user"""
-    enemy_id, match_score = find_enemy_match(current_user.id, db)
-    if not enemy_id:
+def find_enemy(
+    approximate: Optional[bool] = None,
+    background: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db),
+):
+    """
+    Manually trigger enemy matching for a user (approximate=true for a faster, probable match).
+    background=true queues the search instead and answers 202 with a job to poll.
+    """
+    if background:
+        try:
+            job_id = enemy_jobs.submit(db, current_user.id, approximate)
+        except FindEnemyBusy:
+            raise find_enemy_busy()
+        return job_accepted(job_response(db.execute(job_query(job_id, current_user.id)).first()))
+
+    found = find_enemy_match(current_user.id, read_db, approximate=approximate, primary_db=db)
+    if found is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No suitable enemy found. Make sure there are other users with answers."
         )
+    enemy_id, match_score = found
     
     # Create match record
     match = Match(
@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, status
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import Question
-from app.schemas import QuestionCreate, QuestionResponse
-from typing import List
+from app.schemas import QuestionCreate, QuestionResponse, QuestionStatsResponse
+from app.answer_cache import answer_cache
+from app import best_enemies
+from app.pair_scores import pair_score_cache
+from app.question_catalog import question_catalog
+from app.question_stats import counts_query, question_stats
+from typing import List, Optional
 
 router = APIRouter()
 
@@ -11,20 +16,22 @@ router = APIRouter()
 def create_question(question: QuestionCreate, db: Session = Depends(get_db)):
     db_question = Question(text=question.text, is_active=True)
     db.add(db_question)
+    question_catalog.invalidate(db)
     db.commit()
     db.refresh(db_question)
     return db_question
 
 @router.get("/", response_model=List[QuestionResponse])
-def get_questions(active_only: bool = True, db: Session = Depends(get_db)):
-    query = db.query(Question)
-    if active_only:
-        query = query.filter(Question.is_active == True)
-    questions = query.all()
-    return questions
+def get_questions(
+    active_only: bool = True,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db),
+):
+    # Cached JSON with an ETag; 304 when the client already has this version
+    return question_catalog.response(db, active_only, if_none_match)
 
 @router.get("/{question_id}", response_model=QuestionResponse)
-def get_question(question_id: int, db: Session = Depends(get_db)):
+def get_question(question_id: int, db: Session = Depends(get_read_db)):
     db_question = db.query(Question).filter(Question.id == question_id).first()
     if not db_question:
         raise HTTPException(
@@ -33,6 +40,17 @@ def get_question(question_id: int, db: Session = Depends(get_db)):
         )
     return db_question
 
+@router.get("/{question_id}/stats", response_model=QuestionStatsResponse)
+def get_question_stats(question_id: int, db: Session = Depends(get_read_db)):
+    # Read from the maintained counters, never the answers table
+    counts = dict(db.execute(counts_query(question_id)).all())
+    if not counts and db.get(Question, question_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Question not found"
+        )
+    return question_stats(question_id, counts)
+
 @router.patch("/{question_id}/deactivate")
 def deactivate_question(question_id: int, db: Session = Depends(get_db)):
     db_question = db.query(Question).filter(Question.id == question_id).first()
@@ -42,5 +60,9 @@ def deactivate_question(question_id: int, db: Session = Depends(get_db)):
             detail="Question not found"
         )
     db_question.is_active = False
+    question_catalog.invalidate(db)
+    best_enemies.invalidate_all(db)
+    pair_score_cache.invalidate_all(db)
     db.commit()
+    answer_cache.deactivate_question(question_id)
     return {"message": "Question deactivated"}
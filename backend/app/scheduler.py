@@ -1,13 +1,78 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from datetime import datetime, timezone
+from app.config import settings
 from app.database import SessionLocal
-from app.email_service import match_all_users
+from app.leader_lease import LeaderLease
+from app import best_enemies
 import asyncio
+import functools
 
 scheduler = AsyncIOScheduler()
 
+# Every process schedules the jobs, but only the holder of this lease runs them (see leader_lease)
+leader = LeaderLease("scheduler", lease_seconds=settings.scheduler_lease_seconds)
+LEADER_JOB_ID = "scheduler_leader"
+
+def leader_only(job):
+    """Make a job a no-op outside the elected leader"""
+    @functools.wraps(job)
+    async def run():
+        if leader.is_leader:
+            await job()
+    return run
+
+def _renew_lease():
+    with SessionLocal() as db:
+        return leader.renew(db)
+
+def _catch_up(since: datetime):
+    """Run now any job that came due while nobody held the lease"""
+    now = datetime.now(timezone.utc)
+    since = since.replace(tzinfo=timezone.utc)
+    for job in scheduler.get_jobs():
+        if job.id == LEADER_JOB_ID:
+            continue
+        due = job.trigger.get_next_fire_time(None, since)
+        if due is not None and due <= now:
+            print(f"Catching up on {job.name}, due at {due} while the scheduler had no leader")
+            job.modify(next_run_time=now)
+
+async def leader_election_job():
+    """Job (on every process) to take or keep the scheduler lease"""
+    try:
+        took_over_since = await asyncio.get_running_loop().run_in_executor(None, _renew_lease)
+    except Exception as e:
+        print(f"Error renewing the scheduler lease: {str(e)}")
+        return
+    if took_over_since is not None:
+        _catch_up(took_over_since)
+
+def release_leadership():
+    """Hand the lease over at shutdown instead of making the others wait for it to expire"""
+    try:
+        with SessionLocal() as db:
+            leader.release(db)
+    except Exception as e:
+        print(f"Error releasing the scheduler lease: {str(e)}")
+
+scheduler.add_job(
+    leader_election_job,
+    trigger=IntervalTrigger(seconds=max(1, settings.scheduler_lease_seconds / 3)),
+    id=LEADER_JOB_ID,
+    name="Scheduler Leader Election",
+    replace_existing=True,
+    max_instances=1,
+    coalesce=True,
+    next_run_time=datetime.now(timezone.utc)
+)
+
+@leader_only
 async def monthly_matching_job():
     """Job to run monthly enemy matching"""
+    from app.email_service import match_all_users
+
     print("Running monthly enemy matching...")
     db = SessionLocal()
     try:
@@ -25,3 +90,29 @@ scheduler.add_job(
     name="Monthly Enemy Matching",
     replace_existing=True
 )
+
+def _sweep_best_enemies():
+    # On the primary: the sweep catches the answer cache up from it before recomputing
+    with SessionLocal() as db:
+        swept = best_enemies.sweep(db, settings.best_enemy_sweep_batch)
+    if swept:
+        print(f"Recomputed {swept} dirty best enemies")
+
+@leader_only
+async def best_enemy_sweep_job():
+    """Job to offer changed users to the best enemies they may beat and recompute dirty ones, off the request path"""
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, _sweep_best_enemies)
+    except Exception as e:
+        print(f"Error in best enemy sweep: {str(e)}")
+
+if settings.best_enemy_sweep_seconds > 0:
+    scheduler.add_job(
+        best_enemy_sweep_job,
+        trigger=IntervalTrigger(seconds=settings.best_enemy_sweep_seconds),
+        id="best_enemy_sweep",
+        name="Best Enemy Sweep",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
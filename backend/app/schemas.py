@@ -40,6 +40,13 @@ class QuestionResponse(QuestionBase):
     class Config:
         from_attributes = True
 
+class QuestionStatsResponse(BaseModel):
+    question_id: int
+    total: int
+    counts: List[int]  # Answers per value, counts[0] for 1 through counts[9] for 10
+    mean: Optional[float]
+    variance: Optional[float]  # Population variance; None with no answers
+
 # Answer schemas
 class AnswerBase(BaseModel):
     question_id: int
@@ -72,6 +79,30 @@ class MatchResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class EnemyJobResponse(BaseModel):
+    id: str
+    status: str  # queued, running, done, failed
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    match: Optional[MatchResponse] = None  # Once done
+    error: Optional[str] = None  # Once failed
+
+class MatchScoreResponse(BaseModel):
+    user_id: int
+    other_user_id: int
+    match_score: float  # Higher score = more incompatible
+
+class PairScoreCacheStats(BaseModel):
+    entries: int
+    max_entries: int
+    hits: int  # Served from memory
+    persisted_hits: int  # Served from the pair_scores table
+    misses: int  # Scored
+
+class MatchHistoryResponse(BaseModel):
+    matches: List[MatchResponse]
+    next_cursor: Optional[str] = None  # Pass back as ?cursor= for the next (older) page
+
 # Survey response
 class SurveyResponse(BaseModel):
     answers: List[AnswerCreate]
@@ -0,0 +1,155 @@
+"""
+Pool of authenticated SMTP connections for bulk match notifications.
+
+aiosmtplib.send opens (and TLS-negotiates, and authenticates) a fresh
+connection for every message. The pool keeps a few connections open and
+sends many messages over each, with a semaphore bounding how many sends are
+in flight. A connection that fails is dropped and replaced, and the message
+is retried on the new one.
+"""
+import asyncio
+import time
+import aiosmtplib
+from contextlib import asynccontextmanager
+from email.message import Message
+from typing import AsyncIterator, Awaitable, Callable, Iterable, List, Optional
+
+
+class SMTPPool:
+    """Fixed-size pool of logged-in aiosmtplib.SMTP connections"""
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        use_tls: bool = False,
+        size: int = 4,
+        retries: int = 2,
+        timeout: float = 60,
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.username = username or None
+        self.password = password or None
+        self.use_tls = use_tls
+        self.size = size
+        self.retries = retries
+        self.timeout = timeout
+        self._idle: "asyncio.Queue[Optional[aiosmtplib.SMTP]]" = asyncio.Queue()
+        for _ in range(size):
+            # None is a free slot that gets a connection on first use
+            self._idle.put_nowait(None)
+        self._open: List[aiosmtplib.SMTP] = []
+
+        self.sent = 0
+        self.failed = 0
+        self.reconnects = 0
+        self._started: Optional[float] = None
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            use_tls=self.use_tls,
+            timeout=self.timeout,
+        )
+        await smtp.connect()
+        self._open.append(smtp)
+        return smtp
+
+    def _discard(self, smtp: Optional[aiosmtplib.SMTP]):
+        if smtp is None:
+            return
+        if smtp in self._open:
+            self._open.remove(smtp)
+        smtp.close()
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[aiosmtplib.SMTP]:
+        """Borrow a connected client; it goes back to the pool afterwards"""
+        smtp = await self._idle.get()
+        try:
+            if smtp is None or not smtp.is_connected:
+                self._discard(smtp)
+                smtp = await self._connect()
+            yield smtp
+        except (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused):
+            # The server answered, so the connection itself is still usable
+            raise
+        except BaseException:
+            # A connection that failed mid-send can't be trusted; free the slot
+            self._discard(smtp)
+            smtp = None
+            raise
+        finally:
+            self._idle.put_nowait(smtp)
+
+    async def send(self, message: Message) -> bool:
+        """Send one message, reconnecting and retrying on failure"""
+        if self._started is None:
+            self._started = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.connection() as smtp:
+                    await smtp.send_message(message)
+                self.sent += 1
+                return True
+            except (aiosmtplib.SMTPException, OSError, asyncio.TimeoutError) as e:
+                if attempt < self.retries and not _permanent(e):
+                    self.reconnects += 1
+                    continue
+                print(f"Failed to send email to {message['To']}: {str(e)}")
+                break
+        self.failed += 1
+        return False
+
+    async def close(self):
+        """QUIT every open connection"""
+        for smtp in list(self._open):
+            try:
+                await smtp.quit()
+            except (aiosmtplib.SMTPException, OSError):
+                smtp.close()
+        self._open.clear()
+
+    async def __aenter__(self) -> "SMTPPool":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @property
+    def throughput(self) -> float:
+        """Messages sent per second since the first send"""
+        if self._started is None:
+            return 0.0
+        elapsed = time.perf_counter() - self._started
+        return self.sent / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"Sent {self.sent} emails ({self.failed} failed, {self.reconnects} reconnects) "
+            f"over {self.size} connections at {self.throughput:.1f} msg/s"
+        )
+
+
+def _permanent(error: Exception) -> bool:
+    """Whether the server refused the message for good (5xx), so retrying is pointless"""
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return all(refused.code >= 500 for refused in error.recipients)
+    return isinstance(error, aiosmtplib.SMTPResponseException) and error.code >= 500
+
+
+async def fan_out(jobs: Iterable[Callable[[], Awaitable[None]]], concurrency: int):
+    """Run coroutine factories with at most `concurrency` of them in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(job: Callable[[], Awaitable[None]]):
+        async with semaphore:
+            await job()
+
+    await asyncio.gather(*(run(job) for job in jobs))
@@ -0,0 +1,113 @@
+"""
+Application startup and shutdown, as explicit timed phases.
+
+Importing app.main used to migrate the database and start the scheduler as
+side effects, which every worker spawn, script and test collection paid for.
+All of it now runs from the FastAPI lifespan, one phase at a time:
+
+    migrate       bring the schema up to date
+    answer store  build the memory-mapped answer store if it is missing or stale
+    warm-up       (startup_warmup) render the question catalog and load the
+                  answer cache, so the first requests don't pay for them
+    scheduler     (scheduler_enabled) join the leader election for scheduled jobs
+
+The process reports ready once they are done, and prints how long each took
+(also kept on app.state.startup_phases). APScheduler and the email stack are
+only imported by the phases and jobs that need them.
+"""
+import time
+from contextlib import asynccontextmanager, contextmanager
+from fastapi import FastAPI
+from app.config import settings
+from typing import Dict, Optional
+
+
+class StartupPhases:
+    """Wall time of each named phase, in the order they ran"""
+
+    def __init__(self, started_at: Optional[float] = None):
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        self.durations: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = time.perf_counter() - start
+
+    def summary(self) -> str:
+        phases = ", ".join(f"{name} {1000 * seconds:.0f} ms" for name, seconds in self.durations.items())
+        return f"Startup: {phases}; ready {1000 * (time.perf_counter() - self.started_at):.0f} ms after app.main started loading"
+
+
+def migrate_database():
+    from app.database import engine
+    from app.migrations import migrate
+
+    migrate(engine)
+
+
+def build_answer_store():
+    from app.answer_store import answer_store
+    from app.database import ReadSessionLocal
+
+    if answer_store is not None:
+        with ReadSessionLocal() as db:
+            answer_store.ensure_built(db)
+
+
+def warm_up():
+    """Preload the question catalog and the matching data"""
+    from app.answer_cache import answer_cache
+    from app.database import ReadSessionLocal
+    from app.question_catalog import question_catalog
+
+    with ReadSessionLocal() as db:
+        question_catalog.preload(db)
+        answer_cache.warm(db)
+
+
+def start_scheduler():
+    from app.scheduler import scheduler
+
+    scheduler.start()
+
+
+async def shut_down():
+    from app.database import async_engine, async_read_engine
+    from app.enemy_jobs import enemy_jobs
+    from app.password_hashing import password_hasher
+
+    if settings.scheduler_enabled:
+        from app.scheduler import release_leadership, scheduler
+        if scheduler.running:
+            scheduler.shutdown()
+            release_leadership()
+    password_hasher.shutdown()
+    enemy_jobs.shutdown()
+    for async_db_engine in {async_engine, async_read_engine} - {None}:
+        await async_db_engine.dispose()
+
+
+def lifespan(started_at: Optional[float] = None):
+    """FastAPI lifespan running the startup phases (timed from started_at, e.g. the start of the import)"""
+    @asynccontextmanager
+    async def run(app: FastAPI):
+        phases = StartupPhases(started_at)
+        with phases.phase("migrate"):
+            migrate_database()
+        with phases.phase("answer store"):
+            build_answer_store()
+        if settings.startup_warmup:
+            with phases.phase("warm-up"):
+                warm_up()
+        if settings.scheduler_enabled:
+            with phases.phase("scheduler"):
+                start_scheduler()
+        app.state.startup_phases = dict(phases.durations)
+        print(phases.summary())
+        yield
+        await shut_down()
+    return run
@@ -0,0 +1,64 @@
+"""
+Answer store vs loading from the database: time to get a matrix, bytes it
+holds, and the monthly batch scorer over a worker pool fed either way
+(pickled arrays per worker vs each worker mapping the store file).
+
+Run from the backend directory:
+    python -m benchmarks.answer_store --users 100000 --questions 50 --workers 4
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--density", type=float, default=0.8)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--block-size", type=int, default=2048)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{directory}/benchmark.db"
+    from app.answer_matrix import AnswerMatrix
+    from app.answer_store import AnswerStore
+    from app.batch_matching import find_all_enemies
+    from app.database import SessionLocal, engine
+    from app.migrations import migrate
+    from benchmarks.synthetic import populate
+
+    migrate(engine)
+    db = SessionLocal()
+    populate(db, args.users, args.questions, args.density)
+    store = AnswerStore(f"{directory}/answers.store")
+
+    loaded, from_db_seconds = timed(lambda: AnswerMatrix.from_db(db))
+    _, rebuild_seconds = timed(lambda: store.rebuild(db))
+    mapped, map_seconds = timed(store.matrix)
+    db.close()
+
+    print(f"{args.users} users x {args.questions} questions at density {args.density}")
+    print(f"{'from_db':>16} {1000 * from_db_seconds:>10.1f} ms  {(loaded.values.nbytes + loaded.mask.nbytes) / 2**20:>8.1f} MiB per process")
+    print(f"{'store rebuild':>16} {1000 * rebuild_seconds:>10.1f} ms  {os.path.getsize(store.path) / 2**20:>8.1f} MiB file, shared")
+    print(f"{'store matrix()':>16} {1000 * map_seconds:>10.3f} ms")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        pickled, pickled_seconds = timed(lambda: find_all_enemies(loaded, block_size=args.block_size, workers=args.workers))
+        shared, shared_seconds = timed(lambda: find_all_enemies(mapped, block_size=args.block_size, workers=args.workers))
+    assert pickled == shared, "store and database matrices disagree"
+    print(f"find_all_enemies, {args.workers} workers: {pickled_seconds:.2f}s pickled arrays, {shared_seconds:.2f}s mapped store")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Recall vs latency of the approximate enemy search (random projections plus
+farthest index buckets) against the exact scorer, on synthetic populations.
+Recall counts queries whose result is as incompatible as the true best enemy;
+the score gap is how many points short the misses fall on average.
+
+Run from the backend directory:
+    python -m benchmarks.approximate --users 100000 1000000 --candidates 256 1024 4096
+"""
+import argparse
+import time
+import numpy as np
+from app.enemy_index import EnemyIndex
+from app.projection_sketch import ProjectionSketch, approximate_best_enemy
+from benchmarks.synthetic import synthetic_matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--camps", type=int, default=8)
+    parser.add_argument("--density", type=float, default=1.0)
+    parser.add_argument("--projections", type=int, default=64)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[256, 1024, 4096, 16384])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'users':>9} {'mode':>18} {'recall %':>9} {'score gap':>10} {'ms/query':>9}")
+    for users in args.users:
+        matrix = synthetic_matrix(users, args.questions, args.camps, args.density, args.seed)
+        index = EnemyIndex.build(matrix)
+        sketch = ProjectionSketch.build(matrix, projections=args.projections)
+        rng = np.random.default_rng(args.seed + 1)
+        targets = rng.choice(matrix.user_ids, size=args.queries, replace=False)
+
+        exact = {}
+        start = time.perf_counter()
+        for user_id in targets:
+            exact[user_id] = index.best_enemy(matrix, user_id)
+        elapsed = time.perf_counter() - start
+        print(f"{users:>9} {'exact (index)':>18} {100.0:>9.1f} {0.0:>10.2f} {1000 * elapsed / len(targets):>9.2f}")
+
+        for candidates in args.candidates:
+            hits = 0
+            gap = 0.0
+            start = time.perf_counter()
+            results = [approximate_best_enemy(matrix, user_id, candidates, sketch, index) for user_id in targets]
+            elapsed = time.perf_counter() - start
+            for user_id, result in zip(targets, results):
+                # A hit is any enemy as incompatible as the true best one
+                hits += result[1] == exact[user_id][1]
+                gap += exact[user_id][1] - result[1]
+            print(
+                f"{users:>9} {f'approx {candidates}':>18} {100 * hits / len(targets):>9.1f} "
+                f"{gap / len(targets):>10.2f} {1000 * elapsed / len(targets):>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
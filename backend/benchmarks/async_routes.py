@@ -0,0 +1,126 @@
+"""
+Requests per second and latency percentiles of the hot read routes, served
+with sync routers (threadpool + Session) and with database_async
+(async def + AsyncSession), at high client concurrency.
+
+Each mode gets its own uvicorn process on a freshly seeded SQLite database;
+the load generator runs in this process. Run from the backend directory:
+    python -m benchmarks.async_routes --users 200 --requests 20000 --concurrency 64 256
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+import numpy as np
+
+ROUTES = ["/api/auth/me", "/api/questions/", "/api/answers/user", "/api/matches/user"]
+
+
+def seed(url: str, users: int, questions: int, seed: int):
+    """Users with answers and a match each, written straight through the sync engine"""
+    os.environ["DATABASE_URL"] = url
+    from app.database import SessionLocal, engine
+    from app.migrations import migrate
+    from app.models import Answer, Match, Question, User
+    from app.routers.users import get_password_hash
+
+    migrate(engine)
+    rng = random.Random(seed)
+    password_hash = get_password_hash("benchmark")
+    db = SessionLocal()
+    db.add_all(Question(text=f"Question {q}") for q in range(questions))
+    db.add_all(User(email=f"user{u}@example.com", username=f"user{u}", password_hash=password_hash) for u in range(users))
+    db.commit()
+    db.add_all(
+        Answer(user_id=u, question_id=q, answer_value=rng.randint(1, 10))
+        for u in range(1, users + 1)
+        for q in range(1, questions + 1)
+    )
+    db.add_all(Match(user_id=u, enemy_id=u % users + 1, match_score=50.0) for u in range(1, users + 1))
+    db.commit()
+    db.close()
+
+
+def serve(url: str, port: int, database_async: bool) -> subprocess.Popen:
+    env = dict(os.environ, DATABASE_URL=url, DATABASE_ASYNC=str(database_async).lower())
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("server did not start")
+
+
+async def load(port: int, users: int, requests: int, concurrency: int):
+    """Fire `requests` GETs over the hot routes, `concurrency` at a time; returns (rps, latencies, errors)"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+        tokens = []
+        for u in range(min(users, 50)):
+            response = await client.post("/api/auth/login", data={"username": f"user{u}@example.com", "password": "benchmark"})
+            tokens.append({"Authorization": f"Bearer {response.json()['access_token']}"})
+
+        latencies = []
+        errors = 0
+        queue = asyncio.Queue()
+        for i in range(requests):
+            queue.put_nowait(i)
+
+        async def client_loop():
+            nonlocal errors
+            while not queue.empty():
+                i = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    response = await client.get(ROUTES[i % len(ROUTES)], headers=tokens[i % len(tokens)])
+                    errors += response.status_code != 200
+                except httpx.TransportError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return requests / elapsed, np.array(latencies), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=15)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[64, 256])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    url = f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+    seed(url, args.users, args.questions, args.seed)
+
+    print(f"{'mode':>6} {'clients':>8} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for database_async in (False, True):
+        server = serve(url, args.port, database_async)
+        try:
+            for concurrency in args.concurrency:
+                rps, latencies, errors = asyncio.run(load(args.port, args.users, args.requests, concurrency))
+                p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+                mode = "async" if database_async else "sync"
+                print(f"{mode:>6} {concurrency:>8} {rps:>9.1f} {p50:>8.1f} {p99:>8.1f} {errors:>7}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+/api/auth/me throughput with and without the authentication cache, plus the
+SQL statements each request costs. Requests go through the ASGI app in
+process (no network), so the numbers isolate the handler and its queries.
+
+Run from the backend directory:
+    python -m benchmarks.auth_cache --users 100 --requests 5000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--database-url", default=None, help="Defaults to a fresh SQLite file")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", args.database_url or f"sqlite:///{tempfile.mkdtemp()}/benchmark.db")
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from app.auth_cache import auth_cache
+    from app.database import SessionLocal, engine
+    from app.main import app
+    from app.migrations import migrate
+    from app.models import User
+    from app.routers.auth import create_access_token
+    from app.routers.users import get_password_hash
+
+    migrate(engine)
+    db = SessionLocal()
+    password_hash = get_password_hash("benchmark")
+    db.add_all(User(email=f"user{u}@example.com", username=f"user{u}", password_hash=password_hash) for u in range(args.users))
+    db.commit()
+    headers = [{"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"} for (user_id,) in db.query(User.id)]
+    db.close()
+
+    statements = 0
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count(*_):
+        nonlocal statements
+        statements += 1
+
+    ttl = auth_cache.users.ttl
+    print(f"{'cache':>6} {'req/s':>9} {'us/req':>8} {'SQL/req':>8}")
+    with TestClient(app) as client:
+        for enabled in (False, True):
+            auth_cache.tokens.clear()
+            auth_cache.users.clear()
+            auth_cache.tokens.ttl = auth_cache.users.ttl = ttl if enabled else 0
+            statements = 0
+            start = time.perf_counter()
+            for i in range(args.requests):
+                response = client.get("/api/auth/me", headers=headers[i % len(headers)])
+                assert response.status_code == 200, response.text
+            elapsed = time.perf_counter() - start
+            print(
+                f"{'on' if enabled else 'off':>6} {args.requests / elapsed:>9.1f} "
+                f"{1e6 * elapsed / args.requests:>8.0f} {statements / args.requests:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
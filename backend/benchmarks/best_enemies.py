@@ -0,0 +1,92 @@
+"""
+Materialized best enemies: find-enemy served from a clean entry vs scored
+through the answer cache, and what an answer change costs to propagate:
+the dirty marks on the request path (answers_changed) and the offers to the
+users it might now beat, made later by the sweep (offer_changes).
+
+Run from the backend directory:
+    python -m benchmarks.best_enemies --users 20000 --questions 30 --lookups 500
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--density", type=float, default=0.8)
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--changes", type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+    import numpy as np
+    from sqlalchemy import func, select
+    from app import best_enemies
+    from app.answer_cache import answer_cache, bump_answers_version
+    from app.batch_matching import find_all_enemies
+    from app.database import SessionLocal, engine
+    from app.migrations import migrate
+    from app.models import BestEnemy
+    from app.routers.answers import upsert_answers
+    from benchmarks.synthetic import populate
+
+    migrate(engine)
+    db = SessionLocal()
+    user_ids, question_ids = populate(db, args.users, args.questions, args.density)
+    rng = np.random.default_rng(1)
+    picks = [int(user_id) for user_id in rng.choice(user_ids, size=args.lookups)]
+
+    def timed_ms(function, items):
+        timings = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for item in items:
+                start = time.perf_counter()
+                function(item)
+                timings.append(1000 * (time.perf_counter() - start))
+        return statistics.median(timings)
+
+    answer_cache.resync(db)
+    scored = timed_ms(lambda user_id: answer_cache.best_enemy(db, user_id), picks)
+    first = timed_ms(lambda user_id: best_enemies.lookup(db, user_id), picks)
+    clean = timed_ms(lambda user_id: best_enemies.lookup(db, user_id), picks)
+    print(f"{args.users} users x {args.questions} questions, median per find-enemy:")
+    print(f"  scored by the answer cache   {scored:8.3f} ms")
+    print(f"  first lookup (score + store) {first:8.3f} ms")
+    print(f"  clean materialized entry     {clean:8.3f} ms")
+
+    # Fill every entry in one batch, then time propagating answer changes
+    _, snapshot = answer_cache.snapshot()
+    enemies = find_all_enemies(snapshot)
+    best_enemies.save(db, {int(user_id): enemies.get(int(user_id)) for user_id in user_ids}, {})
+    db.commit()
+    changers = [int(user_id) for user_id in rng.choice(user_ids, size=args.changes)]
+
+    def change(user_id):
+        answers = {int(question_id): int(rng.integers(1, 11)) for question_id in question_ids}
+        bump_answers_version(db, user_id)
+        best_enemies.answers_changed(db, user_id)
+        db.execute(upsert_answers(db.get_bind().dialect.name, user_id, answers))
+        db.commit()
+        answer_cache.update_answers(db, user_id, answers)
+
+    propagate = timed_ms(change, changers)
+    dirty = db.scalar(select(func.count()).select_from(BestEnemy).where(BestEnemy.dirty == True))
+    print(f"  answer change (dirty marks)  {propagate:8.3f} ms  ({dirty} of {args.users} entries dirty after {args.changes} changes)")
+    pending = timed_ms(lambda user_id: best_enemies.lookup(db, user_id), [user_id for user_id in picks if user_id not in changers][:100])
+    print(f"  clean entry, offers pending  {pending:8.3f} ms")
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        offered = best_enemies.offer_changes(db)
+    print(f"  offers for {offered} changed users {1000 * (time.perf_counter() - start) / max(1, offered):8.3f} ms each (sweep)")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark for the exact enemy index: how many candidates it prunes and how
+much faster it is than an exhaustive scan, on synthetic populations.
+
+Run from the backend directory:
+    python -m benchmarks.enemy_index --users 10000 100000 1000000
+"""
+import argparse
+import time
+import numpy as np
+from app.enemy_index import EnemyIndex
+from benchmarks.synthetic import synthetic_matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--camps", type=int, default=8)
+    parser.add_argument("--density", type=float, default=1.0)
+    parser.add_argument("--bucket-size", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'users':>9} {'build s':>8} {'pruned %':>9} {'scan ms':>9} {'index ms':>9} {'speedup':>8}")
+    for users in args.users:
+        matrix = synthetic_matrix(users, args.questions, args.camps, args.density, args.seed)
+        start = time.perf_counter()
+        index = EnemyIndex.build(matrix, bucket_size=args.bucket_size)
+        build_time = time.perf_counter() - start
+
+        rng = np.random.default_rng(args.seed + 1)
+        targets = rng.choice(matrix.user_ids, size=args.queries, replace=False)
+        scan_time = index_time = 0.0
+        scored = total = 0
+        for user_id in targets:
+            start = time.perf_counter()
+            expected = matrix.best_enemy(user_id)
+            scan_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            result = index.best_enemy(matrix, user_id)
+            index_time += time.perf_counter() - start
+
+            assert result == expected, (user_id, result, expected)
+            scored += index.last_scored
+            total += index.last_total
+
+        pruned = 100 * (1 - scored / total)
+        print(
+            f"{users:>9} {build_time:>8.2f} {pruned:>9.1f} "
+            f"{1000 * scan_time / len(targets):>9.2f} {1000 * index_time / len(targets):>9.2f} "
+            f"{scan_time / index_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
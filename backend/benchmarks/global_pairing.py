@@ -0,0 +1,39 @@
+"""
+Runtime and objective of global (mutual) pairing against the per-user argmax
+baseline, on synthetic populations.
+
+Run from the backend directory:
+    python -m benchmarks.global_pairing --users 10000 50000 --workers 4
+"""
+import argparse
+import time
+from app.batch_matching import find_all_enemies
+from app.global_pairing import pair_globally
+from benchmarks.synthetic import synthetic_matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[10_000, 50_000])
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--camps", type=int, default=8)
+    parser.add_argument("--density", type=float, default=1.0)
+    parser.add_argument("--candidates", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for users in args.users:
+        matrix = synthetic_matrix(users, args.questions, args.camps, args.density, args.seed)
+
+        start = time.perf_counter()
+        find_all_enemies(matrix, workers=args.workers)
+        argmax_time = time.perf_counter() - start
+
+        _, report = pair_globally(matrix, candidates=args.candidates, workers=args.workers)
+        print(f"argmax: {argmax_time:.2f}s")
+        print(report.summary())
+
+
+if __name__ == "__main__":
+    main()
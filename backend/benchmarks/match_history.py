@@ -0,0 +1,96 @@
+"""
+GET /api/matches/user cost against history length: SQL statements per request
+(authentication included) and latency, first page and walking every page.
+The statement count should stay flat however many matches a user has.
+Requests go through the ASGI app in process (no network). This measures
+cost only; tests/test_match_history.py covers the paging itself.
+
+Run from the backend directory:
+    python -m benchmarks.match_history --histories 10 100 1000 --requests 200
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--histories", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--database-url", default=None, help="Defaults to a fresh SQLite file")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", args.database_url or f"sqlite:///{tempfile.mkdtemp()}/benchmark.db")
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from app.database import SessionLocal, async_engine, async_read_engine, engine, read_engine
+    from app.main import app
+    from app.migrations import migrate
+    from app.models import Match, User
+    from app.routers.auth import create_access_token
+
+    migrate(engine)
+    db = SessionLocal()
+    enemies = [User(email=f"enemy{e}@example.com", username=f"enemy{e}", password_hash="-") for e in range(50)]
+    db.add_all(enemies)
+    db.flush()
+    headers = {}
+    start_month = datetime(2000, 1, 1)
+    for history in args.histories:
+        user = User(email=f"user{history}@example.com", username=f"user{history}", password_hash="-")
+        db.add(user)
+        db.flush()
+        db.add_all(
+            # Pairs of matches share a timestamp, as monthly runs stamp theirs
+            Match(user_id=user.id, enemy_id=enemies[m % len(enemies)].id, match_score=50.0,
+                  matched_at=start_month + timedelta(days=31 * (m // 2)))
+            for m in range(history)
+        )
+        headers[history] = {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+    db.commit()
+    db.close()
+
+    statements = 0
+
+    def count(*_):
+        nonlocal statements
+        statements += 1
+
+    async_engines = {bound.sync_engine for bound in (async_engine, async_read_engine) if bound is not None}
+    for bound in {engine, read_engine} | async_engines:
+        event.listen(bound, "before_cursor_execute", count)
+
+    with TestClient(app) as client:
+        print(f"{'history':>8} {'req/s':>9} {'us/req':>8} {'SQL/req':>8} {'pages':>6} {'SQL/page':>9}")
+        for history in args.histories:
+            client.get("/api/matches/user", headers=headers[history])  # warm the auth cache
+            statements = 0
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                response = client.get("/api/matches/user", params={"limit": args.limit}, headers=headers[history])
+                assert response.status_code == 200, response.text
+            elapsed = time.perf_counter() - start
+            first_page = statements / args.requests
+
+            statements = 0
+            seen, pages, cursor = set(), 0, None
+            while True:
+                params = {"limit": args.limit, **({"cursor": cursor} if cursor else {})}
+                page = client.get("/api/matches/user", params=params, headers=headers[history]).json()
+                seen.update(match["id"] for match in page["matches"])
+                pages += 1
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    break
+            assert len(seen) == history, (len(seen), history)
+            print(
+                f"{history:>8} {args.requests / elapsed:>9.1f} {1e6 * elapsed / args.requests:>8.0f} "
+                f"{first_page:>8.2f} {pages:>6} {statements / pages:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Pair score cache: calculate_match_score served from memory or from the
+pair_scores table vs scored through the answer cache, plus the share of
+hits when a fraction of users keep changing their answers.
+
+Run from the backend directory:
+    python -m benchmarks.pair_scores --users 20000 --questions 30 --pairs 2000
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--density", type=float, default=0.8)
+    parser.add_argument("--pairs", type=int, default=2000)
+    parser.add_argument("--churn", type=float, default=0.05, help="Share of the pairs' users changing answers between passes")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+    os.environ["PAIR_SCORE_CACHE_PERSIST"] = "true"
+    import numpy as np
+    from app.answer_cache import answer_cache, bump_answers_version
+    from app.database import SessionLocal, engine
+    from app.migrations import migrate
+    from app.pair_scores import pair_score_cache
+    from app.routers.answers import upsert_answers
+    from benchmarks.synthetic import populate
+
+    migrate(engine)
+    db = SessionLocal()
+    user_ids, question_ids = populate(db, args.users, args.questions, args.density)
+    rng = np.random.default_rng(1)
+    pairs = [tuple(int(user_id) for user_id in pair) for pair in rng.choice(user_ids, size=(args.pairs, 2))]
+
+    def timed_ms(function, items):
+        timings = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for item in items:
+                start = time.perf_counter()
+                function(*item)
+                timings.append(1000 * (time.perf_counter() - start))
+        return statistics.median(timings)
+
+    answer_cache.resync(db)
+    answer_cache.stamps(db, *{user_id for pair in pairs for user_id in pair})
+    scored = timed_ms(lambda u1, u2: answer_cache.pair_score(db, u1, u2), pairs)
+    miss = timed_ms(lambda u1, u2: pair_score_cache.score(db, u1, u2), pairs)
+    hit = timed_ms(lambda u1, u2: pair_score_cache.score(db, u1, u2), pairs)
+    pair_score_cache.clear()
+    persisted = timed_ms(lambda u1, u2: pair_score_cache.score(db, u1, u2), pairs)
+    print(f"{args.users} users x {args.questions} questions, median per calculate_match_score:")
+    print(f"  scored by the answer cache   {scored:8.3f} ms")
+    print(f"  miss (score + persist)       {miss:8.3f} ms")
+    print(f"  memory hit                   {hit:8.3f} ms")
+    print(f"  persisted hit                {persisted:8.3f} ms")
+
+    # Some users change their answers (as the routes would), then every pair is asked again
+    involved = sorted({user_id for pair in pairs for user_id in pair})
+    changers = rng.choice(involved, size=max(1, int(args.churn * len(involved))), replace=False)
+    for user_id in changers.tolist():
+        answers = {int(question_id): int(rng.integers(1, 11)) for question_id in question_ids}
+        bump_answers_version(db, user_id)
+        db.execute(upsert_answers(db.get_bind().dialect.name, user_id, answers))
+        db.commit()
+        answer_cache.update_answers(db, user_id, answers)
+    before = pair_score_cache.stats()
+    for u1, u2 in pairs:
+        pair_score_cache.score(db, u1, u2)
+    after = pair_score_cache.stats()
+    hits = after["hits"] - before["hits"]
+    misses = after["misses"] - before["misses"]
+    print(f"  after {len(changers)} of {len(involved)} users changed answers: {hits} hits, {misses} misses")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Query plans of the hot queries on SQLite, for any migrated database file.
+
+The queries and the regression rule live in tests/test_query_plans.py, which
+checks them against a fresh database as part of the test suite. This script
+prints every plan, marking the steps that scan a whole table or sort in a
+temporary B-tree, and exits with status 1 if there are any.
+
+Run from the backend directory:
+    python -m benchmarks.query_plans
+    python -m benchmarks.query_plans --database-url sqlite:///./nemesis.db  # check a real (migrated) file
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None, help="SQLite URL; defaults to a fresh file")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/plans.db"
+    os.environ["DATABASE_TYPE"] = "sqlite"
+    from app.database import engine
+    from app.migrations import migrate
+    from tests.test_query_plans import hot_queries, query_plan, regressions
+
+    migrate(engine)
+    queries = hot_queries()
+    failed = []
+    with engine.connect() as connection:
+        for name, statement in queries:
+            plan = query_plan(connection, statement)
+            bad = regressions(plan)
+            print(f"{'FAIL' if bad else 'ok':>4}  {name}")
+            for detail in plan:
+                print(f"        {'!' if detail in bad else ' '} {detail}")
+            if bad:
+                failed.append(name)
+
+    if failed:
+        print(f"\n{len(failed)} of {len(queries)} queries regressed: {', '.join(failed)}")
+        sys.exit(1)
+    print(f"\nAll {len(queries)} hot queries use an index")
+
+
+if __name__ == "__main__":
+    main()
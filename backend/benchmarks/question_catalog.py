@@ -0,0 +1,68 @@
+"""
+GET /api/questions/ throughput: rendering every request (cache off), serving
+the cached body (warm hit) and answering a conditional GET with 304. Requests
+go through the ASGI app in process (no network), so the numbers isolate the
+handler and its queries.
+
+Run from the backend directory:
+    python -m benchmarks.question_catalog --questions 200 --requests 5000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--database-url", default=None, help="Defaults to a fresh SQLite file")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", args.database_url or f"sqlite:///{tempfile.mkdtemp()}/benchmark.db")
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from app.database import SessionLocal, engine, read_engine
+    from app.main import app
+    from app.migrations import migrate
+    from app.models import Question
+    from app.question_catalog import question_catalog
+
+    migrate(engine)
+    db = SessionLocal()
+    db.add_all(Question(text=f"Benchmark question {q}?", is_active=True) for q in range(args.questions))
+    question_catalog.invalidate(db)
+    db.commit()
+    db.close()
+
+    statements = 0
+
+    @event.listens_for(read_engine, "before_cursor_execute")
+    def count(*_):
+        nonlocal statements
+        statements += 1
+
+    with TestClient(app) as client:
+        etag = client.get("/api/questions/").headers["ETag"]
+        print(f"{'mode':>10} {'req/s':>9} {'us/req':>8} {'SQL/req':>8}")
+        for mode, enabled, headers, expected in (
+            ("uncached", False, {}, 200),
+            ("warm hit", True, {}, 200),
+            ("304", True, {"If-None-Match": etag}, 304),
+        ):
+            question_catalog.enabled = enabled
+            statements = 0
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                response = client.get("/api/questions/", headers=headers)
+                assert response.status_code == expected, response.text
+            elapsed = time.perf_counter() - start
+            print(
+                f"{mode:>10} {args.requests / elapsed:>9.1f} "
+                f"{1e6 * elapsed / args.requests:>8.0f} {statements / args.requests:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Match emails per second through SMTPPool against a local aiosmtpd sink, by
+pool size, next to one connection per message (aiosmtplib.send, the old path).
+The sink can add per-command latency to stand in for a remote relay.
+
+Needs aiosmtpd (pip install -r requirements-dev.txt). Run from the backend directory:
+    python -m benchmarks.smtp_pool --messages 2000 --pool-sizes 1 2 4 8 --latency-ms 5
+"""
+import argparse
+import asyncio
+import time
+import aiosmtplib
+from app.smtp_pool import SMTPPool, fan_out
+from email.message import EmailMessage
+
+try:
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.smtp import SMTP as SMTPServer
+except ImportError:
+    Controller = None
+
+
+class SlowSink:
+    """aiosmtpd handler that accepts everything after a fixed delay"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.received = 0
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        await asyncio.sleep(self.latency)
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.latency)
+        self.received += 1
+        return "250 Message accepted for delivery"
+
+
+class SlowController(Controller):
+    """Controller whose server also delays the greeting, like a TLS/AUTH handshake would"""
+
+    def __init__(self, handler: SlowSink, connect_latency: float, **kwargs):
+        super().__init__(handler, **kwargs)
+        self.connect_latency = connect_latency
+
+    def factory(self):
+        connect_latency = self.connect_latency
+
+        class Server(SMTPServer):
+            async def _handle_client(self):
+                await asyncio.sleep(connect_latency)
+                await super()._handle_client()
+
+        return Server(self.handler, **self.SMTP_kwargs)
+
+
+def message(i: int) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = "nemesis@example.com"
+    msg["To"] = f"user{i}@example.com"
+    msg["Subject"] = "You Have a New Enemy Match!"
+    msg.set_content(f"Your new enemy is user{i + 1}.")
+    return msg
+
+
+async def run_unpooled(port: int, messages: int, concurrency: int) -> float:
+    async def send(i: int):
+        await aiosmtplib.send(message(i), hostname="127.0.0.1", port=port)
+
+    start = time.perf_counter()
+    await fan_out((lambda i=i: send(i) for i in range(messages)), concurrency)
+    return messages / (time.perf_counter() - start)
+
+
+async def run_pooled(port: int, messages: int, size: int, concurrency: int) -> SMTPPool:
+    async with SMTPPool("127.0.0.1", port, size=size) as pool:
+        await fan_out((lambda i=i: pool.send(message(i)) for i in range(messages)), concurrency)
+    return pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Delay per RCPT/DATA command")
+    parser.add_argument("--connect-latency-ms", type=float, default=50.0, help="Delay before the greeting")
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+
+    if Controller is None:
+        parser.error("aiosmtpd is required for this benchmark: pip install -r requirements-dev.txt")
+
+    handler = SlowSink(args.latency_ms / 1000)
+    controller = SlowController(handler, args.connect_latency_ms / 1000, hostname="127.0.0.1", port=args.port)
+    controller.start()
+    try:
+        print(f"{'mode':>16} {'msg/s':>9} {'failed':>7} {'reconnects':>11}")
+        rate = asyncio.run(run_unpooled(args.port, args.messages, args.concurrency))
+        print(f"{'unpooled':>16} {rate:>9.1f} {0:>7} {'-':>11}")
+        for size in args.pool_sizes:
+            pool = asyncio.run(run_pooled(args.port, args.messages, size, args.concurrency))
+            print(f"{f'pool {size}':>16} {pool.throughput:>9.1f} {pool.failed:>7} {pool.reconnects:>11}")
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    main()
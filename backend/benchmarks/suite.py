@@ -0,0 +1,202 @@
+"""
+Benchmark suite for matching and writes at several population sizes, with
+the results written as JSON so runs from two commits can be diffed.
+
+Every size runs in its own process on a fresh SQLite database filled by
+benchmarks.synthetic, so engines and caches start cold each time. Cases:
+    score_pair     calculate_match_score on random pairs
+    score_all      the batch scorer over every user (find_all_enemies)
+    cache_warm     loading the answer cache from the database
+    find_enemy     find_enemy_match on random users, cache warm
+    survey_upsert  POST /api/answers/survey resubmitting every question
+    monthly_job    match_all_users, email unconfigured (a fresh run key each repeat)
+
+Run from the backend directory:
+    python -m benchmarks.suite --sizes 1000 10000 --output before.json
+    python -m benchmarks.suite --compare before.json after.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+CASES = ["score_pair", "score_all", "cache_warm", "find_enemy", "survey_upsert", "monthly_job"]
+
+
+def measure(case: str, users: int, function: Callable[[int], None], repeats: int) -> Dict:
+    """Time `repeats` calls of function(i); output from the code under test is swallowed"""
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(repeats):
+            start = time.perf_counter()
+            function(i)
+            timings.append(time.perf_counter() - start)
+    return {
+        "case": case,
+        "users": users,
+        "repeats": repeats,
+        "min_ms": 1000 * min(timings),
+        "median_ms": 1000 * statistics.median(timings),
+        "mean_ms": 1000 * statistics.fmean(timings),
+    }
+
+
+def run_size(args) -> List[Dict]:
+    """One population size, in this (fresh) process; DATABASE_URL must already point at an empty file"""
+    import asyncio
+    import numpy as np
+    from fastapi.testclient import TestClient
+    from app.answer_cache import answer_cache
+    from app.batch_matching import find_all_enemies
+    from app.database import SessionLocal, engine
+    from app.email_service import match_all_users
+    from app.main import app
+    from app.matching import calculate_match_score, find_enemy_match
+    from app.migrations import migrate
+    from app.routers.auth import create_access_token
+    from benchmarks.synthetic import populate
+
+    users = args.size
+    migrate(engine)
+    db = SessionLocal()
+    user_ids, question_ids = populate(db, users, args.questions, args.density, args.distribution, args.camps, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    picks = rng.choice(user_ids, size=(max(args.repeats, 1), 2)).tolist()
+    results = []
+    selected = set(args.cases)
+
+    if "cache_warm" in selected:
+        results.append(measure("cache_warm", users, lambda i: answer_cache.resync(db), args.job_repeats))
+    answer_cache.ensure_fresh(db)
+
+    if "score_pair" in selected:
+        results.append(measure(
+            "score_pair", users, lambda i: calculate_match_score(picks[i][0], picks[i][1], db), args.repeats
+        ))
+    if "find_enemy" in selected:
+        results.append(measure("find_enemy", users, lambda i: find_enemy_match(picks[i][0], db), args.repeats))
+    if "score_all" in selected:
+        matrix = answer_cache.matrix()
+        results.append(measure("score_all", users, lambda i: find_all_enemies(matrix), args.job_repeats))
+
+    if "survey_upsert" in selected:
+        with TestClient(app) as client:
+            def submit(i):
+                user_id = picks[i][0]
+                headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
+                answers = [{"question_id": int(q), "answer_value": (int(q) + i) % 10 + 1} for q in question_ids]
+                response = client.post("/api/answers/survey", json={"answers": answers}, headers=headers)
+                assert response.status_code == 201, response.text
+            results.append(measure("survey_upsert", users, submit, args.repeats))
+
+    if "monthly_job" in selected:
+        results.append(measure(
+            "monthly_job", users, lambda i: asyncio.run(match_all_users(db, run_key=f"benchmark-{i}")), args.job_repeats
+        ))
+
+    db.close()
+    for result in results:
+        result.update(questions=args.questions, density=args.density, distribution=args.distribution)
+    return results
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout
+        return commit + ("-dirty" if dirty.strip() else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(before_path: str, after_path: str, threshold: float) -> int:
+    """Print median changes between two result files; the number of regressions beyond threshold"""
+    with open(before_path) as before_file, open(after_path) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+    baseline = {(result["case"], result["users"]): result for result in before["results"]}
+    print(f"{before['commit'][:12]} -> {after['commit'][:12]}")
+    print(f"{'case':>14} {'users':>8} {'before ms':>10} {'after ms':>10} {'change':>8}")
+    regressions = 0
+    for result in after["results"]:
+        old = baseline.get((result["case"], result["users"]))
+        if old is None:
+            continue
+        change = result["median_ms"] / old["median_ms"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(
+            f"{result['case']:>14} {result['users']:>8} {old['median_ms']:>10.2f} "
+            f"{result['median_ms']:>10.2f} {100 * change:>+7.1f}%{flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10_000])
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES)
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--density", type=float, default=0.8)
+    parser.add_argument("--distribution", default="camps")
+    parser.add_argument("--camps", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=50, help="Calls per per-request case")
+    parser.add_argument("--job-repeats", type=int, default=3, help="Runs of cache_warm, score_all and monthly_job")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Diff two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=0.20, help="Median slowdown that --compare reports as a regression")
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)  # Internal: run one size in this process
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    if args.size:
+        json.dump(run_size(args), sys.stdout)
+        return
+
+    results = []
+    for size in args.sizes:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{tempfile.mkdtemp()}/suite.db",
+            DATABASE_TYPE="sqlite",
+            SMTP_USER="",
+            SMTP_PASSWORD="",
+        )
+        command = [sys.executable, "-m", "benchmarks.suite", *sys.argv[1:], "--size", str(size)]
+        child = subprocess.run(command, env=env, capture_output=True, text=True)
+        if child.returncode:
+            sys.stderr.write(child.stderr)
+            sys.exit(f"size {size} failed")
+        size_results = json.loads(child.stdout.strip().splitlines()[-1])
+        for result in size_results:
+            print(f"{result['case']:>14} {size:>8} {result['median_ms']:>10.2f} ms median of {result['repeats']}")
+        results.extend(size_results)
+
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
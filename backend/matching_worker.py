@@ -0,0 +1,32 @@
+"""
+Script to join a sharded matching run as one more worker.
+Start as many as you like, on any host that can reach the database; they
+split the run's shards between them and take over shards from workers that
+die. The run is created on first use, so this also starts (or resumes) it.
+
+    python matching_worker.py              # this month's run
+    python matching_worker.py --run 2024-05
+"""
+import argparse
+import asyncio
+from app.database import SessionLocal, engine
+from app.migrations import migrate
+from app.matching_runs import monthly_run_key, run_worker
+
+# Create or upgrade tables
+migrate(engine)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--run", default=None, help="Run key, defaults to the current month")
+    parser.add_argument("--owner", default=None, help="Worker name recorded on leased shards")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        asyncio.run(run_worker(db, args.run or monthly_run_key(), owner=args.owner))
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""
+Script to bring the database schema up to date.
+The API, seed_data.py and matching_worker.py also migrate on start, so this
+is mainly for running ahead of a deploy or checking where a database stands.
+
+    python migrate.py            # apply pending migrations
+    python migrate.py --status
+"""
+import argparse
+from app.database import engine
+from app.migrations import MIGRATIONS, applied_versions, migrate
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="List migrations and whether each is applied")
+    args = parser.parse_args()
+
+    if args.status:
+        done = set(applied_versions(engine))
+        for version, name, _ in MIGRATIONS:
+            print(f"{'applied' if version in done else 'pending':>8}  {version:>3}  {name}")
+        return
+
+    applied = migrate(engine)
+    print(f"Database at version {MIGRATIONS[-1][0]} ({len(applied)} migration(s) applied)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Script to rewrite the memory-mapped answer store (ANSWER_STORE_PATH) from the
+answers table. The answer routes patch it in place; run this after loading
+answers any other way, or when it was flagged stale (the app rebuilds a
+missing or stale store on startup too).
+
+    python rebuild_answer_store.py
+"""
+import time
+from app.answer_store import answer_store
+from app.database import ReadSessionLocal, engine
+from app.migrations import migrate
+
+# Create or upgrade tables
+migrate(engine)
+
+def main():
+    if answer_store is None:
+        print("ANSWER_STORE_PATH is not set; nothing to rebuild")
+        return
+    db = ReadSessionLocal()
+    try:
+        start = time.perf_counter()
+        answers = answer_store.rebuild(db)
+        print(f"Rebuilt {answer_store.path}: {answers} answers in {time.perf_counter() - start:.1f}s")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""
+Script to recompute the per-question answer counters from the answers table.
+The answer routes keep them current; run this after loading answers any
+other way (bulk imports, manual SQL) or whenever the stats look off.
+
+    python rebuild_question_stats.py
+"""
+from app.database import SessionLocal, engine
+from app.migrations import migrate
+from app.question_stats import rebuild
+
+# Create or upgrade tables
+migrate(engine)
+
+def main():
+    db = SessionLocal()
+    try:
+        buckets = rebuild(db)
+        db.commit()
+        print(f"Rebuilt answer counters: {buckets} non-empty buckets")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Script to run the scheduled jobs without serving HTTP.
+Any number of these, and of API processes with SCHEDULER_ENABLED (the
+default), may share a database: they elect one leader through the
+scheduler_leases table, only the leader runs the jobs, and another takes over
+within SCHEDULER_LEASE_SECONDS when it dies. To watch a takeover locally,
+start a few and kill the one that reports leading:
+
+    python run_scheduler.py
+    python run_scheduler.py --seconds 60   # exit (releasing the lease) after a minute
+"""
+import argparse
+import asyncio
+from app.database import engine
+from app.migrations import migrate
+from app.scheduler import leader, release_leadership, scheduler
+
+# Create or upgrade tables
+migrate(engine)
+
+async def run(seconds: float):
+    scheduler.start()
+    print(f"Scheduler {leader.owner} started")
+    try:
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+        else:
+            await asyncio.Event().wait()
+    finally:
+        scheduler.shutdown()
+        release_leadership()
+        print(f"Scheduler {leader.owner} stopped")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=0, help="Stop after this long, 0 = run until interrupted")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.seconds))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
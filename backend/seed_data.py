@@ -2,11 +2,13 @@
 Script to seed the database with initial controversial questions.
 Run this after setting up the database to populate some starter questions.
 """
-from app.database import SessionLocal, engine, Base
+from app.database import SessionLocal, engine
+from app.migrations import migrate
 from app.models import Question
+from app.question_catalog import question_catalog
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# Create or upgrade tables
+migrate(engine)
 
 # Initial controversial questions
 questions = [
@@ -41,6 +43,7 @@ def seed_questions():
             question = Question(text=question_text, is_active=True)
             db.add(question)
         
+        question_catalog.invalidate(db)
         db.commit()
         print(f"Successfully seeded {len(questions)} questions!")
     except Exception as e:
@@ -0,0 +1,48 @@
+"""
+Shared test setup. Settings are read once, when app.config is first
+imported, so the test database and switches are set here, before any test
+module imports the app.
+"""
+import os
+import tempfile
+import pytest
+
+TEST_DIR = tempfile.mkdtemp(prefix="nemesis-tests-")
+
+os.environ["DATABASE_TYPE"] = "sqlite"
+os.environ["DATABASE_URL"] = f"sqlite:///{TEST_DIR}/nemesis.db"
+os.environ["DATABASE_ASYNC"] = "false"
+os.environ["SCHEDULER_ENABLED"] = "false"
+os.environ["STARTUP_WARMUP"] = "false"
+os.environ["ANSWER_STORE_PATH"] = ""
+
+
+@pytest.fixture
+def db():
+    """Session on an empty, fully migrated database (process-wide caches emptied)"""
+    from app.answer_cache import answer_cache
+    from app.auth_cache import auth_cache
+    from app.database import Base, SessionLocal, engine
+    from app.migrations import migrate, schema_migrations
+    from app.pair_scores import pair_score_cache
+
+    Base.metadata.drop_all(engine)
+    schema_migrations.drop(engine, checkfirst=True)
+    migrate(engine)
+    answer_cache.invalidate()
+    pair_score_cache.clear()
+    auth_cache.tokens.clear()
+    auth_cache.users.clear()
+    with SessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+def client(db):
+    """The API, started through its lifespan"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
@@ -0,0 +1,28 @@
+"""Rows for tests, written the way the routes write them"""
+from app.answer_cache import bump_answers_version
+from app.models import Answer, Question, User
+from app.routers.auth import create_access_token
+
+
+def add_user(db, name: str, answers=None):
+    """Commit a user (with answers by question id, as the answer routes would write them)"""
+    user = User(username=name, email=f"{name}@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    for question_id, answer_value in (answers or {}).items():
+        db.add(Answer(user_id=user.id, question_id=question_id, answer_value=answer_value))
+    if answers:
+        bump_answers_version(db, user.id)
+    db.commit()
+    return user.id
+
+
+def add_questions(db, count: int):
+    questions = [Question(text=f"Question {number}?") for number in range(1, count + 1)]
+    db.add_all(questions)
+    db.commit()
+    return [question.id for question in questions]
+
+
+def auth_headers(user_id: int):
+    return {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
@@ -0,0 +1,78 @@
+"""
+Answer cache freshness across processes: two AnswerCache instances on one
+database stand in for two workers, and only one of them sees each write
+through its write hooks.
+"""
+from sqlalchemy import update
+from app.answer_cache import AnswerCache, bump_answers_version
+from app.answer_matrix import AnswerMatrix
+from app.models import Answer, Question, User
+from app.question_catalog import question_catalog
+from tests.factories import add_questions, add_user
+
+
+def change_answer(db, user_id: int, question_id: int, value: int):
+    db.execute(update(Answer).where(Answer.user_id == user_id, Answer.question_id == question_id).values(answer_value=value))
+    bump_answers_version(db, user_id)
+    db.commit()
+
+
+def test_answer_versions_follow_one_sequence(db):
+    q1, q2 = add_questions(db, 2)
+    alice = add_user(db, "alice", {q1: 1})
+    bob = add_user(db, "bob", {q1: 5})
+    change_answer(db, alice, q1, 2)
+    versions = dict(db.query(User.id, User.answers_version))
+    assert versions == {alice: 3, bob: 2}
+
+
+def test_other_process_catches_up_on_changed_answers(db):
+    q1, q2 = add_questions(db, 2)
+    alice = add_user(db, "alice", {q1: 1, q2: 1})
+    bob = add_user(db, "bob", {q1: 1, q2: 1})
+    carol = add_user(db, "carol", {q1: 4, q2: 4})
+    writer, reader = AnswerCache(), AnswerCache()
+    writer.warm(db)
+    reader.warm(db)
+    assert reader.best_enemy(db, alice) == (carol, 33.33)
+
+    change_answer(db, bob, q1, 10)
+    writer.update_answers(db, bob, {q1: 10})
+    dave = add_user(db, "dave", {q1: 10, q2: 10})
+    writer.update_answers(db, dave, {q1: 10, q2: 10})
+
+    # The reader only learns of both writes from the database
+    assert reader.best_enemy(db, alice) == (dave, 100.0)
+    assert reader.pair_score(db, alice, bob) == AnswerMatrix.from_db(db).pair_score(alice, bob) == 50.0
+    versions = dict(db.query(User.id, User.answers_version))
+    assert reader.stamps(db, bob, dave) == (versions[bob], versions[dave])
+
+
+def test_other_process_drops_deactivated_question(db):
+    q1, q2 = add_questions(db, 2)
+    alice = add_user(db, "alice", {q1: 1, q2: 1})
+    bob = add_user(db, "bob", {q1: 10, q2: 1})
+    reader = AnswerCache()
+    reader.warm(db)
+    assert reader.pair_score(db, alice, bob) == 50.0
+
+    db.execute(update(Question).where(Question.id == q1).values(is_active=False))
+    question_catalog.invalidate(db)
+    db.commit()
+    assert reader.pair_score(db, alice, bob) == 0.0
+
+
+def test_long_gap_resyncs(db, monkeypatch):
+    import app.answer_cache as module
+
+    q1, = add_questions(db, 1)
+    alice = add_user(db, "alice", {q1: 1})
+    bob = add_user(db, "bob", {q1: 1})
+    reader = AnswerCache()
+    reader.warm(db)
+    monkeypatch.setattr(module, "CATCH_UP_LIMIT", 2)
+    for value in (2, 3, 4):
+        change_answer(db, bob, q1, value)
+    epoch = reader.epoch
+    assert reader.pair_score(db, alice, bob) == 33.33
+    assert reader.epoch == epoch + 1
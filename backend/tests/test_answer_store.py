@@ -0,0 +1,50 @@
+"""
+The memory-mapped answer store against the database when a write's own
+patch never lands (its process died between the commit and the patch).
+"""
+from sqlalchemy import update
+from app.answer_cache import AnswerCache, bump_answers_version
+from app.answer_matrix import AnswerMatrix
+from app.answer_store import SEQUENCE, AnswerStore
+from app.models import Answer, User
+from app.question_catalog import current_version
+from tests.factories import add_questions, add_user
+
+
+def change_without_patch(db, user_id: int, question_id: int, value: int):
+    db.execute(update(Answer).where(Answer.user_id == user_id, Answer.question_id == question_id).values(answer_value=value))
+    bump_answers_version(db, user_id)
+    db.commit()
+
+
+def test_catch_up_patches_in_writes_that_never_reached_the_store(db, tmp_path):
+    q1, q2 = add_questions(db, 2)
+    alice = add_user(db, "alice", {q1: 1, q2: 1})
+    store = AnswerStore(str(tmp_path / "answers.store"))
+    store.rebuild(db)
+    assert store.user_answers(alice) == {q1: 1, q2: 1}
+
+    change_without_patch(db, alice, q1, 7)
+    bob = add_user(db, "bob", {q2: 9})
+    assert store.user_answers(alice) == {q1: 1, q2: 1}
+
+    assert store.catch_up(db)
+    assert store.user_answers(alice) == {q1: 7, q2: 1}
+    assert store.user_answers(bob) == {q2: 9}
+    assert store._header[SEQUENCE] == current_version(db, "answers")
+
+
+def test_cache_warmed_from_the_store_is_current_and_stamped(db, tmp_path, monkeypatch):
+    q1, q2 = add_questions(db, 2)
+    alice = add_user(db, "alice", {q1: 1, q2: 1})
+    bob = add_user(db, "bob", {q1: 4, q2: 4})
+    store = AnswerStore(str(tmp_path / "answers.store"))
+    store.rebuild(db)
+    monkeypatch.setattr("app.answer_cache.answer_store", store)
+
+    change_without_patch(db, bob, q1, 10)
+    cache = AnswerCache()
+    cache.warm(db)
+    assert cache.pair_score(db, alice, bob) == AnswerMatrix.from_db(db).pair_score(alice, bob) == 66.67
+    versions = dict(db.query(User.id, User.answers_version))
+    assert cache._stamps == {alice: versions[alice], bob: versions[bob]}
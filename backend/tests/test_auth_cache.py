@@ -0,0 +1,18 @@
+from app.auth_cache import AuthCache
+from app.models import User
+from tests.factories import add_questions, add_user
+
+
+def test_snapshot_leaves_out_mutable_columns(db):
+    q1, = add_questions(db, 1)
+    user_id = add_user(db, "alice", {q1: 3})
+    cache = AuthCache()
+    cache.put_user(db.get(User, user_id))
+
+    cached = cache.user(user_id)
+    assert (cached.id, cached.email, cached.username) == (user_id, "alice@example.com", "alice")
+    assert cached.created_at is not None
+    assert cached.password_hash is None
+    # Bumped by every answer write without invalidating the snapshot, so it must not be served from it
+    assert cached.answers_version is None
+    assert cached.updated_at is None
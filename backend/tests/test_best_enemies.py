@@ -0,0 +1,111 @@
+"""
+Materialized best enemies stay exact while answers change underneath them,
+including changes written by another process (straight to the database,
+bypassing this process's answer cache hooks).
+"""
+import numpy as np
+from sqlalchemy import update
+from app import best_enemies
+from app.answer_cache import bump_answers_version
+from app.answer_matrix import AnswerMatrix
+from app.models import Answer, BestEnemy
+from app.question_catalog import current_version
+from tests.factories import add_questions, add_user
+
+
+def change_elsewhere(db, user_id, answers):
+    """An answer write by another process: what the answer routes commit, and nothing else"""
+    bump_answers_version(db, user_id)
+    best_enemies.answers_changed(db, user_id)
+    for question_id, value in answers.items():
+        db.execute(update(Answer).where(Answer.user_id == user_id, Answer.question_id == question_id).values(answer_value=value))
+    db.commit()
+
+
+def expected(db, user_id):
+    return AnswerMatrix.from_db(db).best_enemy(user_id)
+
+
+def test_lookup_sees_changes_from_another_process(db):
+    q1, q2 = add_questions(db, 2)
+    alice = add_user(db, "alice", {q1: 1, q2: 1})
+    bob = add_user(db, "bob", {q1: 5, q2: 5})
+    carol = add_user(db, "carol", {q1: 3, q2: 3})
+    assert best_enemies.lookup(db, alice) == (bob, 44.44)
+
+    # Alice's entry points at bob, so his change dirties it
+    change_elsewhere(db, bob, {q1: 2, q2: 2})
+    assert db.get(BestEnemy, alice).dirty
+    assert best_enemies.lookup(db, alice) == expected(db, alice) == (carol, 22.22)
+    assert not db.get(BestEnemy, alice).dirty
+
+
+def test_clean_entry_checks_pending_offers(db):
+    q1, q2 = add_questions(db, 2)
+    alice = add_user(db, "alice", {q1: 1, q2: 1})
+    bob = add_user(db, "bob", {q1: 5, q2: 5})
+    carol = add_user(db, "carol", {q1: 3, q2: 3})
+    assert best_enemies.lookup(db, alice) == (bob, 44.44)
+
+    # Carol now beats bob for alice, but alice's entry isn't dirtied: only the offer would fix it
+    change_elsewhere(db, carol, {q1: 10, q2: 10})
+    db.expire_all()
+    assert not db.get(BestEnemy, alice).dirty
+    assert best_enemies.lookup(db, alice) == (carol, 100.0)
+
+    assert best_enemies.sweep(db) >= 0
+    db.expire_all()
+    entry = db.get(BestEnemy, alice)
+    assert (entry.enemy_id, entry.match_score) == (carol, 100.0)
+    assert current_version(db, best_enemies.OFFERED) == current_version(db, "answers")
+
+
+def test_entries_stay_exact_through_random_changes(db):
+    rng = np.random.default_rng(7)
+    questions = add_questions(db, 6)
+    users = [
+        add_user(db, f"user{number}", {question_id: int(rng.integers(1, 11)) for question_id in questions})
+        for number in range(30)
+    ]
+    for user_id in users:
+        best_enemies.lookup(db, user_id)
+
+    for round_number in range(8):
+        for user_id in rng.choice(users, size=4, replace=False).tolist():
+            change_elsewhere(db, user_id, {question_id: int(rng.integers(1, 11)) for question_id in questions})
+        if round_number % 2:
+            best_enemies.sweep(db)
+        for user_id in users:
+            assert best_enemies.lookup(db, user_id) == expected(db, user_id)
+
+    best_enemies.sweep(db)
+    db.expire_all()
+    for user_id in users:
+        entry = db.get(BestEnemy, user_id)
+        assert not entry.dirty
+        assert (entry.enemy_id, entry.match_score) == expected(db, user_id)
+
+
+def test_scheduler_sweep_reads_changes_it_never_saw(db):
+    from app.answer_cache import answer_cache
+    from app.scheduler import _sweep_best_enemies
+
+    rng = np.random.default_rng(11)
+    questions = add_questions(db, 4)
+    users = [
+        add_user(db, f"user{number}", {question_id: int(rng.integers(1, 11)) for question_id in questions})
+        for number in range(20)
+    ]
+    for user_id in users:
+        best_enemies.lookup(db, user_id)
+    # The scheduler's cache as warmed at startup; every later write comes from other processes
+    answer_cache.warm(db)
+    for user_id in users[::3]:
+        change_elsewhere(db, user_id, {question_id: int(rng.integers(1, 11)) for question_id in questions})
+
+    _sweep_best_enemies()
+    db.expire_all()
+    for user_id in users:
+        entry = db.get(BestEnemy, user_id)
+        assert not entry.dirty
+        assert (entry.enemy_id, entry.match_score) == expected(db, user_id)
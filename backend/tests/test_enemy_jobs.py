@@ -0,0 +1,22 @@
+"""Background find-enemy jobs that never get to run"""
+import pytest
+from datetime import datetime
+from app.enemy_jobs import EnemyJobs, in_flight_query, job_response, recent_jobs_query
+from tests.factories import add_questions, add_user
+
+
+def test_job_that_cannot_be_dispatched_is_failed_not_left_queued(db):
+    q1, = add_questions(db, 1)
+    alice = add_user(db, "alice", {q1: 1})
+    jobs = EnemyJobs()
+    jobs.shutdown()
+    with pytest.raises(RuntimeError):
+        jobs.submit(db, alice)
+
+    job, = db.execute(recent_jobs_query(alice, 20)).all()
+    assert job_response(job).status == "failed"
+    # Later requests, from this process or another, don't coalesce onto it
+    assert db.scalar(in_flight_query(alice, datetime(2000, 1, 1))) is None
+    with pytest.raises(RuntimeError):
+        jobs.submit(db, alice)
+    assert len(db.execute(recent_jobs_query(alice, 20)).all()) == 2
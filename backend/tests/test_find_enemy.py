@@ -0,0 +1,18 @@
+"""POST /api/matches/user/find-enemy when there is nobody to match"""
+from tests.factories import add_questions, add_user, auth_headers
+
+
+def test_user_without_answers_gets_404(client, db):
+    q1, = add_questions(db, 1)
+    alice = add_user(db, "alice")
+    add_user(db, "bob", {q1: 10})
+    response = client.post("/api/matches/user/find-enemy", headers=auth_headers(alice))
+    assert response.status_code == 404
+
+
+def test_user_without_common_questions_gets_404(client, db):
+    q1, q2 = add_questions(db, 2)
+    alice = add_user(db, "alice", {q1: 1})
+    add_user(db, "bob", {q2: 10})
+    response = client.post("/api/matches/user/find-enemy", headers=auth_headers(alice))
+    assert response.status_code == 404
@@ -0,0 +1,76 @@
+"""
+Keyset pagination of GET /api/matches/user. Matches made by find-enemy get
+their matched_at from the database (CURRENT_TIMESTAMP), so a burst of them
+shares one second and only the id tells them apart.
+"""
+from datetime import datetime
+from app.models import Match
+from tests.factories import add_questions, add_user, auth_headers
+
+
+def walk(client, headers, limit):
+    """Every page of the history, following next_cursor"""
+    pages, cursor = [], None
+    while True:
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/matches/user", params=params, headers=headers)
+        assert response.status_code == 200
+        body = response.json()
+        pages.append([match["id"] for match in body["matches"]])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return pages
+        assert len(pages) <= 20, "pagination does not terminate"
+
+
+def test_pages_of_find_enemy_matches_stop_and_do_not_overlap(client, db):
+    q1, q2 = add_questions(db, 2)
+    alice = add_user(db, "alice")
+    add_user(db, "bob", {q1: 10, q2: 10})
+    headers = auth_headers(alice)
+    response = client.post(
+        "/api/answers/survey",
+        json={"answers": [{"question_id": q1, "answer_value": 1}, {"question_id": q2, "answer_value": 1}]},
+        headers=headers,
+    )
+    assert response.status_code == 201
+    for _ in range(5):
+        assert client.post("/api/matches/user/find-enemy", headers=headers).status_code == 200
+
+    pages = walk(client, headers, limit=2)
+    assert len(pages) == 3
+    ids = [match_id for page in pages for match_id in page]
+    assert len(ids) == len(set(ids)) == 5
+    assert ids == sorted(ids, reverse=True)
+    latest = client.get("/api/matches/user/latest", headers=headers).json()
+    assert latest["id"] == ids[0]
+
+
+def test_pages_mix_database_and_application_timestamps(client, db):
+    q1, = add_questions(db, 1)
+    alice = add_user(db, "alice", {q1: 1})
+    bob = add_user(db, "bob", {q1: 10})
+    headers = auth_headers(alice)
+    for _ in range(3):
+        assert client.post("/api/matches/user/find-enemy", headers=headers).status_code == 200
+    # The monthly run stamps its matches from Python, with microseconds, around the same time
+    now = datetime.utcnow().replace(microsecond=0)
+    db.add_all([
+        Match(user_id=alice, enemy_id=bob, match_score=100.0, matched_at=now),
+        Match(user_id=alice, enemy_id=bob, match_score=100.0, matched_at=now.replace(microsecond=500000)),
+        Match(user_id=alice, enemy_id=bob, match_score=100.0, matched_at=datetime(2020, 1, 1)),
+    ])
+    db.commit()
+
+    everything = walk(client, headers, limit=100)[0]
+    assert len(everything) == 6
+    for limit in (1, 2, 4):
+        assert [match_id for page in walk(client, headers, limit) for match_id in page] == everything
+
+
+def test_invalid_cursor(client, db):
+    alice = add_user(db, "alice")
+    response = client.get("/api/matches/user", params={"cursor": "zzz"}, headers=auth_headers(alice))
+    assert response.status_code == 400
@@ -0,0 +1,184 @@
+"""
+The vectorized matching engine against the original scalar implementation.
+
+scalar_score and scalar_best_enemy are the pre-AnswerMatrix
+calculate_match_score and find_enemy_match loops, with the per-user answer
+queries replaced by dicts. Every engine (AnswerMatrix, EnemyIndex and the
+batch job) must give the same scores, the same rounding and the same enemy,
+with ties going to the lowest user id.
+"""
+import numpy as np
+import pytest
+from app.answer_matrix import AnswerMatrix, normalize_scores, round_scores
+from app.batch_matching import find_all_enemies
+from app.enemy_index import EnemyIndex
+from typing import Dict, Optional, Tuple
+
+Answers = Dict[int, Dict[int, int]]  # user_id -> {question_id: answer_value}
+
+
+def unrounded_scalar_score(user1: Dict[int, int], user2: Dict[int, int]) -> Optional[float]:
+    common_questions = set(user1) & set(user2)
+    if not common_questions:
+        return None
+    total_difference = 0.0
+    for question_id in common_questions:
+        total_difference += abs(user1[question_id] - user2[question_id])
+    average_difference = total_difference / len(common_questions)
+    return (average_difference / 9.0) * 100
+
+
+def scalar_score(user1: Dict[int, int], user2: Dict[int, int]) -> float:
+    score = unrounded_scalar_score(user1, user2)
+    return 0.0 if score is None else round(score, 2)
+
+
+def scalar_best_enemy(answers: Answers, user_id: int) -> Optional[Tuple[int, float]]:
+    if not answers.get(user_id):
+        return None
+    best_match = None
+    best_score = -1.0
+    for other_id in sorted(answers):
+        if other_id == user_id or not answers[other_id]:
+            continue
+        if not set(answers[user_id]) & set(answers[other_id]):
+            continue
+        score = scalar_score(answers[user_id], answers[other_id])
+        if score > best_score:
+            best_score = score
+            best_match = other_id
+    if best_match:
+        return (best_match, best_score)
+    return None
+
+
+def random_answers(seed: int, users: int, questions: int, density: float, values: int = 10) -> Answers:
+    """Sparse random answers: unanswered cells, some users with no answers, non-contiguous ids"""
+    rng = np.random.default_rng(seed)
+    user_ids = np.sort(rng.choice(np.arange(1, users * 3), size=users, replace=False))
+    answers: Answers = {}
+    for user_id in user_ids:
+        answered = rng.random(questions) < density
+        answers[int(user_id)] = {
+            question_id + 1: int(rng.integers(1, values + 1)) for question_id in np.flatnonzero(answered)
+        }
+    return answers
+
+
+def matrix_of(answers: Answers) -> AnswerMatrix:
+    return AnswerMatrix.from_rows(
+        (user_id, question_id, value) for user_id, user_answers in answers.items() for question_id, value in user_answers.items()
+    )
+
+
+CASES = [
+    # seed, users, questions, density, distinct answer values (few values = many ties)
+    (1, 40, 12, 0.5, 10),
+    (2, 60, 30, 0.2, 10),
+    (3, 50, 5, 0.6, 2),
+    (4, 30, 40, 0.9, 10),
+    (5, 80, 3, 0.4, 3),
+]
+
+
+@pytest.mark.parametrize("seed,users,questions,density,values", CASES)
+def test_scores_match_scalar(seed, users, questions, density, values):
+    answers = random_answers(seed, users, questions, density, values)
+    matrix = matrix_of(answers)
+    for user_id in matrix.user_ids.tolist():
+        candidate_ids, scores = matrix.scores(user_id)
+        got = dict(zip(candidate_ids.tolist(), scores.tolist()))
+        expected = {
+            other_id: unrounded_scalar_score(answers[user_id], answers[other_id])
+            for other_id in answers
+            if other_id != user_id and unrounded_scalar_score(answers[user_id], answers[other_id]) is not None
+        }
+        # Same operation order, so bit-for-bit equal before rounding
+        assert got == expected
+        hundredths = dict(zip(candidate_ids.tolist(), round_scores(scores).tolist()))
+        assert {other_id: hundredths[other_id] / 100 for other_id in got} == {
+            other_id: round(score, 2) for other_id, score in expected.items()
+        }
+        for other_id in answers:
+            assert matrix.pair_score(user_id, other_id) == scalar_score(answers[user_id], answers.get(other_id, {}))
+
+
+@pytest.mark.parametrize("seed,users,questions,density,values", CASES)
+def test_best_enemy_matches_scalar(seed, users, questions, density, values):
+    answers = random_answers(seed, users, questions, density, values)
+    matrix = matrix_of(answers)
+    index = EnemyIndex.build(matrix, bucket_size=4)
+    batch = find_all_enemies(matrix, block_size=7)
+    for user_id in answers:
+        expected = scalar_best_enemy(answers, user_id)
+        assert matrix.best_enemy(user_id) == expected
+        if user_id in batch or expected is not None:
+            assert batch.get(user_id) == expected
+            assert index.best_enemy(matrix, user_id) == expected
+
+
+def test_ties_go_to_lowest_user_id():
+    # 3, 5 and 9 all differ from 1 by the same amount; 2 shares no question with 1
+    answers = {
+        1: {1: 1, 2: 1},
+        2: {3: 10},
+        3: {1: 10, 2: 1},
+        5: {1: 1, 2: 10},
+        9: {1: 10, 2: 1},
+    }
+    matrix = matrix_of(answers)
+    assert scalar_best_enemy(answers, 1) == (3, 50.0)
+    assert matrix.best_enemy(1) == (3, 50.0)
+    assert find_all_enemies(matrix)[1] == (3, 50.0)
+    assert EnemyIndex.build(matrix, bucket_size=1).best_enemy(matrix, 1) == (3, 50.0)
+    assert matrix.best_enemy(2) is None
+
+
+def answers_summing(questions: int, total_difference: int) -> Dict[int, int]:
+    """Answers to questions 1..n differing from all-1 answers by total_difference in all"""
+    tens, rest = divmod(total_difference, 9)
+    values = [10] * tens + ([1 + rest] if rest else [])
+    values += [1] * (questions - len(values))
+    return {question_id: value for question_id, value in enumerate(values, start=1)}
+
+
+def test_ties_are_decided_after_rounding():
+    # 349 / 50 questions = 77.5555..6 and 356 / 51 = 77.5599.. differ unrounded but both
+    # round to 77.56, so the lower id wins even though the higher id's raw score is larger
+    answers = {
+        1: answers_summing(51, 0),
+        2: answers_summing(50, 349),
+        3: answers_summing(51, 356),
+    }
+    matrix = matrix_of(answers)
+    assert scalar_best_enemy(answers, 1) == (2, 77.56)
+    assert matrix.best_enemy(1) == (2, 77.56)
+    assert find_all_enemies(matrix)[1] == (2, 77.56)
+    assert EnemyIndex.build(matrix, bucket_size=1).best_enemy(matrix, 1) == (2, 77.56)
+
+
+def test_rounding_matches_python_round_for_every_score():
+    # Every (summed difference, common question count) a 1-10 survey of up to 60 questions can produce
+    counts = np.repeat(np.arange(1, 61), 9 * np.arange(1, 61) + 1)
+    totals = np.concatenate([np.arange(9 * count + 1) for count in range(1, 61)])
+    scores = normalize_scores(totals.astype(np.int64), counts.astype(np.int64))
+    expected = [round((total / count / 9.0) * 100, 2) for total, count in zip(totals.tolist(), counts.tolist())]
+    assert (round_scores(scores) / 100).tolist() == expected
+
+
+def test_matrix_streamed_from_the_database_matches_scalar(db):
+    from app.models import Question
+    from tests.factories import add_questions, add_user
+    questions = add_questions(db, 9)
+    inactive = questions[-1]
+    answers: Answers = {}
+    for number, user_answers in enumerate(random_answers(6, 25, 8, 0.5).values()):
+        # Everyone also answered a question that gets deactivated, and must not be scored on it
+        row = {questions[question_id - 1]: value for question_id, value in user_answers.items()}
+        answers[add_user(db, f"user{number}", {**row, inactive: 1})] = row
+    db.query(Question).filter(Question.id == inactive).update({"is_active": False})
+    db.commit()
+    # Chunks smaller than one user's answers
+    matrix = AnswerMatrix.from_db(db, chunk_size=7)
+    for user_id in answers:
+        assert matrix.best_enemy(user_id) == scalar_best_enemy(answers, user_id)
@@ -0,0 +1,82 @@
+"""
+Global pairing in sharded matching runs: the pairing is computed by one
+worker, stored with the run, and every shard's matches come from it.
+"""
+import asyncio
+import numpy as np
+import pytest
+from sqlalchemy import update
+from app import global_pairing, matching_runs
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Match, MatchingPair, MatchingRun
+from tests.factories import add_questions, add_user
+
+
+@pytest.fixture
+def global_run(db, monkeypatch):
+    """Settings for a small global run, and the number of times the pairing gets computed"""
+    monkeypatch.setattr(settings, "matching_pairing", "global")
+    monkeypatch.setattr(settings, "matching_shard_size", 5)
+    monkeypatch.setattr(settings, "matching_lease_seconds", 3)
+    computed = []
+
+    def counted(*args, **kwargs):
+        computed.append(1)
+        return pair_globally(*args, **kwargs)
+
+    pair_globally = global_pairing.pair_globally
+    monkeypatch.setattr(global_pairing, "pair_globally", counted)
+    rng = np.random.default_rng(3)
+    questions = add_questions(db, 5)
+    for number in range(23):
+        add_user(db, f"user{number}", {question_id: int(rng.integers(1, 11)) for question_id in questions})
+    return computed
+
+
+def run_workers(key: str, count: int):
+    async def work():
+        sessions = [SessionLocal() for _ in range(count)]
+        try:
+            await asyncio.gather(*(
+                matching_runs.run_worker(session, key, owner=f"worker{number}") for number, session in enumerate(sessions)
+            ))
+        finally:
+            for session in sessions:
+                session.close()
+    asyncio.run(work())
+
+
+def test_pairing_is_computed_once_and_shared_by_every_shard(db, global_run, monkeypatch):
+    # The stored pairing is deleted when the run is done, so keep a copy of what gets written
+    stored = []
+    store_pairing = matching_runs.store_pairing
+
+    def keep(db, run, owner, enemies):
+        stored.append(dict(enemies))
+        return store_pairing(db, run, owner, enemies)
+
+    monkeypatch.setattr(matching_runs, "store_pairing", keep)
+    run_workers("2026-10", 3)
+
+    assert len(global_run) == 1 and len(stored) == 1
+    matches = {match.user_id: (match.enemy_id, match.match_score) for match in db.query(Match)}
+    assert len(matches) == 23
+    assert matches == stored[0]
+    run = db.query(MatchingRun).one()
+    assert run.status == "done" and run.paired_at is not None
+    assert db.query(MatchingPair).count() == 0
+
+
+def test_lapsed_pairing_lease_is_taken_over(db, global_run):
+    run = matching_runs.start_run(db, "2026-10", settings.matching_shard_size)
+    # A worker died while pairing
+    db.execute(
+        update(MatchingRun)
+        .where(MatchingRun.id == run.id)
+        .values(pairing_owner="dead", pairing_lease_expires_at=matching_runs.utcnow())
+    )
+    db.commit()
+    run_workers("2026-10", 1)
+    assert len(global_run) == 1
+    assert db.query(Match).count() == 23
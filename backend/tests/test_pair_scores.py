@@ -0,0 +1,92 @@
+"""
+Pair score cache keys: entries are keyed on both users' answers_version as
+the database has them, so writes from other processes (which this process's
+caches never see) still miss, and a score computed across a write is never
+cached under the newer versions.
+"""
+from sqlalchemy import update
+from app import best_enemies
+from app.answer_cache import answer_cache, bump_answers_version
+from app.database import SessionLocal
+from app.models import Answer, PairScore, Question
+from app.pair_scores import PairScoreCache
+from tests.factories import add_questions, add_user
+
+
+def change_answer(db, user_id: int, question_id: int, value: int):
+    db.execute(update(Answer).where(Answer.user_id == user_id, Answer.question_id == question_id).values(answer_value=value))
+    bump_answers_version(db, user_id)
+    db.commit()
+
+
+def test_writes_from_other_processes_miss(db):
+    q1, = add_questions(db, 1)
+    alice = add_user(db, "alice", {q1: 1})
+    bob = add_user(db, "bob", {q1: 4})
+    cache = PairScoreCache(persist=True)
+    assert cache.score(db, alice, bob) == 33.33
+    assert cache.score(db, bob, alice) == 33.33
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Neither this cache nor the answer cache hears of the write
+    with SessionLocal() as other_db:
+        change_answer(other_db, bob, q1, 10)
+    assert cache.score(db, alice, bob) == 100.0
+    cache.clear()
+    assert cache.score(db, alice, bob) == 100.0
+    assert cache.persisted_hits == 1
+
+
+def test_score_computed_across_a_write_is_not_cached(db, monkeypatch):
+    q1, = add_questions(db, 1)
+    alice = add_user(db, "alice", {q1: 1})
+    bob = add_user(db, "bob", {q1: 4})
+    answer_cache.warm(db)
+    cache = PairScoreCache(persist=True)
+    stamped_pair_score = answer_cache.stamped_pair_score
+
+    def write_first(db, user1_id, user2_id):
+        # Lands after the cache read the versions, before the answer cache scores
+        with SessionLocal() as other_db:
+            change_answer(other_db, bob, q1, 10)
+        return stamped_pair_score(db, user1_id, user2_id)
+
+    monkeypatch.setattr(answer_cache, "stamped_pair_score", write_first)
+    cache.score(db, alice, bob)
+    monkeypatch.undo()
+    assert cache.stats()["entries"] == 0
+    assert cache.score(db, alice, bob) == 100.0
+    assert cache.stats()["entries"] == 1
+
+
+def test_best_enemy_lookups_feed_the_cache(db, monkeypatch):
+    q1, = add_questions(db, 1)
+    alice = add_user(db, "alice", {q1: 1})
+    bob = add_user(db, "bob", {q1: 4})
+    cache = PairScoreCache()
+    monkeypatch.setattr(best_enemies, "pair_score_cache", cache)
+    assert best_enemies.lookup(db, alice) == (bob, 33.33)
+    assert cache.score(db, alice, bob) == 33.33
+    assert (cache.hits, cache.misses) == (1, 0)
+
+    # A stale result is not remembered
+    cache.remember(db, alice, bob, 33.33, (1, 1))
+    with SessionLocal() as other_db:
+        change_answer(other_db, bob, q1, 10)
+    cache.clear()
+    cache.remember(db, alice, bob, 33.33, (1, 2))
+    assert cache.stats()["entries"] == 0
+
+
+def test_persisting_leaves_the_callers_transaction_alone(db):
+    q1, = add_questions(db, 1)
+    alice = add_user(db, "alice", {q1: 1})
+    bob = add_user(db, "bob", {q1: 4})
+    cache = PairScoreCache(persist=True)
+    # Pending work the caller means to roll back
+    db.add(Question(text="Never asked?"))
+    assert cache.score(db, alice, bob) == 33.33
+    db.rollback()
+    assert db.query(Question).count() == 1
+    with SessionLocal() as other_db:
+        assert other_db.query(PairScore).count() == 1
@@ -0,0 +1,81 @@
+"""
+Query-plan regression check for the hot queries on SQLite.
+
+Every query on a request path, in the best-enemy sweep or in the monthly run
+is built by the same function the code calls, and run through EXPLAIN QUERY
+PLAN against a database migrated to the latest version. A step that scans a
+whole table, or sorts in a temporary B-tree instead of reading an index in
+order, fails the test. benchmarks/query_plans.py prints the same plans for
+any migrated SQLite file.
+"""
+import pytest
+from datetime import datetime
+
+
+def hot_queries():
+    """(name, statement) for every hot query; imports are deferred so callers can pick the database first"""
+    from sqlalchemy import select
+    from app import answer_cache, best_enemies, enemy_jobs, matching_runs, pair_scores
+    from app.models import MatchingRun, User
+    from app.question_catalog import CATALOG, version_query
+    from app.question_stats import counts_query
+    from app.routers.answers import existing_questions_query, previous_values_query, survey_answers_query
+    from app.routers.matches import encode_cursor, match_history_query
+
+    month = datetime(2024, 5, 1)
+    return [
+        # Single-column lookups the routes make through the ORM, on columns that must stay unique
+        ("auth: user by id", select(User).filter(User.id == 1)),
+        ("login: user by email", select(User).filter(User.email == "user@example.com")),
+        ("signup: username taken", select(User).filter(User.username == "user")),
+        ("monthly run: run by key", select(MatchingRun).filter(MatchingRun.key == "2024-05")),
+
+        ("catalog version", version_query(CATALOG)),
+        ("survey: validate questions", existing_questions_query([1, 2, 3])),
+        ("survey: previous values", previous_values_query(1, [1, 2, 3])),
+        ("survey: read back answers", survey_answers_query(1, [1, 2, 3])),
+        ("question stats", counts_query(1)),
+        ("answer cache: sequence", answer_cache.sequence_query()),
+        ("answer cache: one user's answers", answer_cache.user_answers_query(1)),
+        ("answer cache: changed answers", answer_cache.changed_answers_query(100)),
+        ("answer cache: inactive questions", answer_cache.inactive_questions_query()),
+        ("pair score: both versions", pair_scores.pair_versions_query(1, 2)),
+        ("pair score: persisted entry", pair_scores.entry_query(1, 2)),
+        ("best enemy: entry", best_enemies.entry_query(1)),
+        ("best enemy: dirty on answer change", best_enemies.changed_statement(1)),
+        ("best enemy: pending offers", best_enemies.pending_query(1, best_enemies.PENDING_LIMIT + 1)),
+        ("best enemy: changed users to offer", best_enemies.changed_users_query(100, 200)),
+        ("best enemy: lowest score", best_enemies.lowest_score_query()),
+        ("best enemy: sweep queue", best_enemies.dirty_queue_query(500)),
+        ("find-enemy job: poll", enemy_jobs.job_query("0" * 32, 1)),
+        ("find-enemy job: recent", enemy_jobs.recent_jobs_query(1, 20)),
+        ("find-enemy job: in flight", enemy_jobs.in_flight_query(1, month)),
+        ("match history: first page", match_history_query(1, 50)),
+        ("match history: next page", match_history_query(1, 50, encode_cursor(str(month), 100))),
+        ("match history: latest", match_history_query(1, 0)),
+        ("monthly run: claimable shards", matching_runs.claimable_shards_query(1, month)),
+        ("monthly run: stored pairing", matching_runs.pairs_query(1, 1, 5000)),
+        ("monthly run: user chunk", matching_runs.user_chunk_query(0, 5000, 1000)),
+        ("monthly run: stored best enemies", best_enemies.range_query(1, 5000)),
+        ("monthly run: unsent emails", matching_runs.unsent_matches_query(month, 0, 5000, 1000)),
+        ("monthly run: mark emails sent", matching_runs.mark_sent_statement([1, 2, 3], month)),
+    ]
+
+
+def query_plan(connection, statement):
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+    return [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def regressions(plan):
+    """Plan steps that read a whole table or sort outside an index"""
+    return [
+        detail for detail in plan
+        if (detail.startswith("SCAN ") and "CONSTANT ROW" not in detail) or "TEMP B-TREE" in detail
+    ]
+
+
+@pytest.mark.parametrize("name,statement", hot_queries(), ids=[name for name, _ in hot_queries()])
+def test_hot_query_uses_an_index(db, name, statement):
+    plan = query_plan(db.connection(), statement)
+    assert not regressions(plan), plan
@@ -0,0 +1,21 @@
+"""Conditional GET /api/questions/: If-None-Match is compared weakly"""
+import pytest
+from tests.factories import add_questions
+
+
+@pytest.mark.parametrize("if_none_match,expected", [
+    ("{etag}", 304),
+    ("W/{etag}", 304),
+    ('"questions-999-all", W/{etag}', 304),
+    ('"a,b",{etag}', 304),
+    ("*", 304),
+    ('"questions-999-active", W/"questions-999-all"', 200),
+    ("{stale}", 200),
+])
+def test_if_none_match(client, db, if_none_match, expected):
+    add_questions(db, 2)
+    etag = client.get("/api/questions/").headers["ETag"]
+    stale = etag.replace("-active", "-all")
+    response = client.get("/api/questions/", headers={"If-None-Match": if_none_match.format(etag=etag, stale=stale)})
+    assert response.status_code == expected
+    assert response.headers["ETag"] == etag
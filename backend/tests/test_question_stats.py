@@ -0,0 +1,51 @@
+"""
+The per-question answer counters against a recount of the answers table,
+after writes through every answer route, some of them concurrent.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func, select
+from sqlalchemy.dialects import mysql
+from app.models import Answer, QuestionAnswerCount
+from app.routers.answers import previous_values_query
+from tests.factories import add_questions, add_user, auth_headers
+
+
+def counters(db):
+    rows = db.execute(
+        select(QuestionAnswerCount.question_id, QuestionAnswerCount.answer_value, QuestionAnswerCount.count)
+        .where(QuestionAnswerCount.count != 0)
+    )
+    return {(question_id, value): count for question_id, value, count in rows}
+
+
+def recount(db):
+    rows = db.execute(select(Answer.question_id, Answer.answer_value, func.count()).group_by(Answer.question_id, Answer.answer_value))
+    return {(question_id, value): count for question_id, value, count in rows}
+
+
+def test_previous_values_are_read_under_a_row_lock():
+    sql = str(previous_values_query(1, [1, 2]).compile(dialect=mysql.dialect()))
+    assert sql.endswith("FOR UPDATE")
+
+
+def test_counters_match_the_answers_after_concurrent_writes(client, db):
+    q1, q2, q3 = add_questions(db, 3)
+    alice = add_user(db, "alice")
+    headers = auth_headers(alice)
+
+    def survey(value):
+        answers = [{"question_id": question_id, "answer_value": value} for question_id in (q1, q2)]
+        return client.post("/api/answers/survey", json={"answers": answers}, headers=headers).status_code
+
+    def single(value):
+        return client.post("/api/answers/", json={"question_id": q3, "answer_value": value}, headers=headers).status_code
+
+    with ThreadPoolExecutor(4) as pool:
+        statuses = list(pool.map(lambda value: survey(value) if value % 2 else single(value), range(1, 11)))
+    assert set(statuses) == {201}
+
+    answer_id = db.scalar(select(Answer.id).where(Answer.user_id == alice, Answer.question_id == q1))
+    assert client.put(f"/api/answers/{answer_id}", json={"answer_value": 4}).status_code == 200
+    db.expire_all()
+    assert counters(db) == recount(db)
+    assert sum(counters(db).values()) == 3
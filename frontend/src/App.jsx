@@ -482,16 +482,18 @@ function SurveyView({ setError, setSuccess }) {
 
 function MatchesView({ setError }) {
   const [matches, setMatches] = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
   const [loading, setLoading] = useState(true)
 
   useEffect(() => {
     fetchMatches()
   }, [])
 
-  const fetchMatches = async () => {
+  const fetchMatches = async (cursor = null) => {
     try {
-      const matchesData = await matchesAPI.getUserMatches()
-      setMatches(matchesData)
+      const page = await matchesAPI.getUserMatches(cursor)
+      setMatches(cursor ? [...matches, ...page.matches] : page.matches)
+      setNextCursor(page.next_cursor)
       setLoading(false)
     } catch (err) {
       setError('Failed to load matches')
@@ -521,6 +523,11 @@ function MatchesView({ setError }) {
               <p><strong>Matched:</strong> {new Date(match.matched_at).toLocaleDateString()}</p>
             </div>
           ))}
+          {nextCursor && (
+            <button className="btn btn-secondary" onClick={() => fetchMatches(nextCursor)}>
+              Load older matches
+            </button>
+          )}
         </div>
       )}
     </div>
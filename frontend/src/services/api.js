@@ -115,8 +115,8 @@ export const answersAPI = {
 
 // Matches API
 export const matchesAPI = {
-  getUserMatches: async () => {
-    const response = await api.get('/matches/user')
+  getUserMatches: async (cursor = null) => {
+    const response = await api.get('/matches/user', { params: cursor ? { cursor } : {} })
     return response.data
   },
   